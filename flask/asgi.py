@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from dotenv import load_dotenv
+
+# Before importing the engine, which reads FAL_KEY at import time
+load_dotenv()
+
+from engine.aio import AsyncInferenceEngine
+from engine.core import InferenceEngine
+from engine.crypto import CryptoManager
+from engine.generation_cache import generation_cache_from_env
+from engine.hedging import hedger_from_env
+from engine.idempotency import idempotency_store_from_env
+from engine.image_store import image_store_from_env
+from engine.logs import logging_from_env, request_context
+from engine.precompute import precompute_from_env
+from engine.quota import client_of, quota_manager_from_env
+from engine.scheduler import scheduler_from_env
+from engine.runtime import ModelRuntime
+
+# ==============================================================================
+# ASGI variant of index.py: same routes and encrypted API, but async handlers.
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000
+#
+# Optional settings:
+#   ASGI_REMOTE_ONLY=1   skip loading local models (fal.ai endpoints only)
+#   ASGI_CPU_WORKERS     threads for decode/mask/encode/crypto (default: min(8, cores))
+#   ASGI_MAX_REMOTE      concurrent fal.ai generations (default: 256)
+#   ASGI_MAX_MODEL       queued or running local model requests (default: 64)
+#
+# Local generations are cancelled when their client disconnects.
+# ==============================================================================
+
+# Seconds between client disconnect checks while a handler runs
+DISCONNECT_POLL = 0.25
+
+# Setup Secret Key
+SHARED_SECRET_KEY = os.getenv("SHARED_SECRET_KEY")
+if not SHARED_SECRET_KEY:
+    print("❌ Error: SHARED_SECRET_KEY not found in .env")
+    sys.exit(1)
+
+crypto = CryptoManager(SHARED_SECRET_KEY)
+logging_from_env()
+
+# ==============================================================================
+# MODELS
+# ==============================================================================
+runtime = ModelRuntime(
+    placement="offload",
+    birefnet_backend=os.getenv("BIREFNET_BACKEND", "torch"),
+    birefnet_onnx_int8=os.getenv("BIREFNET_ONNX_INT8", "0") == "1",
+)
+remote_only = os.getenv("ASGI_REMOTE_ONLY", "0") == "1"
+if not remote_only:
+    runtime.load()
+engine = AsyncInferenceEngine(
+    InferenceEngine(
+        runtime,
+        artifact_dir=".",
+        image_store=image_store_from_env(),
+        precompute=None if remote_only else precompute_from_env(),
+        idempotency=idempotency_store_from_env(),
+        generations=generation_cache_from_env(),
+        hedger=hedger_from_env(),
+        scheduler=scheduler_from_env(),
+        quotas=quota_manager_from_env(),
+        admin_token=os.getenv("ADMIN_TOKEN"),
+    ),
+    cpu_workers=int(os.getenv("ASGI_CPU_WORKERS", "0")) or None,
+    max_model=int(os.getenv("ASGI_MAX_MODEL", "64")),
+    max_remote=int(os.getenv("ASGI_MAX_REMOTE", "256")),
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"])
+
+
+# ==============================================================================
+# SECURITY WRAPPER
+# ==============================================================================
+async def secure_request(request, handler):
+    """Decrypts input -> Runs Engine Handler -> Encrypts Output"""
+    # --- 1. INCOMING DECRYPTION ---
+    try:
+        incoming = await request.json()
+    except Exception:
+        incoming = None
+    if not isinstance(incoming, dict) or "data" not in incoming:
+        return JSONResponse(
+            {"error": "Invalid format. Expected {'data': 'encrypted_string'}"}, 400
+        )
+
+    try:
+        decrypted_json_str = await engine.run_cpu(crypto.decrypt, incoming["data"])
+        if decrypted_json_str is None:
+            return JSONResponse(
+                {"error": "Decryption failed (Check Key or Nonce)"}, 403
+            )
+        payload = json.loads(decrypted_json_str)
+    except Exception as e:
+        return JSONResponse({"error": f"Security Middleware Error: {str(e)}"}, 500)
+
+    # --- 2. EXECUTE ENGINE LOGIC ---
+    # The request id lets a disconnect cancel the run (see engine/cancel.py),
+    # quotas are per client (see engine/quota.py), identified by the server's
+    # view of the caller, never by the payload
+    if isinstance(payload, dict):
+        payload.setdefault("request_id", uuid.uuid4().hex)
+        payload["client_id"] = request.client.host if request.client else None
+    with request_context(handler.__name__, payload) as logged:
+        # The task runs in a copy of this context, with the request's log
+        task = asyncio.ensure_future(handler(payload))
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL)
+            if not task.done() and await request.is_disconnected():
+                engine.engine.cancellation.cancel(
+                    client_of(payload), payload["request_id"], "disconnect"
+                )
+                break
+        result, status_code = await task
+        logged.status = status_code
+
+    # --- 3. OUTGOING ENCRYPTION ---
+    try:
+        encrypted_response = await engine.run_cpu(crypto.encrypt, json.dumps(result))
+        return JSONResponse({"data": encrypted_response}, status_code)
+    except Exception as e:
+        return JSONResponse({"error": f"Response Encryption Error: {str(e)}"}, 500)
+
+
+# ==============================================================================
+# ROUTES
+# ==============================================================================
+
+
+@app.get("/")
+async def index():
+    return PlainTextResponse("Image Processing API is running.")
+
+
+@app.post("/images")
+async def upload_image(request: Request):
+    return await secure_request(request, engine.upload_image)
+
+
+@app.post("/stats")
+async def engine_stats(request: Request):
+    return await secure_request(request, engine.stats)
+
+
+@app.post("/cancel")
+async def cancel_request(request: Request):
+    return await secure_request(request, engine.cancel_request)
+
+
+@app.post("/admin/models")
+async def reload_models(request: Request):
+    return await secure_request(request, engine.reload_models)
+
+
+@app.post("/generate")
+async def generate_image(request: Request):
+    return await secure_request(request, engine.generate)
+
+
+@app.post("/inpainting")
+async def inpaint_image(request: Request):
+    return await secure_request(request, engine.inpaint)
+
+
+@app.post("/asset")
+async def remove_background(request: Request):
+    return await secure_request(request, engine.asset)
+
+
+@app.post("/describe")
+async def describe_image(request: Request):
+    return await secure_request(request, engine.describe)
+
+
+@app.post("/inpainting-api")
+async def inpainting_api_fal(request: Request):
+    return await secure_request(request, engine.inpaint_remote)
+
+
+@app.post("/sketch-api")
+async def sketch_api(request: Request):
+    return await secure_request(request, engine.sketch_remote)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    PORT = os.getenv("PORT")
+    if not PORT:
+        PORT = 5000
+    uvicorn.run(app, host="0.0.0.0", port=int(PORT))
@@ -0,0 +1,49 @@
+"""
+Runs the benchmark suites with their default arguments.
+
+Usage (from the flask directory):
+    python -m benchmarks [suite ...]
+
+Suites: asset_payload, canvas_delta, region_response, step_cache, text_to_image,
+birefnet_onnx, florence_tasks, inpaint_graph, remote_concurrency, hedging,
+engine (default: all).
+Suites whose models or exports are missing are reported and skipped.
+"""
+
+import sys
+import importlib
+import traceback
+
+SUITES = [
+    "asset_payload",
+    "canvas_delta",
+    "region_response",
+    "step_cache",
+    "text_to_image",
+    "birefnet_onnx",
+    "florence_tasks",
+    "inpaint_graph",
+    "remote_concurrency",
+    "hedging",
+    "engine",
+]
+
+
+def main(names):
+    for name in names or SUITES:
+        print(f"\n=== {name} ===")
+        module = importlib.import_module(f"benchmarks.{name}")
+        # Each suite parses its own arguments from sys.argv
+        sys.argv = [f"benchmarks.{name}"]
+        try:
+            if name == "asset_payload":
+                module.main([])
+            else:
+                module.main()
+        except Exception as e:
+            print(f"⚠️ {name} skipped: {e}")
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
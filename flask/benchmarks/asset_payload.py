@@ -0,0 +1,81 @@
+"""
+Compares /asset response formats: payload size and server-side encode time.
+
+Usage (from the flask directory):
+    python -m benchmarks.asset_payload [image.png] [mask.png]
+
+Without arguments a synthetic 2048x2048 image with an elliptical subject is used.
+"""
+
+import io
+import sys
+import json
+import time
+import base64
+import numpy as np
+from PIL import Image, ImageDraw
+
+from engine.mask_codec import MASK_FORMATS, encode_mask_response
+
+REPEATS = 5
+
+
+def synthetic_inputs(size=(2048, 2048)):
+    w, h = size
+    rng = np.random.default_rng(0)
+    # Smooth gradient plus noise compresses roughly like a photo
+    gradient = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 12, (h, w, 3))
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels)
+
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).ellipse((w * 0.25, h * 0.2, w * 0.7, h * 0.9), fill=255)
+    return image, mask
+
+
+def encode_full_cutout(image, mask):
+    # Same path as the default /asset response
+    cutout = image.copy()
+    cutout.putalpha(mask)
+    buffered = io.BytesIO()
+    cutout.save(buffered, format="PNG")
+    return {
+        "status": "success",
+        "image": base64.b64encode(buffered.getvalue()).decode("utf-8"),
+    }
+
+
+def encode(image, mask, fmt):
+    if fmt == "image":
+        return encode_full_cutout(image, mask)
+    return {"status": "success", **encode_mask_response(mask, fmt)}
+
+
+def wire_size(payload):
+    # AES-GCM adds 28 bytes (nonce + tag) before the outer base64
+    plain = len(json.dumps(payload).encode("utf-8"))
+    return plain, 4 * ((plain + 28 + 2) // 3)
+
+
+def main(argv):
+    if len(argv) >= 2:
+        image = Image.open(argv[0]).convert("RGB")
+        mask = Image.open(argv[1]).convert("L").resize(image.size)
+    else:
+        image, mask = synthetic_inputs()
+
+    print(f"Image: {image.size[0]}x{image.size[1]}")
+    print(f"{'format':<8} {'json bytes':>12} {'wire bytes':>12} {'encode ms':>10}")
+    for fmt in MASK_FORMATS:
+        timings = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            payload = encode(image, mask, fmt)
+            timings.append((time.perf_counter() - start) * 1000)
+        plain, wire = wire_size(payload)
+        print(f"{fmt:<8} {plain:>12,} {wire:>12,} {np.median(timings):>10.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
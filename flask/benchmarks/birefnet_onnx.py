@@ -0,0 +1,98 @@
+"""
+Accuracy and latency of the ONNX Runtime BiRefNet backend against eager PyTorch.
+
+Usage (from the flask directory, after exporting with engine/birefnet_onnx.py):
+    python -m benchmarks.birefnet_onnx [--images DIR] [--size 1024] [--int8]
+
+Accuracy is the IoU of the thresholded masks against the fp32 torch output.
+"""
+
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+
+from engine.birefnet_onnx import ONNX_DIR, OnnxBiRefNet, load_torch_birefnet
+from engine.segmentation import TorchBiRefNet, predict_probability
+
+REPEATS = 5
+
+
+def load_images(folder, count=4):
+    if folder:
+        paths = sorted(
+            p
+            for ext in ("png", "jpg", "jpeg")
+            for p in glob.glob(os.path.join(folder, f"*.{ext}"))
+        )
+        return [Image.open(p).convert("RGB") for p in paths]
+    # Random blobs on noise: only meaningful for latency and backend agreement
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 256, (768, 1024, 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def mask_iou(a, b, thresh=0.5):
+    a, b = a > thresh, b > thresh
+    union = np.logical_or(a, b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(a, b).sum() / union)
+
+
+def timed(backend, image, size):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        prob = predict_probability(backend, image, size)
+        timings.append((time.perf_counter() - start) * 1000)
+    return prob, float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=None)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--onnx-dir", default=ONNX_DIR)
+    args = parser.parse_args()
+
+    torch.set_num_threads(os.cpu_count() or 1)
+    reference = TorchBiRefNet(load_torch_birefnet(), "cpu")
+    candidates = [("onnx fp32", OnnxBiRefNet(args.onnx_dir))]
+    if args.int8:
+        candidates.append(("onnx int8", OnnxBiRefNet(args.onnx_dir, quantized=True)))
+
+    images = load_images(args.images)
+    results = {name: {"iou": [], "ms": []} for name, _ in candidates}
+    torch_ms = []
+
+    for image in images:
+        ref_prob, ms = timed(reference, image, args.size)
+        torch_ms.append(ms)
+        for name, backend in candidates:
+            prob, ms = timed(backend, image, args.size)
+            results[name]["iou"].append(mask_iou(ref_prob, prob))
+            results[name]["ms"].append(ms)
+
+    print(f"{len(images)} images at {args.size}px on CPU")
+    print(
+        f"{'backend':<12} {'median ms':>10} {'speedup':>8} {'mean IoU':>9} {'min IoU':>8}"
+    )
+    base = np.median(torch_ms)
+    print(f"{'torch fp32':<12} {base:>10.1f} {1.0:>8.2f} {'-':>9} {'-':>8}")
+    for name, stats in results.items():
+        ms = np.median(stats["ms"])
+        print(
+            f"{name:<12} {ms:>10.1f} {base / ms:>8.2f} "
+            f"{np.mean(stats['iou']):>9.4f} {np.min(stats['iou']):>8.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
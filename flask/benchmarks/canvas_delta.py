@@ -0,0 +1,117 @@
+"""
+Upload size and server-side preparation time of a delta inpainting round
+(engine/canvas.py) against resending the full drawn canvas.
+
+Usage (from the flask directory):
+    python -m benchmarks.canvas_delta [--size 2048 1536] [--max-dim 1024]
+
+The base canvas is registered once through the image store, as a client
+session would; each mode then sends only its per-round fields. Mask IoU is
+measured against the full-canvas difference mask.
+"""
+
+import io
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+import numpy as np
+from PIL import Image, ImageDraw
+
+from engine.core import InferenceEngine
+from engine.images import encode_image_to_base64
+
+REPEATS = 3
+STROKES = [
+    {"points": [[400, 300], [700, 500], [900, 450]], "width": 24, "color": "#e02020"},
+    {"points": [[1200, 900], [1300, 1100]], "width": 16, "color": "#2040e0"},
+    {"points": [[1500, 1000]], "width": 40, "color": "#20a040"},
+]
+TILE = 256
+
+
+def synthetic_base(size):
+    w, h = size
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 255, (h // 8, w // 8, 3), dtype=np.uint8)
+    return Image.fromarray(noise).resize(size, Image.BICUBIC)
+
+
+def client_render(base):
+    # What the client canvas looks like after drawing STROKES
+    drawn = base.copy()
+    draw = ImageDraw.Draw(drawn)
+    for stroke in STROKES:
+        points = [tuple(p) for p in stroke["points"]]
+        radius = stroke["width"] / 2
+        if len(points) > 1:
+            draw.line(
+                points, fill=stroke["color"], width=stroke["width"], joint="curve"
+            )
+        for px, py in (points[0], points[-1]):
+            draw.ellipse(
+                (px - radius, py - radius, px + radius, py + radius),
+                fill=stroke["color"],
+            )
+    return drawn
+
+
+def dirty_tiles(base, drawn):
+    # Client-side tile diff on a fixed grid
+    a, b = np.array(base), np.array(drawn)
+    tiles = []
+    for y in range(0, base.height, TILE):
+        for x in range(0, base.width, TILE):
+            if (a[y : y + TILE, x : x + TILE] != b[y : y + TILE, x : x + TILE]).any():
+                crop = drawn.crop(
+                    (x, y, min(x + TILE, base.width), min(y + TILE, base.height))
+                )
+                tiles.append({"x": x, "y": y, "image": encode_image_to_base64(crop)})
+    return tiles
+
+
+def iou(a, b):
+    a, b = np.array(a) > 0, np.array(b) > 0
+    return (a & b).sum() / max((a | b).sum(), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, nargs=2, default=[2048, 1536])
+    parser.add_argument("--max-dim", type=int, default=1024)
+    args = parser.parse_args()
+
+    base = synthetic_base(tuple(args.size))
+    drawn = client_render(base)
+    engine = InferenceEngine(runtime=None)
+    with redirect_stdout(io.StringIO()):
+        handle = engine.upload_image({"image": encode_image_to_base64(base)})[0][
+            "handle"
+        ]
+
+    modes = [
+        ("full", {"image": handle, "mask_image": encode_image_to_base64(drawn)}),
+        ("tiles", {"image": handle, "tiles": dirty_tiles(base, drawn)}),
+        ("strokes", {"image": handle, "strokes": STROKES}),
+    ]
+
+    print(f"Canvas {args.size[0]}x{args.size[1]}, working size <= {args.max_dim}")
+    print(f"{'mode':<8} {'upload bytes':>13} {'prepare ms':>11} {'mask IoU':>9}")
+    reference = None
+    for label, payload in modes:
+        timings = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                error, inputs = engine._canvas_inputs(payload, args.max_dim)
+            timings.append((time.perf_counter() - start) * 1000)
+        mask = inputs[2]
+        reference = reference or mask
+        size = len(json.dumps(payload).encode("utf-8"))
+        print(
+            f"{label:<8} {size:>13,} {np.median(timings):>11.1f} {iou(reference, mask):>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+End-to-end latency of the shared inference engine (engine/core.py), i.e. the
+exact code path behind both the Flask and the Modal endpoints, minus
+transport and encryption.
+
+Usage (from the flask directory):
+    python -m benchmarks.engine [--placement offload|device] [--repeats 3]
+
+Models that are not available locally are skipped.
+"""
+
+import time
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw
+
+from engine.core import InferenceEngine
+from engine.images import encode_image_to_base64
+from engine.runtime import ModelRuntime
+
+
+def synthetic_canvas(size=(768, 512)):
+    # Clean canvas plus a copy with a user stroke, as sent to /inpainting
+    w, h = size
+    gradient = np.linspace(40, 220, w, dtype=np.uint8)[None, :, None]
+    clean = Image.fromarray(np.repeat(np.repeat(gradient, h, axis=0), 3, axis=2))
+    drawn = clean.copy()
+    ImageDraw.Draw(drawn).ellipse((w * 0.3, h * 0.3, w * 0.6, h * 0.7), fill="red")
+    return encode_image_to_base64(clean), encode_image_to_base64(drawn)
+
+
+def cases(clean_b64, drawn_b64):
+    return [
+        ("asset fast", "asset", {"image": drawn_b64, "mode": "fast"}),
+        ("asset standard", "asset", {"image": drawn_b64}),
+        ("asset rle", "asset", {"image": drawn_b64, "format": "rle"}),
+        ("describe", "describe", {"image": drawn_b64}),
+        ("generate draft", "generate", {"quality": "draft", "seed": 0}),
+        ("generate standard", "generate", {"seed": 0}),
+        (
+            "inpaint draft",
+            "inpaint",
+            {"image": clean_b64, "mask_image": drawn_b64, "quality": "draft"},
+        ),
+        ("inpaint standard", "inpaint", {"image": clean_b64, "mask_image": drawn_b64}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--placement", default="offload", choices=["offload", "device"])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = InferenceEngine(ModelRuntime(placement=args.placement).load())
+    clean_b64, drawn_b64 = synthetic_canvas()
+
+    print(f"{'case':<18} {'status':>6} {'first ms':>10} {'median ms':>10}")
+    for label, method, payload in cases(clean_b64, drawn_b64):
+        handler = getattr(engine, method)
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            result, status = handler(payload)
+            timings.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                break
+        if status != 200:
+            print(
+                f"{label:<18} {'skip':>6}  {result.get('error') or result.get('message')}"
+            )
+            continue
+        print(
+            f"{label:<18} {status:>6} {timings[0]:>10.1f} {np.median(timings):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
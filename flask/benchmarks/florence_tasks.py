@@ -0,0 +1,88 @@
+"""
+Several Florence-2 tasks on one image: N separate /describe-style runs
+against one shared image encoding with the tasks decoded as a batch
+(engine/florence.py).
+
+Usage (from the flask directory):
+    python -m benchmarks.florence_tasks [--tasks "<OD>" ...] [--num-beams 3]
+
+Needs the quantized Florence-2 folder (see README).
+"""
+
+import time
+import argparse
+import numpy as np
+import torch
+
+from engine.florence import decode_tasks, encode_image, run_florence
+from engine.images import decode_base64_image
+from engine.runtime import ModelRuntime
+from benchmarks.engine import synthetic_canvas
+
+REPEATS = 3
+TASKS = ["<DETAILED_CAPTION>", "<OD>", "<OCR_WITH_REGION>"]
+
+
+def timed(fn):
+    timings = []
+    for _ in range(REPEATS):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        result = fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, np.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", nargs="+", default=TASKS)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--num-beams", type=int, default=1)
+    args = parser.parse_args()
+
+    runtime = ModelRuntime()
+    runtime.load_florence()
+    if not runtime.florence_ready:
+        raise RuntimeError(f"Florence-2 not available at {runtime.florence_path}")
+    model, processor, device = (
+        runtime.florence_model,
+        runtime.florence_processor,
+        runtime.device,
+    )
+    image = decode_base64_image(synthetic_canvas()[1])
+    settings = {"max_new_tokens": args.max_new_tokens, "num_beams": args.num_beams}
+
+    separate, separate_ms = timed(
+        lambda: [
+            run_florence(model, processor, image, task, device, **settings)
+            for task in args.tasks
+        ]
+    )
+    features, encode_ms = timed(lambda: encode_image(model, processor, image, device))
+    shared, shared_ms = timed(
+        lambda: decode_tasks(
+            model,
+            processor,
+            encode_image(model, processor, image, device),
+            args.tasks,
+            device,
+            **settings,
+        )
+    )
+
+    same = sum(a == b for a, b in zip(separate, shared))
+    print(f"{len(args.tasks)} tasks: {', '.join(args.tasks)}")
+    print(f"{'mode':<16} {'median ms':>10}")
+    print(f"{'separate':<16} {separate_ms:>10.1f}")
+    print(f"{'shared encoding':<16} {shared_ms:>10.1f}")
+    print(f"{'  (encode only)':<16} {encode_ms:>10.1f}")
+    print(
+        f"Speedup: {separate_ms / shared_ms:.2f}x, identical outputs: {same}/{len(args.tasks)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Tail latency and extra cost of hedged /sketch-api requests (engine/hedging.py)
+against a stand-in provider with long-tailed queue times.
+
+Usage (from the flask directory):
+    python -m benchmarks.hedging [--requests 100] [--threads 16]
+        [--latency 0.2] [--tail 0.1] [--tail-factor 6]
+
+Each generation takes --latency seconds (jittered by ±25%), and a --tail
+share of them --tail-factor times longer, on both sketch models. Each mode
+first warms the hedger's latency windows, then sends --requests requests
+from --threads clients (sync engine) or all at once (async engine).
+"""
+
+import time
+import random
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import remote
+from engine.aio import AsyncInferenceEngine
+from engine.core import InferenceEngine
+from engine.hedging import MIN_SAMPLES, Hedger
+
+from .remote_concurrency import RESULT_URL, install_stand_in
+
+
+class Provider:
+    """Queue-time stand-in; counts started and cancelled generations."""
+
+    def __init__(self, latency, tail, tail_factor, seed=0):
+        self.latency = latency
+        self.tail = tail
+        self.tail_factor = tail_factor
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = 0
+        self.cancelled = 0
+
+    def sample(self):
+        with self.lock:
+            self.started += 1
+            seconds = self.latency * self.random.uniform(0.75, 1.25)
+            if self.random.random() < self.tail:
+                seconds *= self.tail_factor
+        return seconds
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled += 1
+
+
+class Handle:
+    def __init__(self, provider):
+        self.provider = provider
+        self.seconds = provider.sample()
+        self.stopped = threading.Event()
+
+    def get(self):
+        if self.stopped.wait(self.seconds):
+            raise RuntimeError("Request was cancelled")
+        return {"images": [{"url": RESULT_URL}]}
+
+    def cancel(self):
+        self.provider.cancel()
+        self.stopped.set()
+
+
+class AsyncHandle:
+    def __init__(self, provider):
+        self.provider = provider
+        self.seconds = provider.sample()
+
+    async def get(self):
+        await asyncio.sleep(self.seconds)
+        return {"images": [{"url": RESULT_URL}]}
+
+    async def cancel(self):
+        self.provider.cancel()
+
+
+def install_provider(provider):
+    # Downloads come from remote_concurrency's stand-in, with no added latency
+    http = install_stand_in(0.0)
+
+    def start(model_id, arguments):
+        return Handle(provider)
+
+    def submit(model_id, arguments):
+        return start(model_id, arguments).get()
+
+    async def start_async(model_id, arguments):
+        return AsyncHandle(provider)
+
+    async def submit_async(model_id, arguments):
+        return await (await start_async(model_id, arguments)).get()
+
+    remote.start = start
+    remote.submit = submit
+    remote.start_async = start_async
+    remote.submit_async = submit_async
+    return http
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_sync(engine, payloads, threads):
+    def timed(payload):
+        start = time.perf_counter()
+        _, status = engine.sketch_remote(payload)
+        return time.perf_counter() - start, status
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(timed, payloads))
+
+
+async def run_async(engine, payloads):
+    async def timed(payload):
+        start = time.perf_counter()
+        _, status = await engine.sketch_remote(payload)
+        return time.perf_counter() - start, status
+
+    return await asyncio.gather(*(timed(p) for p in payloads))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tail", type=float, default=0.1)
+    parser.add_argument("--tail-factor", type=float, default=6.0)
+    args = parser.parse_args()
+
+    payloads = [{"prompt": f"sketch {i}", "option": 1} for i in range(args.requests)]
+    warmup = payloads[:MIN_SAMPLES]
+
+    print(
+        f"Provider latency {args.latency:.2f}s, {args.tail:.0%} of requests "
+        f"{args.tail_factor:g}x slower; {args.requests} requests"
+    )
+    print(
+        f"{'mode':>6} {'hedging':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+        f"{'ok':>5} {'hedged':>7} {'cancelled':>9} {'extra $':>8} {'extra %':>8}"
+    )
+    for mode in ("sync", "async"):
+        for enabled in (False, True):
+            provider = Provider(args.latency, args.tail, args.tail_factor)
+            http = install_provider(provider)
+            hedger = Hedger(enabled=enabled, max_workers=2 * args.threads)
+            engine = InferenceEngine(runtime=None, hedger=hedger)
+            if mode == "sync":
+                run_sync(engine, warmup, args.threads)
+                hedger.counters.update(calls=0, cost_usd=0.0)
+                results = run_sync(engine, payloads, args.threads)
+            else:
+                async_engine = AsyncInferenceEngine(engine, max_remote=args.requests)
+                async_engine.http = http
+
+                async def run():
+                    await run_async(async_engine, warmup)
+                    hedger.counters.update(calls=0, cost_usd=0.0)
+                    return await run_async(async_engine, payloads)
+
+                results = asyncio.run(run())
+                async_engine.cpu_executor.shutdown()
+                async_engine.model_executor.shutdown()
+
+            seconds = [s for s, _ in results]
+            ok = sum(status == 200 for _, status in results)
+            stats = hedger.stats()
+            share = stats["extra_cost_usd"] / max(stats["cost_usd"], 1e-9)
+            print(
+                f"{mode:>6} {'on' if enabled else 'off':>8} "
+                f"{percentile(seconds, 0.5) * 1000:>8.0f} "
+                f"{percentile(seconds, 0.9) * 1000:>8.0f} "
+                f"{percentile(seconds, 0.99) * 1000:>8.0f} "
+                f"{ok:>5} {stats['hedged']:>7} {provider.cancelled:>9} "
+                f"{stats['extra_cost_usd']:>8.3f} {share:>8.1%}"
+            )
+            hedger.pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
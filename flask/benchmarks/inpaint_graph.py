@@ -0,0 +1,99 @@
+"""
+Critical-path latency of a local /inpainting request with its independent
+stages run one after another (before) and overlapped (after, engine/core.py):
+the Florence-2 caption runs while the mask is computed, and artifacts are
+written in the background.
+
+Usage (from the flask directory):
+    python -m benchmarks.inpaint_graph [--size 2048 1536] [--caption-ms 400] [--sd-ms 1500]
+
+Canvas decoding, the difference mask and the artifact PNG writes are real.
+The caption and the diffusion run are stand-ins that hold for a fixed time
+without the GIL, like GPU work.
+"""
+
+import io
+import time
+import tempfile
+import argparse
+from concurrent.futures import Future
+from contextlib import redirect_stdout
+import numpy as np
+
+from engine.core import InferenceEngine
+from engine.images import encode_image_to_base64
+from benchmarks.canvas_delta import client_render, synthetic_base
+
+REPEATS = 5
+
+
+class InlineExecutor:
+    # Runs submitted work immediately, i.e. the sequential handler
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class StandInRuntime:
+    device = "cpu"
+    florence_ready = False
+
+    def __init__(self, sd_seconds):
+        self.sd_tiered = StandInPipeline(sd_seconds)
+
+
+class StandInPipeline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, endpoint, quality, image=None, **kwargs):
+        time.sleep(self.seconds)
+        return [image.copy()], {"quality": quality}
+
+
+class StandInEngine(InferenceEngine):
+    caption_seconds = 0.4
+
+    def _inpaint_caption(self, img_drawn, cancel=None):
+        time.sleep(self.caption_seconds)
+        return "a stand-in caption"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, nargs=2, default=[2048, 1536])
+    parser.add_argument("--caption-ms", type=float, default=400)
+    parser.add_argument("--sd-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    base = synthetic_base(tuple(args.size))
+    payload = {
+        "image": encode_image_to_base64(base),
+        "mask_image": encode_image_to_base64(client_render(base)),
+        "quality": "draft",
+    }
+
+    print(f"Canvas {args.size[0]}x{args.size[1]}, caption {args.caption_ms:.0f} ms")
+    print(f"{'handler':<12} {'median ms':>10} {'excl. SD ms':>12}")
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        for label, sequential in (("sequential", True), ("overlapped", False)):
+            engine = StandInEngine(
+                StandInRuntime(args.sd_ms / 1000), artifact_dir=artifact_dir
+            )
+            engine.caption_seconds = args.caption_ms / 1000
+            if sequential:
+                engine.workers = InlineExecutor()
+            timings = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    _, status = engine.inpaint(payload)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert status == 200
+            median = np.median(timings)
+            print(f"{label:<12} {median:>10.1f} {median - args.sd_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Full-image vs region-delta inpainting responses (engine/region.py): payload
+size, server encode time and client decode + composite time.
+
+Usage (from the flask directory):
+    python -m benchmarks.region_response [--size 2048 1536] [--max-dim 512]
+
+A fixed synthetic image stands in for the model output, so only the response
+path is measured. Edits of increasing size are drawn as strokes.
+"""
+
+import io
+import time
+import argparse
+from contextlib import redirect_stdout
+import numpy as np
+from PIL import Image
+
+from engine.core import InferenceEngine
+from engine.images import decode_base64_image, encode_image_to_base64
+from engine.region import composite_region, region_delta
+from benchmarks.canvas_delta import synthetic_base
+
+REPEATS = 5
+EDITS = {
+    "small": [{"points": [[300, 300], [380, 340]], "width": 20}],
+    "medium": [{"points": [[300, 300], [700, 650]], "width": 60}],
+    "large": [{"points": [[200, 200], [1800, 1300]], "width": 300}],
+}
+
+
+def timed(fn, *args):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, np.median(timings)
+
+
+def client_full(canvas, payload):
+    # The client scales the returned image to its canvas
+    return decode_base64_image(payload["image"]).resize(canvas.size, Image.LANCZOS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, nargs=2, default=[2048, 1536])
+    parser.add_argument("--max-dim", type=int, default=512)
+    args = parser.parse_args()
+
+    canvas = synthetic_base(tuple(args.size))
+    engine = InferenceEngine(runtime=None)
+    with redirect_stdout(io.StringIO()):
+        handle = engine.upload_image({"image": encode_image_to_base64(canvas)})[0][
+            "handle"
+        ]
+
+    print(f"Canvas {args.size[0]}x{args.size[1]}, working size <= {args.max_dim}")
+    print(
+        f"{'edit':<7} {'mode':<7} {'b64 bytes':>10} {'encode ms':>10} {'client ms':>10}"
+    )
+    for label, strokes in EDITS.items():
+        with redirect_stdout(io.StringIO()):
+            _, inputs = engine._canvas_inputs(
+                {"image": handle, "strokes": strokes}, args.max_dim
+            )
+        clean, _, mask, _, canvas_size = inputs
+        # Stand-in for the generated image at the working size
+        result = clean.transpose(Image.FLIP_LEFT_RIGHT)
+
+        full, full_ms = timed(lambda: {"image": encode_image_to_base64(result)})
+        _, full_client = timed(client_full, canvas, full)
+        region, region_ms = timed(region_delta, result, mask, canvas_size)
+        _, region_client = timed(composite_region, canvas, region)
+
+        region_bytes = len(region["image"]) + len(region["blend_mask"])
+        print(
+            f"{label:<7} {'image':<7} {len(full['image']):>10,} {full_ms:>10.1f} {full_client:>10.1f}"
+        )
+        print(
+            f"{label:<7} {'region':<7} {region_bytes:>10,} {region_ms:>10.1f} {region_client:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Throughput of the remote-provider endpoints under concurrent load: the sync
+engine on a thread pool (as behind Flask) vs the async engine (asgi.py).
+
+Usage (from the flask directory):
+    python -m benchmarks.remote_concurrency [--latency 1.0] [--threads 16]
+        [--concurrency 16 64 256]
+
+fal.ai is replaced by an in-process stand-in that sleeps for --latency
+seconds per generation (plus a tenth of that per download) and returns a
+small PNG, so only the server-side overhead and concurrency are measured.
+"""
+
+import io
+import time
+import asyncio
+import argparse
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from PIL import Image
+
+from engine import remote
+from engine.aio import AsyncInferenceEngine
+from engine.core import InferenceEngine
+
+RESULT_URL = "https://stand-in.local/result.png"
+
+
+def result_png(size=(256, 256)):
+    buffered = io.BytesIO()
+    Image.new("RGB", size, (90, 140, 200)).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def install_stand_in(latency):
+    # Patches the provider calls in engine/remote.py; the engines are unchanged
+    png = result_png()
+    result = {"images": [{"url": RESULT_URL}]}
+
+    def upload_image(img):
+        return RESULT_URL
+
+    async def upload_png_async(data):
+        return RESULT_URL
+
+    def submit(model_id, arguments):
+        time.sleep(latency)
+        return result
+
+    def download_image(url):
+        time.sleep(latency / 10)
+        return remote.open_image(png)
+
+    async def submit_async(model_id, arguments):
+        await asyncio.sleep(latency)
+        return result
+
+    async def download(request):
+        await asyncio.sleep(latency / 10)
+        return httpx.Response(200, content=png)
+
+    remote.FAL_AVAILABLE = True
+    remote.upload_image = upload_image
+    remote.upload_png_async = upload_png_async
+    remote.submit = submit
+    remote.download_image = download_image
+    remote.submit_async = submit_async
+    return httpx.AsyncClient(transport=httpx.MockTransport(download))
+
+
+def run_sync(engine, payloads, threads):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(engine.sketch_remote, payloads))
+
+
+async def run_async(engine, payloads):
+    return await asyncio.gather(*(engine.sketch_remote(p) for p in payloads))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+
+    engine = InferenceEngine(runtime=None)
+    http = install_stand_in(args.latency)
+
+    print(f"Provider latency {args.latency:.2f}s, sync pool of {args.threads} threads")
+    print(f"{'requests':>8} {'mode':>6} {'wall s':>8} {'req/s':>8} {'ok':>5}")
+    for n in args.concurrency:
+        payloads = [{"prompt": f"sketch {i}", "option": 1} for i in range(n)]
+
+        start = time.perf_counter()
+        # The engine logs every request; keep the table readable
+        with redirect_stdout(io.StringIO()):
+            results = run_sync(engine, payloads, args.threads)
+        wall = time.perf_counter() - start
+        ok = sum(status == 200 for _, status in results)
+        print(f"{n:>8} {'sync':>6} {wall:>8.2f} {n / wall:>8.1f} {ok:>5}")
+
+        async_engine = AsyncInferenceEngine(engine, max_remote=max(args.concurrency))
+        async_engine.http = http
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            results = asyncio.run(run_async(async_engine, payloads))
+        wall = time.perf_counter() - start
+        ok = sum(status == 200 for _, status in results)
+        print(f"{n:>8} {'async':>6} {wall:>8.2f} {n / wall:>8.1f} {ok:>5}")
+        async_engine.cpu_executor.shutdown()
+        async_engine.model_executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
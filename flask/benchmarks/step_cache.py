@@ -0,0 +1,167 @@
+"""
+Speedup and image similarity of DeepCache-style step caching (engine/step_cache.py).
+
+Usage (from the flask directory):
+    python -m benchmarks.step_cache [--steps 50] [--intervals 2 3 5] [--unet DIR]
+
+By default a small random-weight SD-1.x-shaped inpainting UNet (9 input
+channels) and VAE run on CPU, so only relative numbers are meaningful. Pass
+--unet ./local_inpainting_model to measure the real UNet (random VAE decoder
+is still used for the similarity metric). Prompt embeddings are derived
+deterministically from a fixed prompt set, so runs are reproducible.
+"""
+
+import time
+import zlib
+import argparse
+from contextlib import nullcontext
+import numpy as np
+import torch
+import torch.nn.functional as F
+from diffusers import AutoencoderKL, PNDMScheduler, UNet2DConditionModel
+
+from engine.step_cache import DEFAULT_DEPTH, StepCache
+
+PROMPTS = [
+    "a river running through a lush green valley",
+    "a red sports car parked on a city street at night",
+    "a bowl of fruit on a wooden table, soft light",
+    "a portrait of an astronaut, studio lighting",
+]
+
+
+def tiny_unet():
+    return UNet2DConditionModel(
+        sample_size=32,
+        in_channels=9,
+        out_channels=4,
+        layers_per_block=2,
+        block_out_channels=(32, 64, 128, 128),
+        down_block_types=(
+            "CrossAttnDownBlock2D",
+            "CrossAttnDownBlock2D",
+            "CrossAttnDownBlock2D",
+            "DownBlock2D",
+        ),
+        up_block_types=(
+            "UpBlock2D",
+            "CrossAttnUpBlock2D",
+            "CrossAttnUpBlock2D",
+            "CrossAttnUpBlock2D",
+        ),
+        cross_attention_dim=64,
+        attention_head_dim=8,
+    )
+
+
+def tiny_vae():
+    return AutoencoderKL(
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D"] * 4,
+        up_block_types=["UpDecoderBlock2D"] * 4,
+        block_out_channels=[32, 32, 64, 64],
+        latent_channels=4,
+    )
+
+
+def prompt_embeddings(prompt, dim, tokens=77):
+    generator = torch.Generator().manual_seed(zlib.crc32(prompt.encode("utf-8")))
+    return torch.randn(1, tokens, dim, generator=generator)
+
+
+def denoise(unet, scheduler, prompt, size, steps, interval=None):
+    # Mirrors the inpainting loop: latents + mask + masked-image latents
+    generator = torch.Generator().manual_seed(0)
+    latents = torch.randn(1, 4, size, size, generator=generator)
+    mask = torch.zeros(1, 1, size, size)
+    mask[..., size // 4 : 3 * size // 4, size // 4 : 3 * size // 4] = 1
+    masked = torch.randn(1, 4, size, size, generator=generator)
+    text = prompt_embeddings(prompt, unet.config.cross_attention_dim)
+
+    scheduler.set_timesteps(steps)
+    latents = latents * scheduler.init_noise_sigma
+    cache = StepCache(unet, interval, DEFAULT_DEPTH) if interval else None
+
+    start = time.perf_counter()
+    with torch.no_grad(), cache or nullcontext():
+        for t in scheduler.timesteps:
+            model_input = scheduler.scale_model_input(latents, t)
+            model_input = torch.cat([model_input, mask, masked], dim=1)
+            noise = unet(model_input, t, encoder_hidden_states=text).sample
+            latents = scheduler.step(noise, t, latents).prev_sample
+    return latents, time.perf_counter() - start
+
+
+def decode(vae, latents):
+    with torch.no_grad():
+        image = vae.decode(latents / vae.config.scaling_factor).sample
+    return ((image.clamp(-1, 1) + 1) / 2).float()
+
+
+def psnr(a, b):
+    mse = F.mse_loss(a, b).item()
+    return float("inf") if mse == 0 else 10 * np.log10(1.0 / mse)
+
+
+def ssim(a, b, window=11, sigma=1.5):
+    # Gaussian-window SSIM over all channels, images in [0, 1]
+    coords = torch.arange(window, dtype=torch.float32) - window // 2
+    g = torch.exp(-(coords**2) / (2 * sigma**2))
+    g = (g / g.sum())[None, :]
+    kernel = (g.T @ g)[None, None].repeat(a.shape[1], 1, 1, 1)
+
+    def blur(x):
+        return F.conv2d(x, kernel, padding=window // 2, groups=a.shape[1])
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a**2
+    var_b = blur(b * b) - mu_b**2
+    cov = blur(a * b) - mu_a * mu_b
+    c1, c2 = 0.01**2, 0.03**2
+    score = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / (
+        (mu_a**2 + mu_b**2 + c1) * (var_a + var_b + c2)
+    )
+    return score.mean().item()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--intervals", type=int, nargs="+", default=[2, 3, 5])
+    parser.add_argument("--unet", default=None, help="Pipeline dir with a unet/")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    if args.unet:
+        unet = UNet2DConditionModel.from_pretrained(args.unet, subfolder="unet")
+    else:
+        unet = tiny_unet()
+    unet.eval()
+    vae = tiny_vae().eval()
+    scheduler = PNDMScheduler(skip_prk_steps=True)
+    size = unet.config.sample_size
+
+    print(f"{len(PROMPTS)} prompts, {args.steps} steps, latent {size}x{size}, CPU")
+    print(f"{'interval':>8} {'time s':>8} {'speedup':>8} {'PSNR dB':>8} {'SSIM':>6}")
+
+    baselines = [denoise(unet, scheduler, p, size, args.steps) for p in PROMPTS]
+    base_time = sum(t for _, t in baselines)
+    reference = [decode(vae, latents) for latents, _ in baselines]
+    print(f"{'off':>8} {base_time:>8.2f} {1.0:>8.2f} {'-':>8} {'-':>6}")
+
+    for interval in args.intervals:
+        runs = [
+            denoise(unet, scheduler, p, size, args.steps, interval) for p in PROMPTS
+        ]
+        total = sum(t for _, t in runs)
+        images = [decode(vae, latents) for latents, _ in runs]
+        print(
+            f"{interval:>8} {total:>8.2f} {base_time / total:>8.2f} "
+            f"{np.mean([psnr(a, b) for a, b in zip(reference, images)]):>8.2f} "
+            f"{np.mean([ssim(a, b) for a, b in zip(reference, images)]):>6.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+/generate before and after the text-to-image path (engine/text_to_image.py):
+the inpainting pipeline on a black canvas with a full mask, against the
+StableDiffusionPipeline sharing its modules. Reports latency, weight memory
+before/after building the second pipeline, peak CUDA memory, and how far
+the images of the same seed differ.
+
+Usage (from the flask directory):
+    python -m benchmarks.text_to_image [--model ./local_inpainting_model] [--quality draft]
+
+By default a small random-weight SD-1.x-shaped inpainting pipeline runs on
+CPU (prompts replaced by fixed embeddings), so only relative numbers are
+meaningful.
+"""
+
+import time
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from diffusers import PNDMScheduler, StableDiffusionInpaintPipeline
+
+from engine.diffusion import QUALITY_TIERS, TieredPipeline
+from benchmarks.step_cache import PROMPTS, prompt_embeddings, tiny_unet, tiny_vae
+
+REPEATS = 3
+
+
+def tiny_pipeline():
+    torch.manual_seed(0)
+    return StableDiffusionInpaintPipeline(
+        vae=tiny_vae(),
+        text_encoder=None,
+        tokenizer=None,
+        unet=tiny_unet(),
+        scheduler=PNDMScheduler(skip_prk_steps=True),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+
+
+def weight_bytes(*pipes):
+    # Distinct parameter storage across the pipelines' modules
+    seen = {}
+    for pipe in pipes:
+        for component in pipe.components.values():
+            if isinstance(component, torch.nn.Module):
+                for p in component.parameters():
+                    seen[p.data_ptr()] = p.numel() * p.element_size()
+    return sum(seen.values())
+
+
+def timed(fn):
+    timings = []
+    peak = 0
+    for _ in range(REPEATS):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        start = time.perf_counter()
+        image = fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            peak = max(peak, torch.cuda.max_memory_allocated())
+        timings.append((time.perf_counter() - start) * 1000)
+    return image, np.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", help="inpainting model folder (default: tiny)")
+    parser.add_argument("--quality", default="draft", choices=list(QUALITY_TIERS))
+    parser.add_argument("--size", type=int, default=None)
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if args.model:
+        pipe = StableDiffusionInpaintPipeline.from_pretrained(
+            args.model,
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+            use_safetensors=True,
+        ).to(device)
+        size = args.size or 512
+        prompt = {"prompt": PROMPTS[0]}
+    else:
+        pipe = tiny_pipeline().to(device)
+        size = args.size or 256
+        embeds = prompt_embeddings(PROMPTS[0], pipe.unet.config.cross_attention_dim)
+        prompt = {
+            "prompt_embeds": embeds,
+            "negative_prompt_embeds": torch.zeros_like(embeds),
+        }
+    pipe.set_progress_bar_config(disable=True)
+
+    weights_before = weight_bytes(pipe)
+    tiered = TieredPipeline(pipe)
+    tiered.text_pipe.set_progress_bar_config(disable=True)
+    weights_after = weight_bytes(pipe, tiered.text_pipe)
+
+    tier = QUALITY_TIERS[args.quality]
+
+    def inpaint_canvas():
+        # The former /generate: a black canvas under a full mask
+        pipe.scheduler = tiered.schedulers[tier["scheduler"]]
+        try:
+            return pipe(
+                **prompt,
+                image=Image.new("RGB", (size, size), (0, 0, 0)),
+                mask_image=Image.new("L", (size, size), 255),
+                height=size,
+                width=size,
+                num_inference_steps=tier["generate"],
+                generator=torch.Generator("cpu").manual_seed(0),
+            ).images[0]
+        finally:
+            pipe.scheduler = tiered.schedulers["default"]
+
+    def text_to_image():
+        return tiered(
+            "generate", args.quality, seed=0, height=size, width=size, **prompt
+        )[0][0]
+
+    before, before_ms, before_peak = timed(inpaint_canvas)
+    after, after_ms, after_peak = timed(text_to_image)
+    diff = np.abs(
+        np.asarray(before, dtype=np.float32) - np.asarray(after, dtype=np.float32)
+    )
+
+    mb = 1024**2
+    print(f"{size}x{size}, {args.quality} ({tier['generate']} steps), {device}")
+    print(f"{'path':<16} {'median ms':>10} {'peak CUDA MB':>13}")
+    print(f"{'inpaint canvas':<16} {before_ms:>10.1f} {before_peak / mb:>13.1f}")
+    print(f"{'text-to-image':<16} {after_ms:>10.1f} {after_peak / mb:>13.1f}")
+    print(
+        f"Weights: {weights_before / mb:.1f} MB before, "
+        f"{weights_after / mb:.1f} MB with both pipelines"
+    )
+    print(f"Speedup: {before_ms / after_ms:.2f}x")
+    print(
+        f"Same seed, mean abs pixel difference: {diff.mean():.2f} (max {diff.max():.0f})"
+    )
+
+
+if __name__ == "__main__":
+    main()
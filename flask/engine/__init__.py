@@ -0,0 +1,10 @@
+"""
+Shared inference engine used by both front-ends: the Flask server (index.py)
+and the Modal deployment (modal_app.py).
+
+    runtime.py - ModelRuntime, loads and owns the models
+    core.py    - InferenceEngine, request handling on top of a runtime
+
+The remaining modules are the building blocks (images, masks, diffusion,
+segmentation, Florence-2, fal.ai) and import without loading any model.
+"""
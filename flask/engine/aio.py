@@ -0,0 +1,212 @@
+import os
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+from . import remote
+from .logs import log, stage
+
+
+class AsyncInferenceEngine:
+    """
+    Asyncio front for InferenceEngine, used by the ASGI server (asgi.py).
+
+    The remote-provider endpoints await fal.ai uploads, polling and downloads
+    on the event loop, so waiting costs no thread. Blocking work goes to two
+    bounded pools:
+
+      cpu_executor   - decode, resize, masks, PNG encode/decode, crypto
+      model_executor - local model endpoints (SD, BiRefNet, Florence-2);
+                       one thread per request in flight, waiting in the
+                       engine's deadline scheduler (scheduler.py), which
+                       orders them. Beyond `max_model` requests in flight,
+                       new ones are answered 503 rather than queued in the
+                       pool, in arrival order, ahead of the scheduler
+    """
+
+    def __init__(self, engine, cpu_workers=None, max_model=64, max_remote=256):
+        self.engine = engine
+        self.cpu_executor = ThreadPoolExecutor(
+            max_workers=cpu_workers or min(8, os.cpu_count() or 1),
+            thread_name_prefix="cpu",
+        )
+        self.model_executor = ThreadPoolExecutor(
+            max_workers=max_model, thread_name_prefix="model"
+        )
+        # Released by the request's thread, so the pool always has one free
+        self.model_slots = threading.Semaphore(max_model)
+        # Caps in-flight fal.ai generations (and their decoded images in memory)
+        self.remote_slots = asyncio.Semaphore(max_remote)
+        self.http = None
+
+    # Executor calls run in the request's context (logs.py request id, stages)
+    async def run_cpu(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        run = contextvars.copy_context().run
+        return await loop.run_in_executor(self.cpu_executor, run, fn, *args)
+
+    async def _run_model(self, handler, data):
+        if not self.model_slots.acquire(blocking=False):
+            log.warning("model.queue_full", endpoint=handler.__name__)
+            return {"error": "Too many local model requests queued"}, 503
+
+        def call():
+            try:
+                return handler(data)
+            finally:
+                self.model_slots.release()
+
+        loop = asyncio.get_running_loop()
+        run = contextvars.copy_context().run
+        return await loop.run_in_executor(self.model_executor, run, call)
+
+    async def close(self):
+        if self.http:
+            await self.http.aclose()
+        self.cpu_executor.shutdown(wait=False)
+        self.model_executor.shutdown(wait=False)
+
+    async def upload_image(self, data):
+        return await self.run_cpu(self.engine.upload_image, data)
+
+    async def stats(self, data):
+        return self.engine.stats(data)
+
+    async def cancel_request(self, data):
+        return self.engine.cancel_request(data)
+
+    async def reload_models(self, data):
+        return self.engine.reload_models(data)
+
+    # ==========================================================================
+    # LOCAL MODELS
+    # ==========================================================================
+    async def generate(self, data):
+        return await self._run_model(self.engine.generate, data)
+
+    async def inpaint(self, data):
+        return await self._run_model(self.engine.inpaint, data)
+
+    async def asset(self, data):
+        return await self._run_model(self.engine.asset, data)
+
+    async def describe(self, data):
+        return await self._run_model(self.engine.describe, data)
+
+    # ==========================================================================
+    # REMOTE PROVIDERS (FAL.AI)
+    # ==========================================================================
+    async def _download(self, url, subdir=None, region=None):
+        if self.http is None:
+            self.http = httpx.AsyncClient(timeout=120)
+        with stage("download"):
+            content = await remote.download_async(self.http, url)
+            result_img = None
+            if content is not None:
+                result_img = await self.run_cpu(remote.open_image, content)
+        return await self.run_cpu(self.engine.finish_remote, result_img, subdir, region)
+
+    async def _download_all(self, urls):
+        if self.http is None:
+            self.http = httpx.AsyncClient(timeout=120)
+
+        async def fetch(url):
+            content = await remote.download_async(self.http, url)
+            if content is None:
+                return None
+            return await self.run_cpu(remote.open_image, content)
+
+        with stage("download"):
+            result_imgs = await asyncio.gather(*(fetch(url) for url in urls))
+        return await self.run_cpu(self.engine.finish_remote_images, result_imgs)
+
+    async def inpaint_remote(self, data):
+        return await self.engine.idempotency.run_async(
+            "inpaint_remote", data, self._inpaint_remote
+        )
+
+    async def sketch_remote(self, data):
+        return await self.engine.idempotency.run_async(
+            "sketch_remote", data, self._sketch_remote
+        )
+
+    async def _inpaint_remote(self, data):
+        limited = self.engine.rate_limited("inpaint_remote", data)
+        if limited:
+            return limited
+        if not remote.FAL_AVAILABLE:
+            return {"error": "Fal.ai client not installed or API Key missing"}, 500
+
+        try:
+            async with self.remote_slots:
+                error, inputs = await self.run_cpu(
+                    self.engine.prepare_inpaint_remote, data
+                )
+                if error:
+                    return error
+                prompt, img_clean, mask, region = inputs
+
+                with stage("upload"):
+                    clean_png = await self.run_cpu(remote.png_bytes, img_clean)
+                    mask_png = await self.run_cpu(remote.png_bytes, mask)
+                    image_url, mask_url = await asyncio.gather(
+                        remote.upload_png_async(clean_png),
+                        remote.upload_png_async(mask_png),
+                    )
+
+                with stage("fal"):
+                    result = await remote.submit_async(
+                        remote.INPAINT_MODEL,
+                        remote.inpaint_arguments(prompt, image_url, mask_url),
+                    )
+                log.debug("remote.response", response=result)
+
+                output_url = remote.first_image_url(result)
+                if not output_url:
+                    return self.engine.no_images_error(result)
+
+                return await self._download(output_url, "debug_fal", region)
+
+        except Exception as e:
+            log.exception("inpaint_remote.failed")
+            return {"status": "error", "message": str(e)}, 500
+
+    async def _sketch_remote(self, data):
+        limited = self.engine.rate_limited("sketch_remote", data)
+        if limited:
+            return limited
+        if not remote.FAL_AVAILABLE:
+            return {"error": "Fal.ai client not installed or API Key missing"}, 500
+
+        try:
+            async with self.remote_slots:
+                error, request = self.engine.prepare_sketch_remote(data)
+                if error:
+                    return error
+                model_id, arguments, count = request
+
+                alternate = remote.sketch_alternate(model_id, arguments)
+                # Variations are separate submissions, running concurrently
+                with stage("fal"):
+                    results = await asyncio.gather(
+                        *(
+                            self.engine.hedger.submit_async(
+                                (model_id, arguments), alternate
+                            )
+                            for _ in range(count)
+                        )
+                    )
+                log.debug("remote.response", responses=results)
+
+                image_urls = [remote.first_image_url(result) for result in results]
+                for result, image_url in zip(results, image_urls):
+                    if not image_url:
+                        return self.engine.no_images_error(result)
+
+                return await self._download_all(image_urls)
+
+        except Exception as e:
+            log.exception("sketch_remote.failed")
+            return {"status": "error", "message": str(e)}, 500
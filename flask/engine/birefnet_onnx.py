@@ -0,0 +1,150 @@
+"""
+ONNX Runtime CPU backend for BiRefNet.
+
+Export (from the flask directory, once per weights update):
+    python -m engine.birefnet_onnx --sizes 1024 512 --quantize
+
+Then select it for /asset with BIREFNET_BACKEND=onnx (and BIREFNET_ONNX_INT8=1
+for the quantized graphs) in .env.
+"""
+
+import os
+import glob
+import argparse
+import numpy as np
+import torch
+
+try:
+    import onnxruntime as ort
+
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+from .segmentation import BIREFNET_DIR, import_birefnet
+
+BIREFNET_WEIGHTS = os.path.join(BIREFNET_DIR, "birefnet_fp16.pt")
+ONNX_DIR = os.path.join(BIREFNET_DIR, "onnx")
+
+
+def onnx_path(out_dir, size, quantized=False):
+    suffix = "_int8" if quantized else ""
+    return os.path.join(out_dir, f"birefnet_{size}{suffix}.onnx")
+
+
+def load_torch_birefnet(weights=BIREFNET_WEIGHTS, device="cpu"):
+    """Loads the fp16 checkpoint as an fp32 eager model (export/reference use)."""
+    BiRefNet = import_birefnet(os.path.dirname(weights))
+    model = BiRefNet(bb_pretrained=False)
+    model.load_state_dict(torch.load(weights, map_location=device))
+    return model.float().to(device).eval()
+
+
+class _ProbabilityHead(torch.nn.Module):
+    # Keeps only the final prediction and folds the sigmoid into the graph
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        preds = self.model(x)
+        if isinstance(preds, (list, tuple)):
+            preds = preds[-1]
+        return preds.sigmoid()
+
+
+def export_onnx(model, path, size, opset=17):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dummy = torch.randn(1, 3, size, size)
+    with torch.no_grad():
+        torch.onnx.export(
+            _ProbabilityHead(model),
+            dummy,
+            path,
+            input_names=["input"],
+            output_names=["prob"],
+            dynamic_axes={"input": {0: "batch"}, "prob": {0: "batch"}},
+            opset_version=opset,
+            do_constant_folding=True,
+            dynamo=False,
+        )
+    print(f"✅ Exported {path}")
+
+
+def quantize_onnx(src, dst):
+    # Dynamic int8: weights quantized offline, activations scaled at runtime
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    print(f"✅ Quantized {dst}")
+
+
+class OnnxBiRefNet:
+    """
+    Holds one InferenceSession per exported input size. Sessions are created
+    and warmed up once at load time and reused for every request.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir=ONNX_DIR, quantized=False, threads=None):
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime is not installed")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+
+        self.sessions = {}
+        suffix = "_int8" if quantized else ""
+        for path in sorted(glob.glob(os.path.join(model_dir, "birefnet_*.onnx"))):
+            stem = os.path.basename(path)[len("birefnet_") : -len(".onnx")]
+            size, _, tag = stem.partition("_")
+            if not size.isdigit() or (f"_{tag}" if tag else "") != suffix:
+                continue
+            self.sessions[int(size)] = ort.InferenceSession(
+                path, options, providers=["CPUExecutionProvider"]
+            )
+
+        if not self.sessions:
+            raise FileNotFoundError(
+                f"No {'int8 ' if quantized else ''}BiRefNet ONNX graphs in {model_dir}"
+            )
+        self.warmup()
+
+    @property
+    def sizes(self):
+        return sorted(self.sessions)
+
+    def warmup(self):
+        for size, session in self.sessions.items():
+            session.run(None, {"input": np.zeros((1, 3, size, size), np.float32)})
+
+    def predict(self, batch, size):
+        session = self.sessions.get(size)
+        if session is None:
+            raise ValueError(f"No ONNX graph exported for {size}px input")
+        if isinstance(batch, torch.Tensor):
+            batch = batch.numpy()
+        prob = session.run(None, {"input": batch.astype(np.float32, copy=False)})[0]
+        return prob[:, 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export BiRefNet to ONNX")
+    parser.add_argument("--weights", default=BIREFNET_WEIGHTS)
+    parser.add_argument("--out", default=ONNX_DIR)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 512])
+    parser.add_argument("--quantize", action="store_true", help="Also write int8")
+    args = parser.parse_args()
+
+    model = load_torch_birefnet(args.weights)
+    for size in args.sizes:
+        path = onnx_path(args.out, size)
+        export_onnx(model, path, size)
+        if args.quantize:
+            quantize_onnx(path, onnx_path(args.out, size, quantized=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from .quota import client_of
+
+# Cancellation of local generation requests. A request may carry:
+#   "request_id" - client-chosen id, used by /cancel from the same client (the
+#                  ASGI server assigns one when missing, to cancel on client
+#                  disconnect)
+#   "deadline"   - seconds from arrival after which the result is useless
+# The diffusion step callback checks the request's token and aborts the run
+# within one step.
+
+# Cancels may arrive before the request itself started running
+MAX_EARLY_CANCELS = 1024
+
+
+class Cancelled(BaseException):
+    """
+    Raised at a checkpoint of a cancelled request. A BaseException, like
+    asyncio.CancelledError, so the handlers' generic error paths let it
+    through to the cancellable() wrapper.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    def __init__(self, request_id=None, deadline=None, client=None):
+        self.request_id = request_id
+        self.client = client
+        # time.monotonic() value, or None
+        self.deadline = deadline
+        self.cancel_reason = None
+
+    def cancel(self, reason="cancelled"):
+        self.cancel_reason = self.cancel_reason or reason
+
+    @property
+    def reason(self):
+        if self.cancel_reason:
+            return self.cancel_reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline"
+        return None
+
+    def check(self):
+        reason = self.reason
+        if reason:
+            raise Cancelled(reason)
+
+
+class CancelRegistry:
+    """Tokens of the running requests, by (client id, request id)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        # (client id, request id) -> reason, for cancels of requests not
+        # started yet
+        self.early = OrderedDict()
+        self.counters = {"cancelled": 0, "disconnect": 0, "deadline": 0}
+
+    def open(self, data):
+        deadline = data.get("deadline")
+        if deadline is not None:
+            deadline = float(deadline)
+            # JSON allows NaN and Infinity, which no clock reaches
+            if not math.isfinite(deadline):
+                raise ValueError(f"Invalid deadline: {deadline}")
+            deadline = time.monotonic() + deadline
+        token = CancelToken(data.get("request_id"), deadline, client_of(data))
+        if token.request_id:
+            key = (token.client, token.request_id)
+            with self.lock:
+                reason = self.early.pop(key, None)
+                if reason:
+                    token.cancel(reason)
+                self.running[key] = token
+        return token
+
+    def close(self, token, reason=None):
+        if token.request_id:
+            key = (token.client, token.request_id)
+            with self.lock:
+                if self.running.get(key) is token:
+                    del self.running[key]
+        if reason:
+            with self.lock:
+                self.counters[reason] = self.counters.get(reason, 0) + 1
+
+    def cancel(self, client, request_id, reason="cancelled"):
+        """
+        Cancels a running request of `client`, or the request once it
+        arrives. Raises PermissionError if only other clients run
+        `request_id`.
+        """
+        with self.lock:
+            token = self.running.get((client, request_id))
+            if token is None:
+                if any(running == request_id for _, running in self.running):
+                    raise PermissionError(f"{request_id} is another client's")
+                self.early[(client, request_id)] = reason
+                while len(self.early) > MAX_EARLY_CANCELS:
+                    self.early.popitem(last=False)
+                return False
+        token.cancel(reason)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "running": len(self.running)}
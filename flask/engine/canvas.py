@@ -0,0 +1,88 @@
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+from .images import changed_pixels, decode_base64_image
+
+# Delta canvas inputs for /inpainting and /inpainting-api. Instead of the full
+# drawn canvas ("mask_image") the client sends, relative to the clean "image"
+# (usually an /images handle registered once per session):
+#
+#   "tiles":   [{"x": 512, "y": 256, "image": "<base64>"}, ...]
+#              changed rectangles of the drawn canvas, pasted onto the base
+#   "strokes": [{"points": [[x, y], ...], "width": 12, "color": "#ff0000"}, ...]
+#              brush strokes, rasterized server-side
+#
+# Coordinates are in base image pixels. Only the tiles / strokes are diffed
+# or rasterized, so the whole-image difference is skipped.
+MAX_TILES = 256
+MAX_STROKES = 1024
+
+
+class CanvasError(ValueError):
+    pass
+
+
+def parse_color(value):
+    try:
+        if isinstance(value, str):
+            return ImageColor.getrgb(value)[:3]
+        r, g, b = (int(c) for c in value[:3])
+        return r, g, b
+    except (TypeError, ValueError):
+        raise CanvasError(f"Invalid stroke color: {value}")
+
+
+def apply_tiles(base, tiles, size):
+    """
+    Pastes changed tiles onto the full-size base canvas. Returns the drawn
+    canvas and the changed-pixel map, both resized to `size`.
+    """
+    if not isinstance(tiles, list) or len(tiles) > MAX_TILES:
+        raise CanvasError(f"'tiles' must be a list of at most {MAX_TILES} tiles")
+
+    drawn = base.copy()
+    changed = np.zeros((base.height, base.width), dtype=bool)
+    for tile in tiles:
+        x, y = int(tile["x"]), int(tile["y"])
+        img = decode_base64_image(tile["image"])
+        box = (x, y, x + img.width, y + img.height)
+        if x < 0 or y < 0 or box[2] > base.width or box[3] > base.height:
+            raise CanvasError(f"Tile at ({x}, {y}) lies outside the canvas")
+        changed[y : box[3], x : box[2]] |= changed_pixels(base.crop(box), img)
+        drawn.paste(img, (x, y))
+
+    # A working pixel counts as changed if any source pixel under it changed
+    changed_small = Image.fromarray(changed.astype(np.uint8) * 255).resize(
+        size, Image.BOX
+    )
+    return drawn.resize(size), np.array(changed_small) > 0
+
+
+def draw_strokes(clean, strokes, scale):
+    """
+    Rasterizes strokes onto the (already resized) clean canvas. `scale` is
+    the (x, y) factor from base image to `clean` coordinates. Returns the
+    drawn canvas and the changed-pixel map.
+    """
+    if not isinstance(strokes, list) or len(strokes) > MAX_STROKES:
+        raise CanvasError(f"'strokes' must be a list of at most {MAX_STROKES} strokes")
+
+    drawn = clean.copy()
+    stroke_mask = Image.new("L", clean.size, 0)
+    draw, draw_mask = ImageDraw.Draw(drawn), ImageDraw.Draw(stroke_mask)
+    for stroke in strokes:
+        points = [(x * scale[0], y * scale[1]) for x, y in stroke["points"]]
+        if not points:
+            continue
+        width = max(1, round(stroke.get("width", 10) * min(scale)))
+        color = parse_color(stroke.get("color", "#000000"))
+        radius = width / 2
+        for target, fill in ((draw, color), (draw_mask, 255)):
+            if len(points) > 1:
+                target.line(points, fill=fill, width=width, joint="curve")
+            # Round caps
+            for px, py in (points[0], points[-1]):
+                target.ellipse(
+                    (px - radius, py - radius, px + radius, py + radius), fill=fill
+                )
+    return drawn, np.array(stroke_mask) > 0
@@ -0,0 +1,1015 @@
+import os
+import time
+import contextvars
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from . import remote
+from .cache import LRUCache
+from .cancel import CancelRegistry, Cancelled
+from .diffusion import QUALITY_TIERS
+from .florence import CAPTION_TASK, Interrupt, caption, decode_tasks, encode_image
+from .florence import postprocess_answer, preprocess_size
+from .generation_cache import GenerationCache, generation_key
+from .hedging import Hedger
+from .hotswap import ModelSwapper
+from .idempotency import IdempotencyStore
+from .canvas import CanvasError, apply_tiles, draw_strokes
+from .image_store import ImageStore, ImageTooLarge, is_handle
+from .images import difference_mask, encode_image_to_base64, image_digest
+from .images import decode_base64_image, finish_mask, resize_to_limit
+from .logs import dropped_records, log, record_stage, stage
+from .mask_codec import MASK_FORMATS, encode_mask_response
+from .quota import QuotaManager, client_of
+from .region import RESPONSE_MODES, region_delta
+from .scheduler import Scheduler
+from .segmentation import BIREFNET_MODES, BIREFNET_MODE_SIZES, resolve_mode
+from .segmentation import probability_to_mask, run_birefnet
+from .step_cache import parse_step_cache
+
+DEFAULT_PROMPT = "The image shows a river running through a lush green valley surrounded by trees, plants, grass, and poles. In the background, the sky is filled with clouds, creating a peaceful atmosphere."
+NEGATIVE_PROMPT = (
+    "blurry, low quality, ugly, text, watermark, bad anatomy, deformed, noisy"
+)
+# Florence-2 tasks per /describe call (see _describe_texts)
+MAX_DESCRIBE_TASKS = 8
+# Variations per /generate or /sketch-api call
+MAX_IMAGES = 4
+# /generate output size and classifier-free guidance (the pipeline default)
+GENERATE_SIZE = 512
+GENERATE_GUIDANCE = 7.5
+# Threads waiting on fal.ai for /sketch-api variations and downloads
+REMOTE_WORKERS = 32
+
+
+def has_delta(data):
+    return bool(data.get("tiles") or data.get("strokes"))
+
+
+def parse_num_images(data):
+    # "num_images" field, returns (error response or None, count)
+    count = data.get("num_images", 1)
+    if isinstance(count, bool) or not isinstance(count, int):
+        count = None
+    if count is None or not 1 <= count <= MAX_IMAGES:
+        return ({"error": f"'num_images' must be 1 to {MAX_IMAGES}"}, 400), 1
+    return None, count
+
+
+def seed_error(data):
+    # "seed" field, returns an error response or None
+    seed = data.get("seed")
+    try:
+        if seed is not None:
+            int(seed)
+    except (TypeError, ValueError):
+        return {"error": "'seed' must be an integer"}, 400
+    return None
+
+
+def validated(check):
+    # Requests with invalid fields (`check(data)` returns an error response)
+    # are answered before they are metered or queued for a model
+    def decorate(handler):
+        @wraps(handler)
+        def wrapped(self, data):
+            return check(data) or handler(self, data)
+
+        return wrapped
+
+    return decorate
+
+
+def idempotent(handler):
+    # Retries with the same "idempotency_key" share one run (see idempotency.py)
+    @wraps(handler)
+    def wrapped(self, data):
+        return self.idempotency.run(
+            handler.__name__, data, lambda data: handler(self, data)
+        )
+
+    return wrapped
+
+
+def seed_cached(handler):
+    # Seeded /generate responses are served from the generation cache
+    @wraps(handler)
+    def wrapped(self, data):
+        key = self._generation_key(data)
+        if key is not None:
+            response = self.generations.get(key)
+            if response is not None and self._drafts_alive(response):
+                return {**response, "cached": True}, 200
+        return handler(self, data)
+
+    return wrapped
+
+
+def seed_stored(handler):
+    # Stores seeded /generate responses for seed_cached(). Applied inside
+    # scheduled(): model swaps wait for the slot (see hotswap.py), so the key
+    # names the weights that actually ran the request
+    @wraps(handler)
+    def wrapped(self, data, cancel):
+        key = self._generation_key(data)
+        response, status = handler(self, data, cancel)
+        if key is not None and status == 200:
+            self.generations.put(key, response)
+        return response, status
+
+    return wrapped
+
+
+def cancellable(handler):
+    # Passes the request's CancelToken (see cancel.py) as a third argument
+    @wraps(handler)
+    def wrapped(self, data):
+        try:
+            token = self.cancellation.open(data)
+        except (TypeError, ValueError):
+            return {"error": "Invalid deadline, expected seconds"}, 400
+        reason = None
+        try:
+            return handler(self, data, token)
+        except Cancelled as e:
+            reason = e.reason
+            log.info("request.cancelled", reason=reason)
+            status = 504 if reason == "deadline" else 499
+            return {"status": "cancelled", "reason": reason}, status
+        finally:
+            self.cancellation.close(token, reason)
+
+    return wrapped
+
+
+def scheduled(handler):
+    # Local model work is admitted earliest deadline first (see scheduler.py)
+    @wraps(handler)
+    def wrapped(self, data, cancel):
+        service = handler.__name__
+        variant = data.get("quality") or data.get("mode")
+        if variant in QUALITY_TIERS or variant in BIREFNET_MODES:
+            service = f"{service}:{variant}"
+        _, count = parse_num_images(data)
+        if count > 1:
+            service = f"{service}x{count}"
+        client = client_of(data)
+        weight = self.quotas.weight(client)
+        queued = time.perf_counter()
+        with self.scheduler.slot(service, cancel, client, weight):
+            record_stage("queue", time.perf_counter() - queued)
+            return handler(self, data, cancel)
+
+    return wrapped
+
+
+def metered(handler):
+    # Charges the request to its client's token bucket (see quota.py)
+    @wraps(handler)
+    def wrapped(self, data):
+        return self.rate_limited(handler.__name__, data) or handler(self, data)
+
+    return wrapped
+
+
+def foreground(handler):
+    # Local model endpoints preempt background precomputation (precompute.py)
+    @wraps(handler)
+    def wrapped(self, data):
+        with self.precompute.foreground() if self.precompute else nullcontext():
+            return handler(self, data)
+
+    return wrapped
+
+
+class InferenceEngine:
+    """
+    Request logic shared by the Flask server (index.py) and Modal (modal_app.py).
+    Every handler takes the decrypted JSON payload and returns
+    (response dict, HTTP status); the front-ends only handle transport and
+    encryption. Image fields accept inline base64 or an /images handle.
+
+    Model outputs for handles (captions, masks) are kept in
+    `results`, which the optional `precompute` queue fills ahead of time.
+    """
+
+    def __init__(
+        self,
+        runtime,
+        artifact_dir=None,
+        describe_max_new_tokens=128,
+        describe_num_beams=1,
+        image_store=None,
+        result_cache_bytes=256 * 1024**2,
+        florence_cache_bytes=128 * 1024**2,
+        precompute=None,
+        idempotency=None,
+        generations=None,
+        hedger=None,
+        scheduler=None,
+        quotas=None,
+        admin_token=None,
+    ):
+        self.runtime = runtime
+        self.image_store = image_store or ImageStore()
+        self.idempotency = idempotency or IdempotencyStore()
+        # Seeded /generate responses (see generation_cache.py)
+        self.generations = generations or GenerationCache()
+        # Hedges slow /sketch-api submissions (see hedging.py), off by default
+        self.hedger = hedger or Hedger()
+        self.cancellation = CancelRegistry()
+        self.scheduler = scheduler or Scheduler()
+        self.quotas = quotas or QuotaManager()
+        # Replaces model weights without a restart (see hotswap.py)
+        self.swapper = ModelSwapper(self, admin_token)
+        self.results = LRUCache(result_cache_bytes)
+        # Request sub-tasks that overlap the main thread (caption, artifact writes)
+        self.workers = ThreadPoolExecutor(max_workers=4, thread_name_prefix="engine")
+        # Blocking fal.ai calls and downloads, which wait for the provider and
+        # would otherwise hold the short-task workers above
+        self.remote_workers = ThreadPoolExecutor(
+            max_workers=REMOTE_WORKERS, thread_name_prefix="remote"
+        )
+        # Florence-2 image features by pixel content (see _florence_features)
+        self.florence_features = LRUCache(florence_cache_bytes)
+        # When set, inputs/outputs of generation requests are saved for inspection
+        self.artifact_dir = artifact_dir
+        self.describe_max_new_tokens = describe_max_new_tokens
+        self.describe_num_beams = describe_num_beams
+        self.precompute = precompute
+        if precompute:
+            precompute.attach(self)
+
+    def _save_artifacts(self, subdir, **images):
+        # PNG encoding and disk writes stay off the request's critical path
+        if self.artifact_dir:
+            self.workers.submit(self._write_artifacts, subdir, int(time.time()), images)
+
+    def _write_artifacts(self, subdir, timestamp, images):
+        try:
+            save_dir = os.path.join(self.artifact_dir, subdir)
+            os.makedirs(save_dir, exist_ok=True)
+            for name, img in images.items():
+                img.save(os.path.join(save_dir, f"{name}_{timestamp}.png"))
+        except Exception as e:
+            log.warning("artifacts.failed", subdir=subdir, error=str(e))
+
+    def _generation_key(self, data):
+        # Cache key of a seeded /generate request, None if it is not cacheable
+        runtime = self.runtime
+        seed = data.get("seed")
+        quality = data.get("quality", "standard")
+        if seed is None or data.get("refine") or not runtime.sd_tiered:
+            return None
+        error, count = parse_num_images(data)
+        if error or quality not in QUALITY_TIERS:
+            return None
+        try:
+            seed = int(seed)
+            step_cache = parse_step_cache(data.get("step_cache"))
+        except (TypeError, ValueError):
+            return None
+        tier = QUALITY_TIERS[quality]
+        return generation_key(
+            weights=runtime.sd_weights,
+            # fp16 on CUDA, fp32 on CPU
+            device=runtime.device,
+            pipeline="text_to_image",
+            prompt=data.get("prompt", DEFAULT_PROMPT),
+            negative_prompt=None,
+            seed=seed,
+            scheduler=tier["scheduler"],
+            steps=tier["generate"],
+            guidance_scale=GENERATE_GUIDANCE,
+            size=GENERATE_SIZE,
+            num_images=count,
+            step_cache=step_cache,
+        )
+
+    def _drafts_alive(self, response):
+        # A cached draft response is only useful while its drafts can be refined
+        draft_ids = response.get("draft_ids") or [response.get("draft_id")]
+        return all(
+            self.runtime.sd_tiered.draft(draft_id) for draft_id in draft_ids if draft_id
+        )
+
+    def _quality_error(self, quality, refine):
+        # Validates the "quality" / "refine" fields of /generate and /inpainting
+        if quality not in QUALITY_TIERS:
+            tiers = ", ".join(QUALITY_TIERS)
+            return {"error": f"Invalid quality. Use one of: {tiers}"}, 400
+        if refine and not self.runtime.sd_tiered.draft(refine):
+            return {"error": "Unknown or expired draft"}, 404
+        return None
+
+    def _load_images(self, data, *fields):
+        """
+        Resolves image fields holding either inline base64 or an /images
+        handle. Returns (error response or None, [images]).
+        """
+        images = []
+        for field in fields:
+            value = data.get(field)
+            if is_handle(value):
+                image = self.image_store.get(value)
+                if image is None:
+                    return (
+                        {"error": f"Unknown or expired image handle: {value}"},
+                        404,
+                    ), None
+            else:
+                image = decode_base64_image(value)
+            images.append(image)
+        return None, images
+
+    def _canvas_inputs(self, data, max_dim, on_drawn=None):
+        """
+        Clean canvas, drawn canvas and mask at the working size (at most
+        `max_dim`). The drawn state is either the full "mask_image" or a delta
+        on "image": changed "tiles" or "strokes" (see canvas.py). Returns
+        (error response or None, (clean, drawn, mask, changed pixels,
+        canvas size)). `on_drawn(drawn)` is called as soon as the drawn
+        canvas is ready, before the mask is computed; a full "mask_image" is
+        passed as uploaded, so its Florence-2 features are shared with
+        /describe calls on the same image.
+        """
+        tiles, strokes = data.get("tiles"), data.get("strokes")
+        error, images = self._load_images(data, "image")
+        if error:
+            return error, None
+        base = images[0]
+        # Resize maintaining Aspect Ratio, cached per handle across rounds
+        img_clean = None
+        if is_handle(data["image"]):
+            img_clean = self.image_store.derive(
+                data["image"],
+                f"fit{max_dim}",
+                lambda image: resize_to_limit(image, max_dim=max_dim),
+            )
+        if img_clean is None:
+            img_clean = resize_to_limit(base, max_dim=max_dim)
+
+        if not tiles and not strokes:
+            error, images = self._load_images(data, "mask_image")
+            if error:
+                return error, None
+            if on_drawn:
+                on_drawn(images[0])
+            img_drawn = images[0].resize(img_clean.size)
+            log.debug("canvas.difference_mask", size=img_clean.size)
+            mask, white_pixels = difference_mask(img_clean, img_drawn)
+            return None, (img_clean, img_drawn, mask, white_pixels, base.size)
+
+        try:
+            if tiles:
+                log.debug("canvas.tiles", tiles=len(tiles), size=img_clean.size)
+                img_drawn, changed = apply_tiles(base, tiles, img_clean.size)
+            else:
+                log.debug("canvas.strokes", strokes=len(strokes), size=img_clean.size)
+                scale = (img_clean.width / base.width, img_clean.height / base.height)
+                img_drawn, changed = draw_strokes(img_clean, strokes, scale)
+        except (CanvasError, KeyError, TypeError, ValueError) as e:
+            return ({"error": f"Invalid canvas delta: {e}"}, 400), None
+        if on_drawn:
+            on_drawn(img_drawn)
+        mask = finish_mask(changed)
+        return None, (img_clean, img_drawn, mask, int(changed.sum()), base.size)
+
+    def _response_mode_error(self, data):
+        if data.get("response", "image") not in RESPONSE_MODES:
+            modes = ", ".join(RESPONSE_MODES)
+            return {"error": f"Invalid response. Use one of: {modes}"}, 400
+        return None
+
+    def _result_payload(self, image, region=None):
+        """
+        The generated image, or with `region` = (mask, canvas size) only the
+        changed region for the client to composite (see region.py).
+        """
+        with stage("encode"):
+            if region:
+                return {"status": "success", **region_delta(image, *region)}
+            return {"status": "success", "image": encode_image_to_base64(image)}
+
+    def _images_payload(self, images):
+        # Several variations also keep "image" (the first) for older clients
+        with stage("encode"):
+            encoded = list(self.workers.map(encode_image_to_base64, images))
+        if len(encoded) == 1:
+            return {"status": "success", "image": encoded[0]}
+        return {"status": "success", "image": encoded[0], "images": encoded}
+
+    def _result_key(self, handle, model, *detail):
+        # Per-handle result of the current weights of `model` (see hotswap.py)
+        return (handle, model, self.runtime.versions[model], *detail)
+
+    def _florence_features(self, image):
+        # Vision encoder output, shared by every endpoint captioning the same pixels
+        processor = self.runtime.florence_processor
+        key = (
+            image_digest(image),
+            self.runtime.versions["florence"],
+            preprocess_size(processor),
+        )
+        features = self.florence_features.get(key)
+        if features is None:
+            features = encode_image(
+                self.runtime.florence_model, processor, image, self.runtime.device
+            )
+            self.florence_features.put(key, features)
+        return features
+
+    def _inpaint_caption(self, img_drawn, cancel=None):
+        # Florence-2 context for the inpainting prompt, "" if unavailable
+        if not self.runtime.florence_ready:
+            return ""
+        try:
+            with stage("caption"):
+                generated_prompt = caption(
+                    self.runtime.florence_model,
+                    self.runtime.florence_processor,
+                    self._florence_features(img_drawn),
+                    self.runtime.device,
+                    stopping_criteria=[Interrupt(cancel.check)] if cancel else None,
+                )
+            log.debug("caption.done", caption=generated_prompt)
+            return generated_prompt
+        except Exception as e:
+            log.warning("caption.failed", error=str(e))
+            return ""
+
+    def _describe_texts(self, image, tasks, handle=None, **generate_kwargs):
+        """
+        Raw Florence-2 output of each task with the /describe settings,
+        cached per handle. Uncached tasks are decoded as one batch from the
+        (cached) image features.
+        """
+        runtime = self.runtime
+        settings = {
+            "max_new_tokens": self.describe_max_new_tokens,
+            "num_beams": self.describe_num_beams,
+            **generate_kwargs,
+        }
+        texts = {}
+        for task in tasks:
+            key = self._result_key(handle, "florence", task)
+            text = self.results.get(key) if handle else None
+            if text is not None:
+                texts[task] = text
+        missing = [task for task in dict.fromkeys(tasks) if task not in texts]
+
+        if missing:
+            with stage("florence"):
+                decoded = decode_tasks(
+                    runtime.florence_model,
+                    runtime.florence_processor,
+                    self._florence_features(image),
+                    missing,
+                    runtime.device,
+                    **settings,
+                )
+            texts.update(zip(missing, decoded))
+        if handle:
+            for task in missing:
+                self.results.put(
+                    self._result_key(handle, "florence", task), texts[task]
+                )
+        return [texts[task] for task in tasks]
+
+    def _describe_text(self, image, task, handle=None, **generate_kwargs):
+        return self._describe_texts(image, [task], handle, **generate_kwargs)[0]
+
+    def _subject_mask(self, image, mode, handle=None):
+        # BiRefNet subject mask at the image size, cached per handle
+        key = self._result_key(handle, "birefnet", mode) if handle else None
+        mask = self.results.get(key) if key else None
+        if mask is None:
+            log.debug("asset.mask", mode=mode)
+            with stage("birefnet"):
+                mask = run_birefnet(self.runtime.birefnet, image, mode)
+            mask = probability_to_mask(mask)
+            if key:
+                self.results.put(key, mask)
+        return mask
+
+    # ==========================================================================
+    # IMAGE HANDLES
+    # ==========================================================================
+    def upload_image(self, data):
+        try:
+            image_b64 = data.get("image")
+            if not image_b64:
+                return {"error": "No image provided"}, 400
+
+            handle, image, deduplicated = self.image_store.put(image_b64)
+            log.debug("images.stored", handle=handle[:19], deduplicated=deduplicated)
+            if self.precompute:
+                self.precompute.submit(handle)
+            return {
+                "status": "success",
+                "handle": handle,
+                "size": [image.width, image.height],
+                "deduplicated": deduplicated,
+                "expires_in": self.image_store.ttl,
+            }, 200
+        except ImageTooLarge as e:
+            return {"error": str(e)}, 413
+        except Exception as e:
+            log.exception("images.failed")
+            return {"status": "error", "message": str(e)}, 500
+
+    def stats(self, data=None):
+        # Cache and background queue metrics, served by /stats
+        sd_tiered = self.runtime.sd_tiered
+        return {
+            "status": "success",
+            "image_store": self.image_store.stats(),
+            "idempotency": self.idempotency.stats(),
+            "generation_cache": self.generations.stats(),
+            "hedging": self.hedger.stats(),
+            "cancellation": self.cancellation.stats(),
+            "scheduler": self.scheduler.stats(),
+            "quotas": self.quotas.stats(),
+            "models": self.swapper.stats(),
+            "result_cache": self.results.stats(),
+            "florence_features": self.florence_features.stats(),
+            "latent_cache": sd_tiered.latents.stats() if sd_tiered else None,
+            "precompute": self.precompute.stats() if self.precompute else None,
+            "log_records_dropped": dropped_records(),
+        }, 200
+
+    def rate_limited(self, endpoint, data):
+        """429 response if the client is over its quota, else None."""
+        client = client_of(data)
+        _, count = parse_num_images(data)
+        admitted, retry_after = self.quotas.take(client, endpoint, count)
+        if admitted:
+            return None
+        log.warning("quota.limited", client=client, endpoint=endpoint)
+        return {
+            "error": "Rate limit exceeded",
+            "retry_after": None if retry_after is None else round(retry_after, 1),
+        }, 429
+
+    def reload_models(self, data):
+        """
+        Admin: loads new weights for {"models": {"sd" | "birefnet" |
+        "florence": path or None}} in the background and switches to them
+        between requests. Progress is reported by /stats.
+        """
+        return self.swapper.start(data)
+
+    def cancel_request(self, data):
+        """
+        Cancels a queued or running local model request of the caller by its
+        "request_id".
+        """
+        request_id = data.get("request_id")
+        if not request_id:
+            return {"error": "Missing request_id"}, 400
+        try:
+            running = self.cancellation.cancel(client_of(data), str(request_id))
+        except PermissionError:
+            log.warning("cancel.rejected", target=request_id)
+            return {"error": "Request belongs to another client"}, 403
+        log.info("cancel.requested", target=request_id, running=running)
+        return {"status": "success", "running": running}, 200
+
+    def precompute_task(self, handle, task):
+        """Computes one precompute.py task for a stored image, unless cached."""
+        runtime = self.runtime
+        if task == "caption" and runtime.florence_ready:
+            if self._result_key(handle, "florence", CAPTION_TASK) not in self.results:
+                image = self.image_store.get(handle)
+                if image is not None:
+                    self._describe_text(
+                        image,
+                        CAPTION_TASK,
+                        handle,
+                        stopping_criteria=[Interrupt(self.precompute.check)],
+                    )
+        elif task == "mask" and runtime.birefnet:
+            if self._result_key(handle, "birefnet", "standard") not in self.results:
+                image = self.image_store.get(handle)
+                if image is not None:
+                    self._subject_mask(image, "standard", handle)
+
+    # ==========================================================================
+    # LOCAL MODELS
+    # ==========================================================================
+    @idempotent
+    @seed_cached
+    @validated(seed_error)
+    @metered
+    @foreground
+    @cancellable
+    @scheduled
+    @seed_stored
+    def generate(self, data, cancel):
+        sd_tiered = self.runtime.sd_tiered
+        if not sd_tiered:
+            return {"error": "SD Model not loaded"}, 500
+        try:
+            prompt = data.get("prompt", DEFAULT_PROMPT)
+            quality = data.get("quality", "standard")
+            refine = data.get("refine")
+            error = self._quality_error(quality, refine)
+            if error:
+                return error
+            error, count = parse_num_images(data)
+            if error:
+                return error
+            if refine and count > 1:
+                return {"error": "A draft is refined into a single image"}, 400
+            try:
+                step_cache = parse_step_cache(data.get("step_cache"))
+            except ValueError as e:
+                return {"error": str(e)}, 400
+
+            if refine:
+                log.debug("generate.refine", draft_id=refine, quality=quality)
+                images, info = sd_tiered(
+                    "generate", quality, refine=refine, cancel=cancel
+                )
+            else:
+                log.debug("generate.start", quality=quality, count=count, prompt=prompt)
+                images, info = sd_tiered(
+                    "generate",
+                    quality,
+                    cancel=cancel,
+                    num_images=count,
+                    seed=data.get("seed"),
+                    step_cache=step_cache,
+                    prompt=prompt,
+                    height=GENERATE_SIZE,
+                    width=GENERATE_SIZE,
+                    guidance_scale=GENERATE_GUIDANCE,
+                )
+            return {**self._images_payload(images), **info}, 200
+        except Exception as e:
+            return {"status": "error", "message": str(e)}, 500
+
+    @idempotent
+    @validated(seed_error)
+    @metered
+    @foreground
+    @cancellable
+    @scheduled
+    def inpaint(self, data, cancel):
+        sd_tiered = self.runtime.sd_tiered
+        if not sd_tiered:
+            return {"error": "SD Model not loaded"}, 500
+        try:
+            user_prompt = data.get("prompt", "")
+            clean_b64 = data.get("image")
+            drawn_b64 = data.get("mask_image")
+            quality = data.get("quality", "standard")
+            refine = data.get("refine")
+            error = self._quality_error(quality, refine)
+            if error:
+                return error
+            error = self._response_mode_error(data)
+            if error:
+                return error
+            try:
+                step_cache = parse_step_cache(data.get("step_cache"))
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            as_region = data.get("response") == "region"
+
+            if refine:
+                # The draft already holds the prompt, mask and latents
+                log.debug("inpaint.refine", draft_id=refine, quality=quality)
+                context = sd_tiered.draft(refine)["context"]
+                images, info = sd_tiered(
+                    "inpainting", quality, refine=refine, cancel=cancel
+                )
+                image = images[0]
+                region = None
+                if as_region and context:
+                    region = (context["mask"], context["canvas_size"])
+                return {**self._result_payload(image, region), **info}, 200
+
+            if not clean_b64 or not (drawn_b64 or has_delta(data)):
+                return {"error": "Missing image or mask"}, 400
+
+            # The caption only needs the drawn canvas: it runs on the GPU
+            # while the mask is computed here, then SD waits for both
+            captioning = []
+
+            def start_caption(img_drawn):
+                captioning.append(
+                    # In the request's context, so its stage timing is recorded
+                    self.workers.submit(
+                        contextvars.copy_context().run,
+                        self._inpaint_caption,
+                        img_drawn,
+                        cancel,
+                    )
+                )
+
+            # Max 512 for Local SD
+            with stage("canvas"):
+                error, inputs = self._canvas_inputs(
+                    data, max_dim=512, on_drawn=start_caption
+                )
+            if error:
+                return error
+            img_clean, img_drawn, mask_image, _, canvas_size = inputs
+            self._save_artifacts(
+                "input_data",
+                clean=img_clean,
+                drawn=img_drawn,
+                generated_mask=mask_image,
+            )
+
+            with stage("caption_wait"):
+                generated_prompt = captioning[0].result()
+            final_prompt = f"{generated_prompt} {user_prompt}".strip()
+            log.debug("inpaint.start", quality=quality, prompt=final_prompt)
+            images, info = sd_tiered(
+                "inpainting",
+                quality,
+                cancel=cancel,
+                seed=data.get("seed"),
+                step_cache=step_cache,
+                prompt=final_prompt,
+                negative_prompt=NEGATIVE_PROMPT,
+                image=img_drawn,
+                mask_image=mask_image,
+                strength=0.85,
+                guidance_scale=8.5,
+                # Lets a refine of this draft answer with a region too
+                context={"mask": mask_image, "canvas_size": canvas_size},
+            )
+            image = images[0]
+            self._save_artifacts("input_data", result=image)
+
+            region = (mask_image, canvas_size) if as_region else None
+            return {**self._result_payload(image, region), **info}, 200
+
+        except Exception as e:
+            log.exception("inpaint.failed")
+            return {"status": "error", "message": str(e)}, 500
+
+    @metered
+    @foreground
+    @cancellable
+    @scheduled
+    def asset(self, data, cancel):
+        backend = self.runtime.birefnet
+        if not backend:
+            return {"error": "BiRefNet not loaded"}, 500
+        try:
+            image_b64 = data.get("image")
+            # "image" returns the full RGBA cutout, the others only the subject mask
+            output_format = data.get("format", "image")
+            # Latency/quality trade-off: "fast" (512px), "standard" (1024px), "tiled"
+            mode = data.get("mode", "standard")
+            if not image_b64:
+                return {"error": "No image provided"}, 400
+            if output_format not in MASK_FORMATS:
+                formats = ", ".join(MASK_FORMATS)
+                return {"error": f"Invalid format. Use one of: {formats}"}, 400
+            if mode not in BIREFNET_MODES:
+                modes = ", ".join(BIREFNET_MODES)
+                return {"error": f"Invalid mode. Use one of: {modes}"}, 400
+            resolved = resolve_mode(backend, mode)
+            if resolved is None:
+                return {
+                    "error": f"Mode '{mode}' is not available with the "
+                    f"{backend.name} backend (no {BIREFNET_MODE_SIZES[mode]}px graph)"
+                }, 400
+            if resolved != mode:
+                log.info("asset.mode_fallback", mode=mode, used=resolved)
+                mode = resolved
+
+            error, images = self._load_images(data, "image")
+            if error:
+                return error
+            original_image = images[0]
+            handle = image_b64 if is_handle(image_b64) else None
+            mask_pil = self._subject_mask(original_image, mode, handle)
+
+            if output_format != "image":
+                result = encode_mask_response(mask_pil, output_format)
+                return {"status": "success", **result}, 200
+
+            # Stored images are shared between requests, never modify them
+            cutout = original_image.copy()
+            cutout.putalpha(mask_pil)
+            return {
+                "status": "success",
+                "image": encode_image_to_base64(cutout),
+            }, 200
+        except Exception as e:
+            log.exception("asset.failed")
+            return {"status": "error", "message": str(e)}, 500
+
+    @metered
+    @foreground
+    @cancellable
+    @scheduled
+    def describe(self, data, cancel):
+        if not self.runtime.florence_ready:
+            return {"error": "Florence-2 not loaded"}, 500
+        try:
+            image_b64 = data.get("image")
+            # One task, or a list of tasks answered from a single image encoding
+            prompt_type = data.get("prompt", "<DETAILED_CAPTION>")
+            tasks = prompt_type if isinstance(prompt_type, list) else [prompt_type]
+
+            if not image_b64:
+                return {"error": "No image provided"}, 400
+            if not tasks or len(tasks) > MAX_DESCRIBE_TASKS:
+                return {
+                    "error": f"'prompt' must list 1 to {MAX_DESCRIBE_TASKS} tasks"
+                }, 400
+            if not all(isinstance(task, str) for task in tasks):
+                return {"error": "Tasks must be strings"}, 400
+
+            error, images = self._load_images(data, "image")
+            if error:
+                return error
+            image = images[0]
+            log.debug("describe.start", tasks=tasks)
+
+            processor = self.runtime.florence_processor
+            handle = image_b64 if is_handle(image_b64) else None
+            generated = self._describe_texts(
+                image, tasks, handle, stopping_criteria=[Interrupt(cancel.check)]
+            )
+            answers = {
+                task: postprocess_answer(processor, text, task, image)
+                for task, text in zip(tasks, generated)
+            }
+            log.debug("describe.done", answers=answers)
+
+            if isinstance(prompt_type, list):
+                return {"status": "success", "output": answers}, 200
+            return {"status": "success", "output": answers[prompt_type]}, 200
+
+        except Exception as e:
+            log.exception("describe.failed")
+            return {"status": "error", "message": str(e)}, 500
+
+    # ==========================================================================
+    # REMOTE PROVIDERS (FAL.AI)
+    # ==========================================================================
+    # Each remote endpoint is split into CPU-bound stages (prepare / finish)
+    # around the provider round-trip, so the async server (engine/aio.py) can
+    # await the I/O and offload only the CPU work.
+    def prepare_inpaint_remote(self, data):
+        """
+        Returns (error response or None, (prompt, clean image, mask, region)),
+        region being the _result_payload argument.
+        """
+        clean_b64 = data.get("image")
+        drawn_b64 = data.get("mask_image")
+        prompt = data.get("prompt", DEFAULT_PROMPT)
+
+        if not clean_b64 or not (drawn_b64 or has_delta(data)):
+            return (
+                {"error": "Missing 'image' (clean) or 'mask_image' (drawn)"},
+                400,
+            ), None
+
+        error = self._response_mode_error(data)
+        if error:
+            return error, None
+
+        log.debug("inpaint_remote.start", prompt=prompt)
+
+        # Max 1024 for Flux
+        with stage("canvas"):
+            error, inputs = self._canvas_inputs(data, max_dim=1024)
+        if error:
+            return error, None
+        img_clean, _, mask, white_pixels, canvas_size = inputs
+        if white_pixels < 10:
+            log.warning("inpaint_remote.empty_mask", changed_pixels=white_pixels)
+
+        self._save_artifacts("debug_fal", fal_clean=img_clean, fal_mask=mask)
+        region = (mask, canvas_size) if data.get("response") == "region" else None
+        return None, (prompt, img_clean, mask, region)
+
+    def prepare_sketch_remote(self, data):
+        """
+        Returns (error response or None, (model id, arguments, number of
+        submissions)).
+        """
+        prompt = data.get("prompt")
+        option = data.get("option", 1)
+
+        if not prompt:
+            return ({"error": "Missing prompt"}, 400), None
+        error, count = parse_num_images(data)
+        if error:
+            return error, None
+        if int(option) not in remote.SKETCH_MODELS:
+            return (
+                {"error": "Invalid option. Use 1 for Nano Banana, 2 for Flux Dev."},
+                400,
+            ), None
+
+        # --- ENFORCE SHARPNESS IN PROMPT ---
+        enhanced_prompt = (
+            f"{prompt}, sharp focus, high definition, 4k, vector art, crisp lines"
+        )
+        label, model_id, arguments = remote.SKETCH_MODELS[int(option)]
+        log.debug("sketch_remote.start", model=label, count=count, prompt=prompt)
+        return None, (model_id, {**arguments, "prompt": enhanced_prompt}, count)
+
+    def finish_remote(self, result_img, subdir=None, region=None):
+        if result_img is None:
+            return {"status": "error", "message": "Failed to download Fal output"}, 500
+        if subdir:
+            self._save_artifacts(subdir, fal_result=result_img)
+        return self._result_payload(result_img, region), 200
+
+    def finish_remote_images(self, result_imgs):
+        if any(img is None for img in result_imgs):
+            return {"status": "error", "message": "Failed to download Fal output"}, 500
+        return self._images_payload(result_imgs), 200
+
+    def no_images_error(self, result):
+        log.warning("remote.no_images")
+        return {
+            "status": "error",
+            "message": "Fal.ai returned no images",
+            "details": result,
+        }, 500
+
+    @idempotent
+    @metered
+    def inpaint_remote(self, data):
+        if not remote.FAL_AVAILABLE:
+            return {"error": "Fal.ai client not installed or API Key missing"}, 500
+
+        try:
+            error, inputs = self.prepare_inpaint_remote(data)
+            if error:
+                return error
+            prompt, img_clean, mask, region = inputs
+
+            with stage("upload"):
+                image_url = remote.upload_image(img_clean)
+                mask_url = remote.upload_image(mask)
+
+            with stage("fal"):
+                result = remote.submit(
+                    remote.INPAINT_MODEL,
+                    remote.inpaint_arguments(prompt, image_url, mask_url),
+                )
+            log.debug("remote.response", response=result)
+
+            output_url = remote.first_image_url(result)
+            if not output_url:
+                return self.no_images_error(result)
+
+            with stage("download"):
+                result_img = remote.download_image(output_url)
+            return self.finish_remote(result_img, "debug_fal", region)
+
+        except Exception as e:
+            log.exception("inpaint_remote.failed")
+            return {"status": "error", "message": str(e)}, 500
+
+    @idempotent
+    @metered
+    def sketch_remote(self, data):
+        if not remote.FAL_AVAILABLE:
+            return {"error": "Fal.ai client not installed or API Key missing"}, 500
+
+        try:
+            error, request = self.prepare_sketch_remote(data)
+            if error:
+                return error
+            model_id, arguments, count = request
+
+            alternate = remote.sketch_alternate(model_id, arguments)
+            # Variations are separate submissions, running concurrently
+            with stage("fal"):
+                results = list(
+                    self.remote_workers.map(
+                        lambda _: self.hedger.submit((model_id, arguments), alternate),
+                        range(count),
+                    )
+                )
+            log.debug("remote.response", responses=results)
+
+            image_urls = [remote.first_image_url(result) for result in results]
+            for result, image_url in zip(results, image_urls):
+                if not image_url:
+                    return self.no_images_error(result)
+
+            with stage("download"):
+                result_imgs = list(
+                    self.remote_workers.map(remote.download_image, image_urls)
+                )
+            return self.finish_remote_images(result_imgs)
+
+        except Exception as e:
+            log.exception("sketch_remote.failed")
+            return {"status": "error", "message": str(e)}, 500
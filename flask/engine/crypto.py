@@ -0,0 +1,45 @@
+import os
+import base64
+from Crypto.Cipher import AES
+
+from .logs import log
+
+
+class CryptoManager:
+    def __init__(self, key_base64):
+        # Decode the base64 key to raw bytes (must be 32 bytes for AES-256)
+        self.key = base64.b64decode(key_base64)
+
+    def encrypt(self, plain_text):
+        # 1. Generate a random unique Nonce (12 bytes is standard for GCM)
+        nonce = os.urandom(12)
+
+        # 2. Initialize Cipher
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+
+        # 3. Encrypt and get Tag (MAC)
+        ciphertext, tag = cipher.encrypt_and_digest(plain_text.encode("utf-8"))
+
+        # 4. Pack: Nonce + Ciphertext + Tag
+        combined = nonce + ciphertext + tag
+
+        # 5. Return as Base64 string
+        return base64.b64encode(combined).decode("utf-8")
+
+    def decrypt(self, encrypted_b64):
+        try:
+            # 1. Decode Base64
+            data = base64.b64decode(encrypted_b64)
+
+            # 2. Unpack (Slice the bytes)
+            nonce = data[:12]
+            tag = data[-16:]
+            ciphertext = data[12:-16]
+
+            # 3. Decrypt
+            cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+            decrypted_data = cipher.decrypt_and_verify(ciphertext, tag)
+            return decrypted_data.decode("utf-8")
+        except Exception as e:
+            log.warning("crypto.decrypt_failed", error=str(e))
+            return None
@@ -0,0 +1,310 @@
+import uuid
+import random
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, nullcontext
+
+import torch
+from diffusers import DPMSolverMultistepScheduler
+from PIL import Image
+
+from .cache import LRUCache
+from .images import image_digest
+from .logs import stage
+from .step_cache import StepCache
+from .text_to_image import InpaintConditioning, full_mask_conditioning
+from .text_to_image import initial_noise, text_pipeline
+
+# Quality tiers for /generate and /inpainting, selected via the "quality" field.
+# "standard" keeps the pipeline's own scheduler and the original step counts.
+QUALITY_TIERS = {
+    "draft": {"scheduler": "dpmpp_2m_karras", "generate": 8, "inpainting": 12},
+    "standard": {"scheduler": "default", "generate": 30, "inpainting": 50},
+    "final": {"scheduler": "dpmpp_2m_karras", "generate": 40, "inpainting": 60},
+}
+
+# How far a refine pass re-noises the draft latents (1.0 would start from scratch)
+REFINE_STRENGTH = 0.6
+MAX_DRAFTS = 16
+# Encoded /inpainting canvases (1x4x64x64 fp32 latents are 64 KB at 512px)
+LATENT_CACHE_BYTES = 64 * 1024**2
+
+
+class DraftStore:
+    """Bounded LRU of draft latents, so a refine call can continue from them."""
+
+    def __init__(self, max_items=MAX_DRAFTS):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, record):
+        draft_id = uuid.uuid4().hex
+        with self.lock:
+            self.items[draft_id] = record
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+        return draft_id
+
+    def get(self, draft_id):
+        with self.lock:
+            record = self.items.get(draft_id)
+            if record is not None:
+                self.items.move_to_end(draft_id)
+            return record
+
+
+class TieredPipeline:
+    """
+    Wraps the shared inpainting pipeline with quality tiers. Calls are serialized
+    because the scheduler is swapped per call and holds per-run state.
+
+    "generate" runs use a text-to-image pipeline over the same modules (see
+    text_to_image.py); their refines continue on the inpainting pipeline.
+
+    Inpainting inputs are VAE-encoded here rather than by the pipeline, and
+    the latents of the image and of the masked image are cached by pixel
+    content and size, so repeated edits of a canvas skip the encoder.
+    """
+
+    def __init__(self, pipe, latent_cache_bytes=LATENT_CACHE_BYTES):
+        self.pipe = pipe
+        self.latents = LRUCache(latent_cache_bytes)
+        self.text_pipe = text_pipeline(pipe)
+        # (height, width) -> full-mask UNet conditioning of text-to-image runs
+        self.full_masks = {}
+        self.lock = threading.Lock()
+        self.drafts = DraftStore()
+        self.schedulers = {
+            "default": pipe.scheduler,
+            "dpmpp_2m_karras": DPMSolverMultistepScheduler.from_config(
+                pipe.scheduler.config,
+                algorithm_type="dpmsolver++",
+                use_karras_sigmas=True,
+            ),
+        }
+
+    def draft(self, draft_id):
+        return self.drafts.get(draft_id)
+
+    def _vae_encode(self, pixels):
+        # Called under self.lock
+        pipe = self.pipe
+        with torch.no_grad():
+            latents = pipe.vae.encode(
+                pixels.to(pipe._execution_device, pipe.vae.dtype)
+            ).latent_dist.mode()
+        return (latents * pipe.vae.config.scaling_factor).cpu()
+
+    def _inpaint_latents(self, image, mask_image, height, width):
+        """
+        (image latents, masked image latents) of an inpainting run, encoded
+        as the pipeline would but with the latent distribution's mode.
+        Called under self.lock.
+        """
+        pipe = self.pipe
+        image_key = (image_digest(image), height, width)
+        masked_key = (*image_key, image_digest(mask_image))
+        image_latents = self.latents.get(image_key)
+        masked_latents = self.latents.get(masked_key)
+        if image_latents is not None and masked_latents is not None:
+            return image_latents, masked_latents
+
+        pixels = pipe.image_processor.preprocess(image, height=height, width=width)
+        pixels = pixels.to(torch.float32)
+        batch = {}
+        if image_latents is None:
+            batch[image_key] = pixels
+        if masked_latents is None:
+            mask = pipe.mask_processor.preprocess(
+                mask_image, height=height, width=width
+            )
+            batch[masked_key] = pixels * (mask < 0.5)
+        # One VAE pass for both when neither is cached
+        with stage("vae_encode"):
+            latents = self._vae_encode(torch.cat(list(batch.values())))
+        encoded = dict(zip(batch, latents.split(1)))
+        for key, value in encoded.items():
+            self.latents.put(key, value)
+        return (
+            encoded.get(image_key, image_latents),
+            encoded.get(masked_key, masked_latents),
+        )
+
+    def _full_mask(self, height, width):
+        # Called under self.lock
+        if (height, width) not in self.full_masks:
+            self.full_masks[(height, width)] = full_mask_conditioning(
+                self.pipe, height, width
+            )
+        return self.full_masks[(height, width)]
+
+    def __call__(
+        self,
+        endpoint,
+        quality="standard",
+        seed=None,
+        refine=None,
+        step_cache=None,
+        context=None,
+        cancel=None,
+        num_images=1,
+        **kwargs,
+    ):
+        """
+        Runs one tiered generation. `kwargs` are passed to the pipeline
+        (prompt, image, mask_image, ...; only prompt, height and width for
+        "generate"). With `refine`, the stored draft's seed, latents and
+        arguments are reused and only the remaining noise level is denoised.
+        `num_images` variations run as one batch sharing the prompt
+        embeddings, image i with seed `seed + i`.
+        `step_cache` is an optional DeepCache interval (see step_cache.py).
+        `context` is stored with a draft as is, for the caller's later use.
+        `cancel` is an optional CancelToken (see cancel.py), checked before
+        the run and after every step; a cancelled run raises Cancelled.
+        Returns ([PIL images], info dict for the response).
+        """
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier: {quality}")
+        tier = QUALITY_TIERS[quality]
+
+        if refine and num_images != 1:
+            raise ValueError("A draft is refined into a single image")
+        if refine:
+            record = self.drafts.get(refine)
+            if record is None:
+                raise KeyError(f"Unknown or expired draft: {refine}")
+            seed = record["seed"]
+            kwargs = {
+                **record["kwargs"],
+                "image": record["latents"],
+                "masked_image_latents": record["masked_image_latents"],
+                "strength": REFINE_STRENGTH,
+            }
+        elif seed is None:
+            seed = random.randint(0, 2**32 - 1)
+        seed = int(seed)
+        seeds = [(seed + i) % 2**32 for i in range(num_images)]
+
+        # Drafts of text-to-image runs are refined on the inpainting pipeline
+        text = endpoint == "generate" and not refine
+        pipe = self.text_pipe if text else self.pipe
+        captured = {}
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            if cancel:
+                cancel.check()
+            if quality == "draft" and step == pipe.num_timesteps - 1:
+                latents = callback_kwargs["latents"]
+                captured["latents"] = latents.detach().cpu()
+                if not text:
+                    # masked_image_latents is doubled for classifier-free guidance
+                    masked = callback_kwargs["masked_image_latents"]
+                    captured["masked_image_latents"] = (
+                        masked[: latents.shape[0]].detach().cpu()
+                    )
+            return callback_kwargs
+
+        cache = StepCache(self.pipe.unet, step_cache) if step_cache else None
+
+        with self.lock, cache or nullcontext(), ExitStack() as patches:
+            # Requests cancelled while waiting for the pipeline never start
+            if cancel:
+                cancel.check()
+            generators = [torch.Generator("cpu").manual_seed(s) for s in seeds]
+            run_kwargs = kwargs
+            if text:
+                height, width = kwargs.get("height", 512), kwargs.get("width", 512)
+                mask, masked = self._full_mask(height, width)
+                patches.enter_context(InpaintConditioning(pipe.unet, mask, masked))
+                captured["masked_image_latents"] = masked
+                noise = [initial_noise(pipe, height, width, g) for g in generators]
+                run_kwargs = {**kwargs, "latents": torch.cat(noise)}
+            elif isinstance(kwargs.get("image"), Image.Image):
+                # The pipeline's default size, set here for the cache key
+                default = pipe.unet.config.sample_size * pipe.vae_scale_factor
+                height = kwargs.get("height") or default
+                width = kwargs.get("width") or default
+                image_latents, masked = self._inpaint_latents(
+                    kwargs["image"], kwargs["mask_image"], height, width
+                )
+                run_kwargs = {
+                    **kwargs,
+                    "image": image_latents,
+                    "masked_image_latents": masked,
+                    "height": height,
+                    "width": width,
+                }
+            pipe.scheduler = self.schedulers[tier["scheduler"]]
+            patches.enter_context(stage("diffusion"))
+            try:
+                images = pipe(
+                    **run_kwargs,
+                    num_inference_steps=tier[endpoint],
+                    num_images_per_prompt=num_images,
+                    generator=generators[0] if num_images == 1 else generators,
+                    callback_on_step_end=(
+                        on_step_end if quality == "draft" or cancel else None
+                    ),
+                    callback_on_step_end_tensor_inputs=(
+                        ["latents"] if text else ["latents", "masked_image_latents"]
+                    ),
+                ).images
+            except BaseException:
+                # A cancelled or failed run skips the pipeline's own call, and
+                # would leave offloaded modules on the GPU
+                self.pipe.maybe_free_model_hooks()
+                raise
+            else:
+                # The offload hooks are the inpainting pipeline's, so the text
+                # pipeline's own call frees nothing
+                if text:
+                    self.pipe.maybe_free_model_hooks()
+            finally:
+                pipe.scheduler = self.schedulers["default"]
+
+        info = {"quality": quality, "seed": seed, "steps": tier[endpoint]}
+        if num_images > 1:
+            info["seeds"] = seeds
+        if refine:
+            info["refined_from"] = refine
+        if cache:
+            info["step_cache"] = {
+                "interval": cache.interval,
+                "full_steps": cache.full_steps,
+                "cached_steps": cache.cached_steps,
+            }
+        if quality == "draft" and captured:
+            latents = captured["latents"]
+            scale = self.pipe.vae_scale_factor
+            stored = {
+                k: v
+                for k, v in kwargs.items()
+                if k not in ("image", "masked_image_latents", "strength")
+            }
+            stored.update(
+                height=latents.shape[2] * scale, width=latents.shape[3] * scale
+            )
+            if text:
+                size = (stored["width"], stored["height"])
+                stored["mask_image"] = Image.new("L", size, 255)
+            masked = captured["masked_image_latents"]
+            # One draft per image; text-to-image runs share one conditioning
+            draft_ids = [
+                self.drafts.put(
+                    {
+                        "seed": s,
+                        "kwargs": stored,
+                        "latents": latents[i : i + 1],
+                        "masked_image_latents": (
+                            masked[i : i + 1] if not text else masked
+                        ),
+                        "context": context,
+                    }
+                )
+                for i, s in enumerate(seeds)
+            ]
+            info["draft_id"] = draft_ids[0]
+            if num_images > 1:
+                info["draft_ids"] = draft_ids
+        return images, info
@@ -0,0 +1,171 @@
+import re
+import torch
+
+CAPTION_TASK = "<DETAILED_CAPTION>"
+
+
+class Interrupt:
+    """
+    Stopping criterion calling `check` after every decoding step, so a
+    background generate() can be aborted by raising from `check`.
+    """
+
+    def __init__(self, check):
+        self.check = check
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.check()
+        return torch.zeros(
+            input_ids.shape[0], dtype=torch.bool, device=input_ids.device
+        )
+
+
+def preprocess_size(processor):
+    # Resize target of the vision encoder's preprocessing, e.g. 768x768
+    return tuple(sorted(processor.image_processor.size.items()))
+
+
+def encode_image(model, processor, image, device):
+    """DaViT image features of one image (1 x tokens x dim), the costly half of a task."""
+    pixel_values = processor.image_processor(images=[image], return_tensors="pt")[
+        "pixel_values"
+    ]
+    with torch.no_grad():
+        return model._encode_image(pixel_values.to(device, torch.float16))
+
+
+def decode_tasks(
+    model,
+    processor,
+    image_features,
+    tasks,
+    device,
+    max_new_tokens=128,
+    num_beams=1,
+    **generate_kwargs,
+):
+    """
+    Runs several Florence-2 tasks on the same image features as one batch
+    and returns the raw generated text of each. Prompts of different length
+    are padded; the padding is masked out of the encoder attention.
+    """
+    text = processor.tokenizer(
+        processor._construct_prompts(list(tasks)),
+        padding=True,
+        return_tensors="pt",
+        return_token_type_ids=False,
+    )
+    input_ids = text["input_ids"].to(device)
+    text_embeds = model.get_input_embeddings()(input_ids)
+    features = image_features.to(text_embeds.dtype).expand(len(tasks), -1, -1)
+    # Same layout as the model's own merge: image tokens, then the prompt
+    inputs_embeds = torch.cat([features, text_embeds], dim=1)
+    attention_mask = torch.cat(
+        [
+            torch.ones(features.shape[:2], dtype=torch.long, device=device),
+            text["attention_mask"].to(device),
+        ],
+        dim=1,
+    )
+
+    generated_ids = model.language_model.generate(
+        input_ids=None,
+        inputs_embeds=inputs_embeds,
+        attention_mask=attention_mask,
+        max_new_tokens=max_new_tokens,
+        num_beams=num_beams,
+        do_sample=False,
+        use_cache=False,
+        **generate_kwargs,
+    )
+    return processor.batch_decode(generated_ids, skip_special_tokens=False)
+
+
+def run_florence(
+    model,
+    processor,
+    image,
+    task,
+    device,
+    max_new_tokens=128,
+    num_beams=1,
+    **generate_kwargs,
+):
+    """
+    Runs one Florence-2 task through the model's own generate() and returns
+    the raw generated text (the reference path for decode_tasks).
+    """
+    inputs = processor(text=task, images=[image], return_tensors="pt")
+    inputs["pixel_values"] = inputs["pixel_values"].to(device, torch.float16)
+    inputs["input_ids"] = inputs["input_ids"].to(device)
+
+    generated_ids = model.generate(
+        input_ids=inputs["input_ids"],
+        pixel_values=inputs["pixel_values"],
+        max_new_tokens=max_new_tokens,
+        num_beams=num_beams,
+        do_sample=False,
+        use_cache=False,
+        **generate_kwargs,
+    )
+    return processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
+
+
+def clean_florence_text(generated_text, task):
+    return (
+        generated_text.replace(task, "").replace("</s>", "").replace("<s>", "").strip()
+    )
+
+
+def caption(model, processor, image_features, device, **generate_kwargs):
+    # Context prompt for inpainting, from encode_image() features
+    generated_text = decode_tasks(
+        model, processor, image_features, [CAPTION_TASK], device, **generate_kwargs
+    )[0]
+    return clean_florence_text(generated_text, CAPTION_TASK)
+
+
+def parse_loc_manually(text, w, h):
+    locs = re.findall(r"<loc_(\d+)>", text)
+    if locs and len(locs) % 4 == 0:
+        bboxes = []
+        for i in range(0, len(locs), 4):
+            x1 = int(int(locs[i]) / 1000 * w)
+            y1 = int(int(locs[i + 1]) / 1000 * h)
+            x2 = int(int(locs[i + 2]) / 1000 * w)
+            y2 = int(int(locs[i + 3]) / 1000 * h)
+            bboxes.append([x1, y1, x2, y2])
+        clean_text = re.sub(r"<loc_\d+>", "", text).strip()
+        return {"text": clean_text, "bboxes": bboxes}
+    return text
+
+
+def postprocess_answer(processor, generated_text, task, image):
+    """Trims captions to the last full sentence and parses region outputs."""
+    cleaned_text = clean_florence_text(generated_text, task)
+
+    if cleaned_text and cleaned_text[-1] not in [".", "!", "?"]:
+        last_dot = cleaned_text.rfind(".")
+        last_excl = cleaned_text.rfind("!")
+        last_ques = cleaned_text.rfind("?")
+        cut_off = max(last_dot, last_excl, last_ques)
+        if cut_off != -1:
+            cleaned_text = cleaned_text[: cut_off + 1]
+
+    final_answer = cleaned_text
+
+    if "<loc_" in cleaned_text or "<poly_" in cleaned_text:
+        try:
+            parsed = processor.post_process_generation(
+                generated_text,
+                task=task,
+                image_size=(image.width, image.height),
+            )
+            if isinstance(parsed, dict) and task in parsed:
+                final_answer = parsed[task]
+            else:
+                final_answer = parsed
+        except Exception:
+            final_answer = parse_loc_manually(cleaned_text, image.width, image.height)
+
+    return final_answer
@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .logs import log
+
+# With an explicit seed, a /generate response is a pure function of the
+# weights and the generation parameters. Responses are stored under a hash of
+# those, so flipping back to an earlier prompt variant skips the diffusion run.
+
+
+def weights_id(path):
+    """
+    Identifies the weights at `path` across restarts: a local folder by the
+    names, sizes and modification times of its files, a Hub id by itself.
+    """
+    if not os.path.isdir(path):
+        return path
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            stat = os.stat(full)
+            relative = os.path.relpath(full, path)
+            digest.update(f"{relative}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return f"{os.path.abspath(path)}@{digest.hexdigest()[:16]}"
+
+
+def generation_key(**params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class GenerationCache:
+    """
+    Responses by generation_key(). A memory tier is bounded by
+    `max_memory_bytes`; an optional disk tier (`disk_dir`) survives restarts
+    and is bounded by `max_disk_bytes`. Both evict least-recently-used first
+    (the disk tier orders by file modification time, refreshed on every hit).
+    """
+
+    def __init__(
+        self, max_memory_bytes=128 * 1024**2, disk_dir=None, max_disk_bytes=1024**3
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        # key -> (response, bytes)
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        # key -> bytes
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "stored": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self):
+        entries = []
+        for filename in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, filename)
+            if filename.endswith(".json") and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, filename[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self.memory_bytes > self.max_memory_bytes:
+            _, (_, nbytes) = self.memory.popitem(last=False)
+            self.memory_bytes -= nbytes
+        while self.disk_bytes > self.max_disk_bytes:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remember(self, key, response, nbytes):
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key)[1]
+        if nbytes <= self.max_memory_bytes:
+            self.memory[key] = (response, nbytes)
+            self.memory_bytes += nbytes
+
+    def get(self, key):
+        """Stored response or None."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.counters["hits"] += 1
+                return self.memory[key][0]
+            if key in self.disk:
+                try:
+                    with open(self._path(key)) as f:
+                        response = json.load(f)
+                    os.utime(self._path(key))
+                except (OSError, ValueError):
+                    self.disk_bytes -= self.disk.pop(key)
+                else:
+                    self.disk.move_to_end(key)
+                    self._remember(key, response, self.disk[key])
+                    self._evict()
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                    return response
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, response):
+        data = json.dumps(response)
+        nbytes = len(data)
+        with self.lock:
+            self._remember(key, response, nbytes)
+            if self.disk_dir and nbytes <= self.max_disk_bytes:
+                try:
+                    with open(self._path(key), "w") as f:
+                        f.write(data)
+                except OSError as e:
+                    log.warning("generation_cache.write_failed", error=str(e))
+                else:
+                    if key in self.disk:
+                        self.disk_bytes -= self.disk.pop(key)
+                    self.disk[key] = nbytes
+                    self.disk_bytes += nbytes
+            self.counters["stored"] += 1
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": (
+                    round(self.counters["hits"] / lookups, 3) if lookups else None
+                ),
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "disk_entries": len(self.disk),
+                "disk_bytes": self.disk_bytes,
+            }
+
+
+def generation_cache_from_env():
+    """GenerationCache configured from GENERATION_CACHE_* environment variables."""
+    return GenerationCache(
+        max_memory_bytes=int(os.getenv("GENERATION_CACHE_MB", "128")) * 1024**2,
+        disk_dir=os.getenv("GENERATION_CACHE_DIR") or None,
+        max_disk_bytes=int(os.getenv("GENERATION_CACHE_DISK_MB", "1024")) * 1024**2,
+    )
@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import remote
+from .logs import log
+from .quota import parse_costs
+
+# Latest latencies kept per model for its hedging quantile
+WINDOW = 200
+# A model is not hedged before it has this many latencies
+MIN_SAMPLES = 20
+
+
+class _Call:
+    """One fal.ai submission, cancellable once it is queued."""
+
+    def __init__(self, model_id, arguments):
+        self.model_id = model_id
+        self.arguments = arguments
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.handle = None
+        self.cancelled = False
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def run(self):
+        handle = remote.start(self.model_id, self.arguments)
+        with self.lock:
+            self.handle = handle
+            cancelled = self.cancelled
+        if cancelled:
+            self._cancel(handle)
+            return None
+        return handle.get()
+
+    async def run_async(self):
+        self.handle = await remote.start_async(self.model_id, self.arguments)
+        return await self.handle.get()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            handle = self.handle
+        if handle:
+            self._cancel(handle)
+
+    def _cancel(self, handle):
+        try:
+            remote.cancel(handle)
+        except Exception as e:
+            log.warning("hedge.cancel_failed", model=self.model_id, error=str(e))
+
+    async def cancel_async(self):
+        if self.handle:
+            try:
+                await remote.cancel_async(self.handle)
+            except Exception as e:
+                log.warning("hedge.cancel_failed", model=self.model_id, error=str(e))
+
+
+class Hedger:
+    """
+    Hedged fal.ai submissions. A request still running after its model's
+    `quantile` latency (p90 by default, over the model's last WINDOW
+    requests) is sent again as the equivalent request on an alternate
+    model; the first result wins and the other call is cancelled.
+
+    With `enabled` False, or before a model has `min_samples` latencies,
+    requests run unhedged (their latencies are still tracked). Calls are
+    charged at `costs` (USD per call by model); a cancelled hedge is
+    counted in full since it may already have run.
+    """
+
+    def __init__(
+        self,
+        enabled=False,
+        quantile=0.9,
+        min_samples=MIN_SAMPLES,
+        costs=None,
+        max_workers=32,
+    ):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.costs = {**remote.MODEL_COSTS, **(costs or {})}
+        # Threads waiting on sync fal.ai calls while the caller waits for both
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="hedge")
+        self.lock = threading.Lock()
+        # model -> latest latencies in seconds
+        self.latencies = {}
+        self.counters = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "cost_usd": 0.0,
+            "extra_cost_usd": 0.0,
+        }
+
+    def record(self, model_id, seconds):
+        with self.lock:
+            self.latencies.setdefault(model_id, deque(maxlen=WINDOW)).append(seconds)
+
+    def delay(self, model_id):
+        """Seconds after which a request to `model_id` is hedged, or None."""
+        with self.lock:
+            samples = sorted(self.latencies.get(model_id, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(self.quantile * len(samples)))]
+
+    def _charge(self, model_id, hedge=False):
+        cost = self.costs.get(model_id, 0.0)
+        with self.lock:
+            self.counters["calls"] += 1
+            self.counters["cost_usd"] += cost
+            if hedge:
+                self.counters["hedged"] += 1
+                self.counters["extra_cost_usd"] += cost
+
+    def _hedge_delay(self, primary, alternate):
+        if not self.enabled or alternate is None:
+            return None
+        return self.delay(primary[0])
+
+    def _hedge(self, primary, alternate, delay):
+        self._charge(alternate[0], hedge=True)
+        log.info(
+            "hedge.sent",
+            model=primary[0],
+            alternate=alternate[0],
+            after_ms=round(delay * 1000),
+        )
+        return _Call(*alternate)
+
+    def _won(self, call, first):
+        self.record(call.model_id, call.elapsed())
+        if call is not first:
+            with self.lock:
+                self.counters["hedge_wins"] += 1
+            log.info("hedge.won", model=call.model_id)
+
+    def _lost(self, call, first):
+        # The primary ran at least this long: a lower bound, but above the
+        # hedging quantile either way
+        if call is first:
+            self.record(call.model_id, call.elapsed())
+
+    def submit(self, primary, alternate=None):
+        """
+        Result of the (model, arguments) request `primary`, hedged with
+        `alternate` (see remote.sketch_alternate).
+        """
+        delay = self._hedge_delay(primary, alternate)
+        self._charge(primary[0])
+        if delay is None:
+            start = time.monotonic()
+            result = remote.submit(*primary)
+            self.record(primary[0], time.monotonic() - start)
+            return result
+
+        first = _Call(*primary)
+        calls = {self.pool.submit(first.run): first}
+        done, _ = wait(calls, timeout=delay)
+        if not done:
+            hedge = self._hedge(primary, alternate, delay)
+            calls[self.pool.submit(hedge.run)] = hedge
+
+        pending, error = set(calls), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                self._won(calls[future], first)
+                for other in pending:
+                    calls[other].cancel()
+                    self._lost(calls[other], first)
+                return result
+        raise error
+
+    async def submit_async(self, primary, alternate=None):
+        """Async variant of submit()."""
+        delay = self._hedge_delay(primary, alternate)
+        self._charge(primary[0])
+        if delay is None:
+            start = time.monotonic()
+            result = await remote.submit_async(*primary)
+            self.record(primary[0], time.monotonic() - start)
+            return result
+
+        first = _Call(*primary)
+        calls = {asyncio.ensure_future(first.run_async()): first}
+        done, _ = await asyncio.wait(calls, timeout=delay)
+        if not done:
+            hedge = self._hedge(primary, alternate, delay)
+            calls[asyncio.ensure_future(hedge.run_async())] = hedge
+
+        pending, error = set(calls), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                self._won(calls[task], first)
+                for other in pending:
+                    other.cancel()
+                    await calls[other].cancel_async()
+                    self._lost(calls[other], first)
+                return result
+        raise error
+
+    def stats(self):
+        models = {}
+        with self.lock:
+            latencies = {model: sorted(v) for model, v in self.latencies.items()}
+            counters = dict(self.counters)
+        for model, samples in latencies.items():
+            n = len(samples)
+            models[model] = {
+                "samples": n,
+                "p50_ms": round(samples[n // 2] * 1000),
+                "p90_ms": round(samples[min(n - 1, int(0.9 * n))] * 1000),
+            }
+        counters["cost_usd"] = round(counters["cost_usd"], 4)
+        counters["extra_cost_usd"] = round(counters["extra_cost_usd"], 4)
+        return {"enabled": self.enabled, **counters, "models": models}
+
+
+def hedger_from_env():
+    """Hedger configured from HEDGE_* environment variables."""
+    return Hedger(
+        enabled=os.getenv("HEDGE_SKETCH", "0") == "1",
+        quantile=float(os.getenv("HEDGE_QUANTILE", "0.9")),
+        min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", str(MIN_SAMPLES))),
+        costs=parse_costs(os.getenv("HEDGE_COSTS", "")),
+    )
@@ -0,0 +1,125 @@
+import gc
+import copy
+import hmac
+import time
+import threading
+import torch
+
+from .logs import log
+
+# Replaceable models: runtime attribute holding the weights location, loader,
+# and the attributes the loader fills in
+COMPONENTS = {
+    "sd": ("sd_path", "load_sd", ("sd_pipe", "sd_tiered", "sd_weights")),
+    "birefnet": ("birefnet_dir", "load_birefnet", ("birefnet",)),
+    "florence": (
+        "florence_path",
+        "load_florence",
+        ("florence_model", "florence_processor"),
+    ),
+}
+
+
+class ModelSwapper:
+    """
+    Replaces models of a running engine without a restart. New weights are
+    loaded next to the serving ones in a background thread; once ready, the
+    engine's runtime is switched between requests: running local model
+    requests and background precomputation finish on the old weights
+    (see Scheduler.exclusive and Precomputer.paused), queued ones start on the
+    new ones. The old models are freed after the switch.
+
+    Loading needs memory for both versions of the replaced models at once.
+    """
+
+    def __init__(self, engine, admin_token=None):
+        self.engine = engine
+        self.admin_token = admin_token
+        self.lock = threading.Lock()
+        self.state = {"state": "idle", "swaps": 0}
+
+    def start(self, data):
+        if not self.admin_token:
+            return {"error": "Model reload is disabled (ADMIN_TOKEN not set)"}, 403
+        token = str(data.get("admin_token", ""))
+        if not hmac.compare_digest(token.encode(), self.admin_token.encode()):
+            return {"error": "Invalid admin token"}, 403
+        models = data.get("models")
+        if not isinstance(models, dict) or not models:
+            names = ", ".join(COMPONENTS)
+            return {"error": f"'models' must map some of {names} to a path"}, 400
+        unknown = set(models) - set(COMPONENTS)
+        if unknown:
+            return {"error": f"Unknown models: {', '.join(sorted(unknown))}"}, 400
+        if not all(path is None or isinstance(path, str) for path in models.values()):
+            return {"error": "Model paths must be strings or null"}, 400
+
+        with self.lock:
+            if self.state["state"] == "loading":
+                return {"error": "A model reload is already running"}, 409
+            self.state.update(
+                state="loading", models=sorted(models), error=None, started=time.time()
+            )
+        threading.Thread(
+            target=self._swap, args=(models,), name="hotswap", daemon=True
+        ).start()
+        return {"status": "loading", "models": sorted(models)}, 202
+
+    def _load(self, models):
+        # A copy of the serving runtime sharing the models that are kept
+        old = self.engine.runtime
+        new = copy.copy(old)
+        new.versions = dict(old.versions)
+        for name, path in models.items():
+            path_attr, loader, attrs = COMPONENTS[name]
+            if path:
+                setattr(new, path_attr, path)
+            for attr in attrs:
+                setattr(new, attr, None)
+            getattr(new, loader)()
+            if any(getattr(new, attr) is None for attr in attrs):
+                raise RuntimeError(
+                    f"{name} failed to load from {getattr(new, path_attr)}"
+                )
+            new.versions[name] += 1
+        if "sd" in models and old.sd_tiered:
+            # Drafts stay refinable across the swap
+            new.sd_tiered.drafts = old.sd_tiered.drafts
+        return new
+
+    def _swap(self, models):
+        log.info("models.loading", models=sorted(models))
+        try:
+            new = self._load(models)
+        except Exception as e:
+            log.exception("models.reload_failed", models=sorted(models))
+            with self.lock:
+                self.state.update(state="failed", error=str(e), finished=time.time())
+            return
+
+        engine = self.engine
+        start = time.monotonic()
+        precompute = engine.precompute
+        with engine.scheduler.exclusive():
+            if precompute:
+                with precompute.paused():
+                    engine.runtime = new
+            else:
+                engine.runtime = new
+        log.info(
+            "models.swapped",
+            models=sorted(models),
+            drained_ms=round((time.monotonic() - start) * 1000, 1),
+        )
+
+        # The old models are unreferenced once the drained requests returned
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        with self.lock:
+            self.state.update(state="swapped", finished=time.time())
+            self.state["swaps"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {**self.state, "versions": dict(self.engine.runtime.versions)}
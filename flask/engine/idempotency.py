@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from .logs import log
+
+# Generation requests may carry {"idempotency_key": "<client-chosen id>"}. A
+# retry with the same key gets the stored response of the first request
+# instead of another diffusion run or paid fal.ai call.
+KEY_FIELD = "idempotency_key"
+# Per-attempt fields that may differ between retries (see cancel.py). Keys
+# are scoped by "client_id" (quota.py), so it is not part of the fingerprint
+ATTEMPT_FIELDS = (KEY_FIELD, "request_id", "deadline", "client_id")
+# Result of a run that was cancelled (e.g. its client disconnected), given
+# to the retries attached to it: the first of them runs the request again
+RERUN = object()
+
+
+def fingerprint(data):
+    # Reusing a key with a different request body is an error, not a replay
+    body = {k: v for k, v in data.items() if k not in ATTEMPT_FIELDS}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Completed responses by (endpoint, idempotency key), kept for `ttl`
+    seconds. A memory tier is bounded by `max_memory_bytes` and evicted
+    least-recently-used first. An optional disk tier (`disk_dir`) survives
+    restarts. Only successful responses are stored, so a failed request can
+    be retried.
+
+    Keys are per client: another client using the same key gets its own
+    run. Retries that arrive while the first request is still running wait
+    for it and share its response, unless that run is cancelled.
+    """
+
+    def __init__(
+        self,
+        ttl=3600,
+        max_memory_bytes=256 * 1024**2,
+        disk_dir=None,
+        max_disk_bytes=2 * 1024**3,
+    ):
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        # name -> (record, bytes, expires at)
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        # name -> (bytes, expires at)
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        # name -> (fingerprint, Future of (response, status))
+        self.in_flight = {}
+        self.counters = {
+            "stored": 0,
+            "replayed": 0,
+            "attached": 0,
+            "reruns": 0,
+            "conflicts": 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _name(self, endpoint, data, key):
+        client = data.get("client_id") or ""
+        return hashlib.sha256(f"{endpoint}\0{client}\0{key}".encode()).hexdigest()
+
+    def _path(self, name):
+        return os.path.join(self.disk_dir, f"{name}.json")
+
+    def _load_disk_index(self):
+        # Responses expire `ttl` seconds after they were written (the mtime)
+        entries = []
+        for filename in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, filename)
+            if filename.endswith(".json") and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, filename[:-5], stat.st_size))
+        for mtime, name, size in sorted(entries):
+            self.disk[name] = (size, mtime + self.ttl)
+            self.disk_bytes += size
+        self._evict(time.time())
+
+    def _evict(self, now):
+        for name, (_, nbytes, expires) in list(self.memory.items()):
+            if expires <= now or self.memory_bytes > self.max_memory_bytes:
+                del self.memory[name]
+                self.memory_bytes -= nbytes
+        for name, (size, expires) in list(self.disk.items()):
+            if expires <= now or self.disk_bytes > self.max_disk_bytes:
+                del self.disk[name]
+                self.disk_bytes -= size
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+
+    def _lookup(self, name, now):
+        # Stored record {"fingerprint", "response"} or None
+        if name in self.memory:
+            self.memory.move_to_end(name)
+            return self.memory[name][0]
+        if name not in self.disk:
+            return None
+        try:
+            with open(self._path(name)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.memory[name] = (record, self.disk[name][0], self.disk[name][1])
+        self.memory_bytes += self.disk[name][0]
+        self._evict(now)
+        return record
+
+    def _store(self, name, record, now):
+        data = json.dumps(record)
+        nbytes = len(data)
+        expires = now + self.ttl
+        self.memory[name] = (record, nbytes, expires)
+        self.memory_bytes += nbytes
+        if self.disk_dir:
+            with open(self._path(name), "w") as f:
+                f.write(data)
+            if name in self.disk:
+                self.disk_bytes -= self.disk.pop(name)[0]
+            self.disk[name] = (nbytes, expires)
+            self.disk_bytes += nbytes
+        self.counters["stored"] += 1
+        self._evict(now)
+
+    def begin(self, name, data):
+        """
+        Returns ("replay", (response, status)), ("conflict", error
+        response), ("attach", Future of the running request's result or
+        RERUN) or ("run", None); after "run" the caller must call finish().
+        """
+        body = fingerprint(data)
+        now = time.time()
+        with self.lock:
+            self._evict(now)
+            record = self._lookup(name, now)
+            if record is None and name in self.in_flight:
+                running, future = self.in_flight[name]
+                record = {"fingerprint": running}
+            if record and record["fingerprint"] != body:
+                self.counters["conflicts"] += 1
+                return "conflict", (
+                    {"error": "Idempotency key was already used for another request"},
+                    422,
+                )
+            if record and "response" in record:
+                self.counters["replayed"] += 1
+                return "replay", ({**record["response"], "replayed": True}, 200)
+            if record:
+                self.counters["attached"] += 1
+                return "attach", future
+            self.in_flight[name] = (body, Future())
+            return "run", None
+
+    def finish(self, name, result=None, error=None):
+        with self.lock:
+            body, future = self.in_flight.pop(name)
+            if error is None and result[1] == 200:
+                record = {"fingerprint": body, "response": result[0]}
+                try:
+                    self._store(name, record, time.time())
+                except (OSError, TypeError, ValueError) as e:
+                    log.warning("idempotency.store_failed", error=str(e))
+        if error is not None:
+            future.set_exception(error)
+        elif result[0].get("status") == "cancelled":
+            # Cancelled for the original caller only (see cancel.py)
+            future.set_result(RERUN)
+        else:
+            future.set_result(result)
+
+    def run(self, endpoint, data, handler):
+        """Runs handler(data) at most once per idempotency key."""
+        key = data.get(KEY_FIELD)
+        if not key:
+            return handler(data)
+        name = self._name(endpoint, data, str(key))
+        while True:
+            state, value = self.begin(name, data)
+            if state in ("replay", "conflict"):
+                return value
+            if state == "run":
+                break
+            result = value.result()
+            if result is not RERUN:
+                return result
+            self._count_rerun()
+        try:
+            result = handler(data)
+        except BaseException as e:
+            self.finish(name, error=e)
+            raise
+        self.finish(name, result)
+        return result
+
+    async def run_async(self, endpoint, data, handler):
+        """Async variant of run() for coroutine handlers."""
+        key = data.get(KEY_FIELD)
+        if not key:
+            return await handler(data)
+        name = self._name(endpoint, data, str(key))
+        while True:
+            state, value = self.begin(name, data)
+            if state in ("replay", "conflict"):
+                return value
+            if state == "run":
+                break
+            result = await asyncio.wrap_future(value)
+            if result is not RERUN:
+                return result
+            self._count_rerun()
+        try:
+            result = await handler(data)
+        except BaseException as e:
+            self.finish(name, error=e)
+            raise
+        self.finish(name, result)
+        return result
+
+    def _count_rerun(self):
+        with self.lock:
+            self.counters["reruns"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "in_flight": len(self.in_flight),
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "disk_entries": len(self.disk),
+                "disk_bytes": self.disk_bytes,
+            }
+
+
+def idempotency_store_from_env():
+    """IdempotencyStore configured from IDEMPOTENCY_* environment variables."""
+    return IdempotencyStore(
+        ttl=int(os.getenv("IDEMPOTENCY_TTL", "3600")),
+        max_memory_bytes=int(os.getenv("IDEMPOTENCY_MEMORY_MB", "256")) * 1024**2,
+        disk_dir=os.getenv("IDEMPOTENCY_DIR") or None,
+        max_disk_bytes=int(os.getenv("IDEMPOTENCY_DISK_MB", "2048")) * 1024**2,
+    )
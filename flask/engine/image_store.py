@@ -0,0 +1,193 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .images import base64_to_bytes, decode_image_bytes
+
+# Image fields of any endpoint may carry a handle from /images instead of base64.
+# Base64 never contains ":", data URLs never start with this prefix.
+HANDLE_PREFIX = "sha256:"
+
+
+def is_handle(value):
+    return isinstance(value, str) and value.startswith(HANDLE_PREFIX)
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class ImageStore:
+    """
+    Content-addressed store behind /images: upload a canvas once, then pass
+    its handle ("sha256:<hex>") to /describe, /asset, /inpainting, ...
+
+    Two bounded tiers, both evicted least-recently-used first:
+
+      memory - decoded RGB images, so repeated use skips the decode
+      disk   - the uploaded bytes (optional), re-decoded on a memory miss
+
+    Identical uploads map to the same handle and are stored once. Entries
+    expire `ttl` seconds after their last use.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes=256 * 1024**2,
+        ttl=3600,
+        disk_dir=None,
+        max_disk_bytes=2 * 1024**3,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        # handle -> (image, bytes, expires at)
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        # handle -> (bytes, expires at)
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, handle):
+        return os.path.join(self.disk_dir, handle[len(HANDLE_PREFIX) :])
+
+    def _load_disk_index(self):
+        # Uploads survive restarts; the file mtime records the last use
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, HANDLE_PREFIX + name, stat.st_size))
+        for mtime, handle, size in sorted(entries):
+            self.disk[handle] = (size, mtime + self.ttl)
+            self.disk_bytes += size
+        self._evict(time.time())
+
+    def _evict(self, now):
+        for handle, (_, nbytes, expires) in list(self.memory.items()):
+            if expires <= now or self.memory_bytes > self.max_memory_bytes:
+                del self.memory[handle]
+                self.memory_bytes -= nbytes
+        for handle, (size, expires) in list(self.disk.items()):
+            if expires <= now or self.disk_bytes > self.max_disk_bytes:
+                del self.disk[handle]
+                self.disk_bytes -= size
+                try:
+                    os.remove(self._path(handle))
+                except OSError:
+                    pass
+
+    def _touch(self, handle, now):
+        # Moves an entry to the most-recently-used end and extends its TTL
+        expires = now + self.ttl
+        if handle in self.memory:
+            image, nbytes, _ = self.memory.pop(handle)
+            self.memory[handle] = (image, nbytes, expires)
+        if handle in self.disk:
+            size, _ = self.disk.pop(handle)
+            self.disk[handle] = (size, expires)
+            os.utime(self._path(handle), (now, now))
+
+    def _remember(self, handle, image, now):
+        nbytes = image.width * image.height * len(image.getbands())
+        self.memory[handle] = (image, nbytes, now + self.ttl)
+        self.memory_bytes += nbytes
+
+    def put(self, b64_str):
+        """Stores an upload. Returns (handle, image, deduplicated)."""
+        data = base64_to_bytes(b64_str)
+        handle = HANDLE_PREFIX + hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self.lock:
+            if handle in self.memory:
+                self._touch(handle, now)
+                return handle, self.memory[handle][0], True
+
+        # Decode outside the lock, concurrent uploads of the same bytes are harmless
+        image = decode_image_bytes(data)
+        nbytes = image.width * image.height * len(image.getbands())
+        if nbytes > self.max_memory_bytes:
+            raise ImageTooLarge("Image exceeds the image store capacity")
+
+        with self.lock:
+            deduplicated = handle in self.disk or handle in self.memory
+            if handle not in self.memory:
+                self._remember(handle, image, now)
+            if self.disk_dir and handle not in self.disk:
+                with open(self._path(handle), "wb") as f:
+                    f.write(data)
+                self.disk[handle] = (len(data), now + self.ttl)
+                self.disk_bytes += len(data)
+            self._touch(handle, now)
+            self._evict(now)
+        return handle, image, deduplicated
+
+    def get(self, handle):
+        """Returns the decoded RGB image (treat as read-only) or None."""
+        now = time.time()
+        with self.lock:
+            self._evict(now)
+            if handle in self.memory:
+                self._touch(handle, now)
+                return self.memory[handle][0]
+            if handle not in self.disk:
+                return None
+            self._touch(handle, now)
+            with open(self._path(handle), "rb") as f:
+                data = f.read()
+
+        image = decode_image_bytes(data)
+        with self.lock:
+            if handle not in self.memory:
+                self._remember(handle, image, now)
+                self._evict(now)
+        return image
+
+    def derive(self, handle, key, fn):
+        """
+        Caches fn(image) of a stored image in memory (e.g. its working-size
+        resize), so sessions reusing a handle skip that work too. Returns
+        None if the handle is unknown.
+        """
+        derived = f"{handle}@{key}"
+        now = time.time()
+        with self.lock:
+            if derived in self.memory:
+                self._touch(derived, now)
+                return self.memory[derived][0]
+        image = self.get(handle)
+        if image is None:
+            return None
+        result = fn(image)
+        with self.lock:
+            if derived not in self.memory:
+                self._remember(derived, result, now)
+                self._evict(now)
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                "memory_images": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "disk_images": len(self.disk),
+                "disk_bytes": self.disk_bytes,
+            }
+
+
+def image_store_from_env():
+    """ImageStore configured from IMAGE_STORE_* environment variables."""
+    return ImageStore(
+        max_memory_bytes=int(os.getenv("IMAGE_STORE_MEMORY_MB", "256")) * 1024**2,
+        ttl=int(os.getenv("IMAGE_STORE_TTL", "3600")),
+        disk_dir=os.getenv("IMAGE_STORE_DIR") or None,
+        max_disk_bytes=int(os.getenv("IMAGE_STORE_DISK_MB", "2048")) * 1024**2,
+    )
@@ -0,0 +1,97 @@
+import io
+import base64
+import hashlib
+import numpy as np
+import scipy.ndimage
+from PIL import Image, ImageFilter
+
+
+def base64_to_bytes(b64_str):
+    # Accepts plain base64 as well as data URLs
+    if "," in b64_str:
+        b64_str = b64_str.split(",")[1]
+    return base64.b64decode(b64_str)
+
+
+def decode_base64_image(b64_str):
+    return decode_image_bytes(base64_to_bytes(b64_str))
+
+
+def decode_image_bytes(image_data):
+    # Flattens transparency onto white, always returns RGB
+    img = Image.open(io.BytesIO(image_data))
+
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        background.paste(img, mask=img.split()[3])
+        return background
+    else:
+        return img.convert("RGB")
+
+
+def image_digest(img):
+    # Content hash of the decoded pixels, for caching work on identical images
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{img.mode}{img.size}".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def encode_image_to_base64(pil_img):
+    buffered = io.BytesIO()
+    pil_img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def resize_to_limit(img, max_dim=1024, multiple=8):
+    w, h = img.size
+    ratio = min(max_dim / w, max_dim / h)
+    new_w = int(w * ratio)
+    new_h = int(h * ratio)
+    new_w = new_w - (new_w % multiple)
+    new_h = new_h - (new_h % multiple)
+    if new_w < multiple:
+        new_w = multiple
+    if new_h < multiple:
+        new_h = multiple
+    return img.resize((new_w, new_h), Image.LANCZOS)
+
+
+def changed_pixels(img_clean, img_drawn, threshold=30):
+    # Boolean map of pixels that differ after a light blur (ignores JPEG noise)
+    clean_blur = np.array(
+        img_clean.filter(ImageFilter.GaussianBlur(radius=2)), dtype=np.int16
+    )
+    drawn_blur = np.array(
+        img_drawn.filter(ImageFilter.GaussianBlur(radius=2)), dtype=np.int16
+    )
+    diff_arr = np.abs(drawn_blur - clean_blur)
+    return np.max(diff_arr, axis=2) > threshold
+
+
+def finish_mask(mask_binary, pad=5):
+    """
+    Fills holes and dilates a changed-pixel map into the inpainting mask.
+    Only the bounding box of the changes (plus the dilation margin) is
+    processed, which gives the same result as the whole image.
+    """
+    mask = np.zeros(mask_binary.shape, dtype=np.uint8)
+    ys, xs = np.nonzero(mask_binary)
+    if len(ys):
+        y0, y1 = max(ys.min() - pad, 0), ys.max() + pad + 1
+        x0, x1 = max(xs.min() - pad, 0), xs.max() + pad + 1
+        filled = scipy.ndimage.binary_fill_holes(mask_binary[y0:y1, x0:x1])
+        region = Image.fromarray((filled * 255).astype(np.uint8))
+        mask[y0:y1, x0:x1] = np.array(region.filter(ImageFilter.MaxFilter(9)))
+    return Image.fromarray(mask)
+
+
+def difference_mask(img_clean, img_drawn, threshold=30):
+    """
+    Robust mask of what the user drew: blurred per-pixel difference, holes
+    filled and dilated. Returns (mask image, number of changed pixels).
+    """
+    mask_binary = changed_pixels(img_clean, img_drawn, threshold)
+    return finish_mask(mask_binary), int(np.sum(mask_binary))
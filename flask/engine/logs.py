@@ -0,0 +1,212 @@
+"""
+Structured logging for the request path.
+
+Records are JSON lines: time, level, event name, the request id and the
+event's fields. The calling thread only builds the record and puts it on a
+bounded queue (a full queue drops it); a background listener formats and
+writes it to stderr. Verbose "debug" events are sampled.
+
+    log.debug("inpaint.start", prompt=final_prompt)
+    log.warning("quota.limited", client=client)
+
+    with request_context("generate", data) as request:
+        with stage("diffusion"):
+            ...
+        request.status = 200
+
+Each request then logs one "request" record with its status, total time
+and per-stage timings in milliseconds.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+# Log records waiting for the background writer
+QUEUE_SIZE = 10000
+
+# RequestLog of the request being handled. Threads started for a request
+# see it when run with contextvars.copy_context().run (see aio.py)
+_current = contextvars.ContextVar("request_log", default=None)
+
+
+class RequestLog:
+    def __init__(self, endpoint, request_id=None, client=None):
+        self.endpoint = endpoint
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.client = client
+        self.started = time.perf_counter()
+        # stage -> milliseconds, summed over repeated stages
+        self.stages = {}
+        self.status = None
+
+    def record(self, name, seconds):
+        self.stages[name] = round(self.stages.get(name, 0) + seconds * 1000, 1)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread."""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class EventLogger:
+    """
+    log.<level>(event, **fields). Debug events are kept with probability
+    `sample_rate`, and carry it as "sampled" so counts can be scaled back.
+    """
+
+    def __init__(self, name, sample_rate=1.0):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+
+    def _log(self, level, event, fields, exc_info=False):
+        if not self.logger.isEnabledFor(level):
+            return
+        request = _current.get()
+        # makeRecord skips Logger.log's stack walk for the caller's location
+        record = self.logger.makeRecord(
+            self.logger.name,
+            level,
+            "",
+            0,
+            event,
+            (),
+            sys.exc_info() if exc_info else None,
+            extra={
+                "fields": fields,
+                "request_id": request.request_id if request else None,
+            },
+        )
+        self.logger.handle(record)
+
+    def debug(self, event, **fields):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if self.sample_rate < 1:
+            if random.random() >= self.sample_rate:
+                return
+            fields["sampled"] = self.sample_rate
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        # Logs the exception being handled with its traceback
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+log = EventLogger("creek")
+_handler = None
+
+
+@contextmanager
+def request_context(endpoint, data=None):
+    """Scope of one request: its id for every record, and its stage timings."""
+    data = data if isinstance(data, dict) else {}
+    request = RequestLog(endpoint, data.get("request_id"), data.get("client_id"))
+    token = _current.set(request)
+    try:
+        yield request
+    finally:
+        fields = {
+            "endpoint": endpoint,
+            "status": request.status,
+            "ms": round((time.perf_counter() - request.started) * 1000, 1),
+            # A copy: threads of the request may still be finishing stages
+            "stages": dict(request.stages),
+        }
+        if request.client:
+            fields["client"] = request.client
+        log.info("request", **fields)
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Adds the time spent in the block to the current request's `name` stage."""
+    request = _current.get()
+    if request is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.record(name, time.perf_counter() - start)
+
+
+def record_stage(name, seconds):
+    request = _current.get()
+    if request is not None:
+        request.record(name, seconds)
+
+
+def dropped_records():
+    # Records lost to a full queue since logging_from_env()
+    return _handler.dropped if _handler else 0
+
+
+def logging_from_env():
+    """
+    Sends engine logs through the background writer, configured from
+    LOG_LEVEL (default: INFO) and LOG_SAMPLE (share of debug events kept,
+    default: 0.1). Returns the listener.
+    """
+    global _handler
+    records = queue.Queue(QUEUE_SIZE)
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter())
+    listener = QueueListener(records, writer)
+    _handler = BackgroundHandler(records)
+    log.logger.handlers = [_handler]
+    log.logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    log.logger.propagate = False
+    log.sample_rate = float(os.getenv("LOG_SAMPLE", "0.1"))
+    listener.start()
+    # Flushes queued records on exit
+    atexit.register(listener.stop)
+    return listener
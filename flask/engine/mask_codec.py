@@ -0,0 +1,110 @@
+import io
+import base64
+import numpy as np
+from PIL import Image
+
+# Response formats accepted by /asset via the "format" field
+MASK_FORMATS = ("image", "bitmap", "rle", "alpha")
+
+
+def mask_to_array(mask):
+    # Accepts a PIL "L" mask or a numpy array, returns a boolean HxW array
+    if isinstance(mask, Image.Image):
+        mask = np.array(mask)
+    return np.asarray(mask) > 0
+
+
+def mask_bbox(mask_bool):
+    """Tight [x1, y1, x2, y2] box (exclusive max) around the subject, or None."""
+    rows = np.any(mask_bool, axis=1)
+    cols = np.any(mask_bool, axis=0)
+    if not rows.any():
+        return None
+    y1, y2 = np.flatnonzero(rows)[[0, -1]]
+    x1, x2 = np.flatnonzero(cols)[[0, -1]]
+    return [int(x1), int(y1), int(x2) + 1, int(y2) + 1]
+
+
+def _crop(mask_bool, bbox):
+    if bbox is None:
+        return mask_bool[:0, :0]
+    x1, y1, x2, y2 = bbox
+    return mask_bool[y1:y2, x1:x2]
+
+
+def encode_mask_bitmap(mask_bool, bbox):
+    # 1 bit per pixel, MSB first, every row padded to a whole byte
+    crop = _crop(mask_bool, bbox)
+    packed = np.packbits(crop, axis=1, bitorder="big")
+    return {
+        "width": int(crop.shape[1]),
+        "height": int(crop.shape[0]),
+        "stride": int(packed.shape[1]),
+        "bitmap": base64.b64encode(packed.tobytes()).decode("utf-8"),
+    }
+
+
+def rle_counts(mask_bool):
+    # COCO convention: column-major runs, starting with a (possibly empty) zero run
+    flat = mask_bool.flatten(order="F").astype(np.uint8)
+    if flat.size == 0:
+        return []
+    change = np.flatnonzero(np.diff(flat)) + 1
+    bounds = np.concatenate(([0], change, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    if flat[0] == 1:
+        counts.insert(0, 0)
+    return counts
+
+
+def rle_counts_to_string(counts):
+    # Port of pycocotools' rleToString (LEB128-style, delta coded after index 2)
+    chars = []
+    for i, x in enumerate(counts):
+        if i > 2:
+            x -= counts[i - 2]
+        more = True
+        while more:
+            c = x & 0x1F
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def encode_mask_rle(mask_bool):
+    h, w = mask_bool.shape
+    return {
+        "rle": {"size": [h, w], "counts": rle_counts_to_string(rle_counts(mask_bool))}
+    }
+
+
+def encode_mask_alpha(mask_bool, bbox):
+    # Grayscale PNG of the bbox crop, ready to be used as an alpha channel
+    crop = _crop(mask_bool, bbox)
+    buffered = io.BytesIO()
+    if crop.size:
+        Image.fromarray(crop.astype(np.uint8) * 255).save(
+            buffered, format="PNG", optimize=True
+        )
+    return {"alpha": base64.b64encode(buffered.getvalue()).decode("utf-8")}
+
+
+def encode_mask_response(mask, fmt):
+    """Builds the mask-only part of an /asset response for a non-"image" format."""
+    mask_bool = mask_to_array(mask)
+    bbox = mask_bbox(mask_bool)
+    h, w = mask_bool.shape
+    result = {"format": fmt, "size": [w, h], "bbox": bbox}
+
+    if fmt == "bitmap":
+        result.update(encode_mask_bitmap(mask_bool, bbox))
+    elif fmt == "rle":
+        result.update(encode_mask_rle(mask_bool))
+    elif fmt == "alpha":
+        result.update(encode_mask_alpha(mask_bool, bbox))
+    else:
+        raise ValueError(f"Unsupported mask format: {fmt}")
+    return result
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from .logs import log
+
+# Results computed ahead of time for each new /images handle, in this order:
+#   caption - Florence-2 <DETAILED_CAPTION> with the /describe settings
+#   mask    - BiRefNet subject mask ("standard" mode of /asset)
+PRECOMPUTE_TASKS = ("caption", "mask")
+
+
+class Preempted(Exception):
+    pass
+
+
+class Precomputer:
+    """
+    Low-priority background queue filling the engine's result cache for
+    uploaded images, so the first /describe or /asset call on a handle is a
+    cache hit.
+
+    Work only starts once no foreground model request has run for
+    `idle_delay` seconds. A foreground request arriving mid-task preempts it:
+    Florence decoding stops at the next token, and the handle is retried
+    later. At most `budget` seconds of background compute are spent per
+    `window` seconds.
+    """
+
+    def __init__(
+        self,
+        tasks=PRECOMPUTE_TASKS,
+        budget=20.0,
+        window=60.0,
+        idle_delay=0.5,
+        max_queue=64,
+    ):
+        unknown = set(tasks) - set(PRECOMPUTE_TASKS)
+        if unknown:
+            raise ValueError(f"Unknown precompute tasks: {', '.join(unknown)}")
+        self.tasks = tuple(tasks)
+        self.budget = budget
+        self.window = window
+        self.idle_delay = idle_delay
+        self.max_queue = max_queue
+        self.engine = None
+        self.cond = threading.Condition()
+        # Pending handles, the most recent upload is served first
+        self.queue = OrderedDict()
+        self.active = 0
+        # A handle's tasks are being computed
+        self.working = False
+        self.last_foreground = 0.0
+        self.preempt = threading.Event()
+        # (finished at, seconds) of recent background work, for the budget
+        self.spent = deque()
+        self.counters = {
+            "completed": 0,
+            "preempted": 0,
+            "failed": 0,
+            "dropped": 0,
+            "compute_seconds": 0.0,
+        }
+
+    def attach(self, engine):
+        self.engine = engine
+        threading.Thread(target=self._run, name="precompute", daemon=True).start()
+
+    def submit(self, handle):
+        with self.cond:
+            self.queue.pop(handle, None)
+            self.queue[handle] = None
+            while len(self.queue) > self.max_queue:
+                self.queue.popitem(last=False)
+                self.counters["dropped"] += 1
+            self.cond.notify_all()
+
+    @contextmanager
+    def foreground(self):
+        """Marks a foreground model request; background work yields to it."""
+        with self.cond:
+            self.active += 1
+            self.preempt.set()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                if not self.active:
+                    self.preempt.clear()
+                    self.last_foreground = time.monotonic()
+                self.cond.notify_all()
+
+    @contextmanager
+    def paused(self):
+        """Like foreground(), but also waits for the running task to finish."""
+        with self.foreground():
+            with self.cond:
+                while self.working:
+                    self.cond.wait()
+            yield
+
+    def check(self):
+        # Checkpoint for background tasks, raises once a foreground request arrives
+        if self.preempt.is_set():
+            raise Preempted()
+
+    def _budget_left(self, now):
+        while self.spent and self.spent[0][0] <= now - self.window:
+            self.spent.popleft()
+        return self.budget - sum(seconds for _, seconds in self.spent)
+
+    def _next(self):
+        # Blocks until a handle is queued, the models are idle and budget is left
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                idle_for = now - self.last_foreground
+                if not self.queue or self.active:
+                    self.cond.wait()
+                elif idle_for < self.idle_delay:
+                    self.cond.wait(self.idle_delay - idle_for)
+                elif self._budget_left(now) <= 0:
+                    self.cond.wait(self.spent[0][0] + self.window - now)
+                else:
+                    self.working = True
+                    return self.queue.popitem(last=True)[0]
+
+    def _run(self):
+        while True:
+            handle = self._next()
+            for task in self.tasks:
+                start = time.monotonic()
+                try:
+                    self.check()
+                    self.engine.precompute_task(handle, task)
+                    self.counters["completed"] += 1
+                except Preempted:
+                    self.counters["preempted"] += 1
+                    with self.cond:
+                        self.queue.setdefault(handle, None)
+                    break
+                except Exception as e:
+                    log.warning(
+                        "precompute.failed", task=task, handle=handle[:19], error=str(e)
+                    )
+                    self.counters["failed"] += 1
+                finally:
+                    now = time.monotonic()
+                    with self.cond:
+                        self.spent.append((now, now - start))
+                        self.counters["compute_seconds"] += now - start
+            with self.cond:
+                self.working = False
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                **self.counters,
+                "compute_seconds": round(self.counters["compute_seconds"], 3),
+                "queued": len(self.queue),
+                "budget_left": round(self._budget_left(time.monotonic()), 3),
+            }
+
+
+def precompute_from_env():
+    """
+    Precomputer configured from PRECOMPUTE_* environment variables, or None
+    when PRECOMPUTE_TASKS is empty.
+    """
+    tasks = os.getenv("PRECOMPUTE_TASKS", ",".join(PRECOMPUTE_TASKS))
+    tasks = [task.strip() for task in tasks.split(",") if task.strip()]
+    if not tasks:
+        return None
+    return Precomputer(tasks, budget=float(os.getenv("PRECOMPUTE_BUDGET", "20")))
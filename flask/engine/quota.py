@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+# Requests are attributed to the "client_id" of their payload, which the
+# front-ends always set to the caller's address (never the client's own value).
+# Each client has a token bucket refilled at `rate` cost units per second,
+# holding at most `burst` units, and a weight for its share of the local
+# models (see scheduler.py).
+ANONYMOUS = "anonymous"
+
+# Cost units per request, by engine handler. Roughly GPU or provider time:
+# one /inpainting costs as much as 50 /describe calls
+DEFAULT_COSTS = {
+    "describe": 1,
+    "asset": 5,
+    "generate": 50,
+    "inpaint": 50,
+    "inpaint_remote": 50,
+    "sketch_remote": 20,
+}
+# Idle clients beyond this many are forgotten, full buckets first
+MAX_CLIENTS = 10000
+# Clients listed by /stats, heaviest first
+STATS_CLIENTS = 100
+
+Quota = namedtuple("Quota", ["rate", "burst", "weight"])
+
+
+def client_of(data):
+    return str(data.get("client_id") or ANONYMOUS)[:128]
+
+
+class QuotaManager:
+    """
+    Per-client token buckets weighted by endpoint cost. `rate` None means
+    unlimited: requests are still counted per client. `clients` maps client
+    ids to their own Quota.
+    """
+
+    def __init__(self, rate=None, burst=500.0, costs=None, clients=None):
+        self.default = Quota(rate, burst, 1.0)
+        self.costs = {**DEFAULT_COSTS, **(costs or {})}
+        self.quotas = clients or {}
+        self.lock = threading.Lock()
+        # client -> {"tokens", "updated", "requests", "cost", "limited"}
+        self.clients = OrderedDict()
+
+    def quota(self, client):
+        return self.quotas.get(client, self.default)
+
+    def weight(self, client):
+        return self.quota(client).weight
+
+    def _refill(self, bucket, quota, now):
+        if quota.rate is not None:
+            bucket["tokens"] = min(
+                quota.burst, bucket["tokens"] + (now - bucket["updated"]) * quota.rate
+            )
+        bucket["updated"] = now
+
+    def _forget_idle(self, now):
+        for client, bucket in list(self.clients.items()):
+            if len(self.clients) <= MAX_CLIENTS:
+                break
+            quota = self.quota(client)
+            self._refill(bucket, quota, now)
+            if quota.rate is None or bucket["tokens"] >= quota.burst:
+                del self.clients[client]
+        while len(self.clients) > MAX_CLIENTS:
+            self.clients.popitem(last=False)
+
+    def take(self, client, endpoint, count=1):
+        """
+        Charges the cost of `count` images (or calls) of `endpoint` to the
+        client. Returns (admitted, seconds
+        until the bucket holds enough tokens, None if it never refills).
+        """
+        quota = self.quota(client)
+        cost = self.costs.get(endpoint, 1) * count
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.clients.get(client)
+            if bucket is None:
+                bucket = {"tokens": quota.burst, "updated": now}
+                bucket.update(requests=0, cost=0, limited=0)
+                self.clients[client] = bucket
+                self._forget_idle(now)
+            self.clients.move_to_end(client)
+            self._refill(bucket, quota, now)
+            # A request costing more than the burst waits for a full bucket
+            needed = min(cost, quota.burst)
+            if quota.rate is not None and bucket["tokens"] < needed:
+                bucket["limited"] += 1
+                if quota.rate <= 0:
+                    return False, None
+                return False, (needed - bucket["tokens"]) / quota.rate
+            if quota.rate is not None:
+                bucket["tokens"] -= cost
+            bucket["requests"] += 1
+            bucket["cost"] += cost
+            return True, 0.0
+
+    def stats(self):
+        with self.lock:
+            heaviest = sorted(
+                self.clients.items(), key=lambda item: item[1]["cost"], reverse=True
+            )[:STATS_CLIENTS]
+            return {
+                "rate": self.default.rate,
+                "burst": self.default.burst,
+                "tracked": len(self.clients),
+                "limited": sum(b["limited"] for b in self.clients.values()),
+                "clients": {
+                    client: {
+                        "requests": bucket["requests"],
+                        "cost": bucket["cost"],
+                        "limited": bucket["limited"],
+                        "tokens": round(bucket["tokens"], 1),
+                        "weight": self.weight(client),
+                    }
+                    for client, bucket in heaviest
+                },
+            }
+
+
+def parse_costs(value):
+    # "inpaint=50,describe=1"
+    costs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        endpoint, cost = item.split("=")
+        costs[endpoint.strip()] = float(cost)
+    return costs
+
+
+def parse_clients(value, default):
+    # "alice=10:1000:2,bob=1:100,vip=::4" - client=rate:burst[:weight],
+    # an empty rate being unlimited
+    quotas = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        client, spec = item.split("=")
+        client, fields = client.strip(), spec.split(":")
+        weight = float(fields[2]) if len(fields) > 2 else default.weight
+        # The fair queue divides by the weight (see scheduler.py)
+        if weight <= 0:
+            raise ValueError(f"Weight of quota client {client} must be > 0: {weight}")
+        quotas[client] = Quota(
+            float(fields[0]) if fields[0] else None,
+            float(fields[1]) if len(fields) > 1 and fields[1] else default.burst,
+            weight,
+        )
+    return quotas
+
+
+def quota_manager_from_env():
+    """QuotaManager configured from QUOTA_* environment variables."""
+    rate = os.getenv("QUOTA_RATE")
+    default = Quota(
+        float(rate) if rate else None, float(os.getenv("QUOTA_BURST", "500")), 1.0
+    )
+    return QuotaManager(
+        rate=default.rate,
+        burst=default.burst,
+        costs=parse_costs(os.getenv("QUOTA_COSTS", "")),
+        clients=parse_clients(os.getenv("QUOTA_CLIENTS", ""), default),
+    )
@@ -0,0 +1,69 @@
+import io
+import base64
+from PIL import Image, ImageChops, ImageFilter
+
+from .images import decode_base64_image, encode_image_to_base64
+from .mask_codec import mask_bbox, mask_to_array
+
+# "response" field of /inpainting and /inpainting-api:
+#   "image"  - the full regenerated image (default)
+#   "region" - only the changed region, for the client to composite
+RESPONSE_MODES = ("image", "region")
+
+# Soft edge of the blend mask, in working-size pixels
+FEATHER = 4
+
+
+def region_delta(result, mask, canvas_size, feather=FEATHER):
+    """
+    Crops an inpainting result to the masked area. `result` and `mask` are
+    at the working size, `canvas_size` is the size of the client's canvas.
+    "image" and "blend_mask" keep the working resolution; the client scales
+    them to "bbox" (canvas pixels) and pastes "image" using "blend_mask" as
+    alpha.
+    """
+    if mask.size != result.size:
+        mask = mask.resize(result.size, Image.NEAREST)
+    canvas_w, canvas_h = canvas_size
+    response = {"format": "region", "size": [canvas_w, canvas_h], "bbox": None}
+    bbox = mask_bbox(mask_to_array(mask))
+    if bbox is None:
+        return response
+
+    # Leave room for the feathered edge
+    pad = 2 * feather
+    box = (
+        max(bbox[0] - pad, 0),
+        max(bbox[1] - pad, 0),
+        min(bbox[2] + pad, result.width),
+        min(bbox[3] + pad, result.height),
+    )
+    sx, sy = canvas_w / result.width, canvas_h / result.height
+    # Opaque inside the mask, fading out over `feather` pixels around it
+    blend = ImageChops.lighter(mask, mask.filter(ImageFilter.GaussianBlur(feather)))
+    response.update(
+        bbox=[
+            round(box[0] * sx),
+            round(box[1] * sy),
+            round(box[2] * sx),
+            round(box[3] * sy),
+        ],
+        image=encode_image_to_base64(result.crop(box)),
+        blend_mask=encode_image_to_base64(blend.crop(box)),
+    )
+    return response
+
+
+def composite_region(canvas, response):
+    """Client-side reference: applies a region response to the full canvas."""
+    if response["bbox"] is None:
+        return canvas
+    x0, y0, x1, y1 = response["bbox"]
+    region = decode_base64_image(response["image"])
+    blend = Image.open(io.BytesIO(base64.b64decode(response["blend_mask"])))
+    canvas = canvas.copy()
+    size = (x1 - x0, y1 - y0)
+    canvas.paste(
+        region.resize(size, Image.LANCZOS), (x0, y0), blend.resize(size, Image.BILINEAR)
+    )
+    return canvas
@@ -0,0 +1,144 @@
+import io
+import os
+import requests
+from PIL import Image
+
+from .logs import log
+
+# --- FAL.AI IMPORTS ---
+try:
+    import fal_client
+
+    if os.getenv("FAL_KEY"):
+        FAL_AVAILABLE = True
+    else:
+        print("⚠️ Warning: FAL_KEY not found in environment variables.")
+        FAL_AVAILABLE = False
+except ImportError:
+    print("⚠️ Fal.ai Client not installed. /inpainting-api will fail.")
+    FAL_AVAILABLE = False
+
+INPAINT_MODEL = "fal-ai/flux-lora-fill"
+
+# /sketch-api "option" -> (label, model, arguments without the prompt)
+SKETCH_MODELS = {
+    1: (
+        "🍌 Using Nano Banana",
+        "fal-ai/nano-banana",
+        {"num_images": 1, "aspect_ratio": "1:1", "output_format": "png"},
+    ),
+    2: (
+        "🚀 Using Flux Dev",
+        "fal-ai/flux/dev",
+        {
+            "image_size": "square_hd",
+            "num_inference_steps": 28,
+            "guidance_scale": 3.5,
+            "safety_tolerance": "2",
+            "enable_safety_checker": False,
+        },
+    ),
+}
+
+# Equivalent /sketch-api model that a slow request is hedged with (hedging.py)
+SKETCH_ALTERNATES = {
+    "fal-ai/nano-banana": "fal-ai/flux/dev",
+    "fal-ai/flux/dev": "fal-ai/nano-banana",
+}
+# Approximate fal.ai price per generation in USD, for hedging cost tracking
+MODEL_COSTS = {"fal-ai/nano-banana": 0.039, "fal-ai/flux/dev": 0.025}
+
+
+def sketch_alternate(model_id, arguments):
+    """(model, arguments) of the same sketch on the alternate model, or None."""
+    alternate = SKETCH_ALTERNATES.get(model_id)
+    for _, candidate, defaults in SKETCH_MODELS.values():
+        if candidate == alternate:
+            return candidate, {**defaults, "prompt": arguments["prompt"]}
+    return None
+
+
+def upload_image(img):
+    # PNG upload straight from memory, no temporary files
+    return fal_client.upload_image(img, format="png")
+
+
+def png_bytes(img):
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def inpaint_arguments(prompt, image_url, mask_url):
+    return {
+        "prompt": prompt,
+        "image_url": image_url,
+        "mask_url": mask_url,
+        "guidance_scale": 30,
+        "num_inference_steps": 28,
+        "enable_safety_checker": False,
+    }
+
+
+def submit(model_id, arguments):
+    """Runs a fal.ai request to completion and returns its result dict."""
+    return fal_client.submit(model_id, arguments=arguments).get()
+
+
+def start(model_id, arguments):
+    # Queued fal.ai request handle: .get() waits for the result
+    return fal_client.submit(model_id, arguments=arguments)
+
+
+def cancel(handle):
+    handle.cancel()
+
+
+def first_image_url(result):
+    if "images" in result and len(result["images"]) > 0:
+        return result["images"][0]["url"]
+    return None
+
+
+def download_image(url):
+    # Returns the RGB image, or None if the download failed
+    response = requests.get(url)
+    if response.status_code != 200:
+        log.warning("remote.download_failed", status=response.status_code)
+        return None
+    return open_image(response.content)
+
+
+def open_image(content):
+    return Image.open(io.BytesIO(content)).convert("RGB")
+
+
+# ==============================================================================
+# ASYNC VARIANTS (engine/aio.py)
+# ==============================================================================
+# Same calls without blocking a thread while waiting on fal.ai. Only I/O
+# happens here; PNG encoding/decoding is left to the caller's executor.
+async def upload_png_async(data):
+    return await fal_client.upload_async(data, "image/png")
+
+
+async def submit_async(model_id, arguments):
+    handle = await fal_client.submit_async(model_id, arguments=arguments)
+    return await handle.get()
+
+
+async def start_async(model_id, arguments):
+    return await fal_client.submit_async(model_id, arguments=arguments)
+
+
+async def cancel_async(handle):
+    await handle.cancel()
+
+
+async def download_async(client, url):
+    # Returns the raw bytes, or None if the download failed
+    response = await client.get(url)
+    if response.status_code != 200:
+        log.warning("remote.download_failed", status=response.status_code)
+        return None
+    return response.content
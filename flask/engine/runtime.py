@@ -0,0 +1,188 @@
+import os
+import torch
+
+from .birefnet_onnx import OnnxBiRefNet
+from .diffusion import TieredPipeline
+from .generation_cache import weights_id
+from .segmentation import BIREFNET_DIR, TorchBiRefNet, import_birefnet
+
+# --- FLORENCE-2 IMPORTS ---
+try:
+    import bitsandbytes
+    from transformers import AutoModelForCausalLM, AutoProcessor, BitsAndBytesConfig
+    import transformers.dynamic_module_utils
+    import torch.nn as nn
+
+    FLORENCE_AVAILABLE = True
+except ImportError as e:
+    print(
+        f"⚠️ Florence-2 Disabled: {e} (Ensure 'bitsandbytes' and 'transformers' are installed)"
+    )
+    FLORENCE_AVAILABLE = False
+except Exception as e:
+    print(f"⚠️ Florence-2 Disabled: Unexpected initialization error: {e}")
+    FLORENCE_AVAILABLE = False
+
+# --- IMPORT STABLE DIFFUSION ---
+try:
+    from diffusers import StableDiffusionInpaintPipeline
+except ImportError:
+    print("⚠️ Diffusers not found. SD features disabled.")
+    StableDiffusionInpaintPipeline = None
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ModelRuntime:
+    """
+    Loads and owns the models shared by every front-end. What differs between
+    deployments is passed in rather than hard-coded:
+
+      placement        - "offload" (model CPU offload, local server) or
+                         "device" (everything resident on `device`, Modal)
+      birefnet_backend - "torch" or "onnx" (see birefnet_onnx.py)
+    """
+
+    def __init__(
+        self,
+        device=None,
+        placement="offload",
+        sd_path=None,
+        florence_path=os.path.join(current_dir, "Florence-2-4bit-Quantized"),
+        birefnet_dir=BIREFNET_DIR,
+        birefnet_backend="torch",
+        birefnet_onnx_int8=False,
+        local_files_only=False,
+    ):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.placement = placement
+        self.sd_path = sd_path or (
+            "./local_inpainting_model"
+            if os.path.exists("./local_inpainting_model")
+            else "runwayml/stable-diffusion-inpainting"
+        )
+        self.florence_path = florence_path
+        self.birefnet_dir = birefnet_dir
+        self.birefnet_backend_name = birefnet_backend
+        self.birefnet_onnx_int8 = birefnet_onnx_int8
+        self.local_files_only = local_files_only
+
+        self.sd_pipe = None
+        self.sd_tiered = None
+        # Identifies the loaded SD weights across restarts (see generation_cache.py)
+        self.sd_weights = None
+        self.birefnet = None
+        self.florence_model = None
+        self.florence_processor = None
+        # Bumped when a model is replaced (see hotswap.py), so results cached
+        # under the old weights are never served
+        self.versions = {"sd": 1, "birefnet": 1, "florence": 1}
+
+    def load(self):
+        print(f"🚀 Running on device: {self.device}")
+        self.load_sd()
+        self.load_birefnet()
+        self.load_florence()
+        return self
+
+    # ==========================================================================
+    # 1. LOAD STABLE DIFFUSION
+    # ==========================================================================
+    def load_sd(self):
+        print("⏳ Loading Stable Diffusion (Inpainting)...")
+        if not StableDiffusionInpaintPipeline:
+            return
+        try:
+            sd_pipe = StableDiffusionInpaintPipeline.from_pretrained(
+                self.sd_path,
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                use_safetensors=True,
+                local_files_only=self.local_files_only,
+            ).to(self.device)
+            sd_pipe.enable_attention_slicing()
+            if self.placement == "offload":
+                sd_pipe.enable_model_cpu_offload()
+            self.sd_pipe = sd_pipe
+            self.sd_tiered = TieredPipeline(sd_pipe)
+            self.sd_weights = weights_id(self.sd_path)
+            print("✅ Stable Diffusion Loaded!")
+        except Exception as e:
+            print(f"❌ Failed to load SD: {e}")
+
+    # ==========================================================================
+    # 2. LOAD BIREFNET
+    # ==========================================================================
+    def load_birefnet(self):
+        print("⏳ Loading BiRefNet...")
+        weights = os.path.join(self.birefnet_dir, "birefnet_fp16.pt")
+        try:
+            if self.birefnet_backend_name == "onnx":
+                self.birefnet = OnnxBiRefNet(
+                    os.path.join(self.birefnet_dir, "onnx"),
+                    quantized=self.birefnet_onnx_int8,
+                )
+                print(
+                    f"✅ BiRefNet ONNX Sessions Ready! (sizes: {self.birefnet.sizes})"
+                )
+            elif os.path.exists(weights):
+                BiRefNet = import_birefnet(self.birefnet_dir)
+                model = BiRefNet(bb_pretrained=False)
+                state_dict = torch.load(weights, map_location=self.device)
+                model.load_state_dict(state_dict)
+                model.to(self.device)
+                if self.device == "cuda":
+                    model.half()
+                model.eval()
+                self.birefnet = TorchBiRefNet(model, self.device)
+                print("✅ BiRefNet Weights Loaded!")
+            else:
+                print(f"⚠️ BiRefNet skipped. Weights not found at: {weights}")
+        except Exception as e:
+            print(f"❌ Failed to load BiRefNet: {e}")
+
+    # ==========================================================================
+    # 3. LOAD FLORENCE-2 (QUANTIZED)
+    # ==========================================================================
+    def load_florence(self):
+        print("⏳ Loading Florence-2...")
+        if not FLORENCE_AVAILABLE:
+            return
+        try:
+            transformers.dynamic_module_utils.check_imports = lambda filename: []
+
+            # Patch for _supports_sdpa
+            _old_getattr = nn.Module.__getattr__
+
+            def _fixed_getattr(self, name):
+                if name == "_supports_sdpa":
+                    return False
+                return _old_getattr(self, name)
+
+            nn.Module.__getattr__ = _fixed_getattr
+
+            if not os.path.exists(self.florence_path):
+                print(f"⚠️ Florence-2 folder not found at: {self.florence_path}")
+                return
+
+            bnb_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=torch.float16,
+            )
+            self.florence_model = AutoModelForCausalLM.from_pretrained(
+                self.florence_path,
+                quantization_config=bnb_config,
+                trust_remote_code=True,
+                device_map=self.device,
+                local_files_only=True,
+            )
+            self.florence_processor = AutoProcessor.from_pretrained(
+                self.florence_path, trust_remote_code=True, local_files_only=True
+            )
+            print("✅ Florence-2 Loaded Successfully!")
+        except Exception as e:
+            print(f"❌ Failed to load Florence-2: {e}")
+
+    @property
+    def florence_ready(self):
+        return self.florence_model is not None and self.florence_processor is not None
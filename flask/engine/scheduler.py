@@ -0,0 +1,180 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+from .cancel import Cancelled
+from .logs import log
+
+# Requests without a deadline are ordered as if due this many seconds after
+# arrival, so a stream of urgent requests cannot starve them
+DEFAULT_SLACK = 30.0
+# Clients whose fair-share backlog is over are forgotten beyond this many
+MAX_CLIENTS = 10000
+# Weight of the latest run in the per-service latency estimate
+ESTIMATE_ALPHA = 0.3
+
+
+class Scheduler:
+    """
+    Earliest-deadline-first admission to the local models, which run at most
+    `slots` requests at a time.
+
+    Service times are measured per service (endpoint plus quality tier or
+    mode) as an exponentially weighted average. A request with a deadline
+    (see cancel.py) is dropped with Cancelled("deadline") as soon as that
+    estimate says it cannot finish in time: on arrival, given the work
+    queued ahead of it, and again when it reaches the front of the queue.
+
+    Requests without a deadline are shared fairly between clients (weighted
+    fair queuing): each client's requests are due one after another, every
+    one taking its estimated service time divided by the client's weight,
+    so a client queueing a batch only delays its own later requests.
+    """
+
+    def __init__(self, slots=1):
+        self.slots = slots
+        self.cond = threading.Condition()
+        # (due, sequence, (service, token)) of queued requests
+        self.queue = []
+        self.sequence = itertools.count()
+        # token -> (service, started at)
+        self.running = {}
+        self.estimates = {}
+        # client -> end of its fair-share backlog (time.monotonic())
+        self.backlogs = {}
+        self.counters = {"completed": 0, "met": 0, "missed": 0, "dropped": 0}
+        # While set, queued requests are held back (see exclusive)
+        self.paused = 0
+
+    def _estimate(self, service):
+        return self.estimates.get(service, 0.0)
+
+    def _backlog(self, due, now):
+        # Expected seconds until a request due at `due` can start
+        running = sum(
+            max(self._estimate(service) - (now - started), 0.0)
+            for service, started in self.running.values()
+        )
+        queued = sum(
+            self._estimate(service)
+            for queued_due, _, (service, _) in self.queue
+            if queued_due <= due
+        )
+        return (running + queued) / self.slots
+
+    def _drop(self, service):
+        self.counters["dropped"] += 1
+        log.warning("scheduler.dropped", service=service)
+        return Cancelled("deadline")
+
+    def _missed_deadline(self, error):
+        return isinstance(error, Cancelled) and error.reason == "deadline"
+
+    def _fair_due(self, service, client, weight, now):
+        start = max(now, self.backlogs.get(client, now))
+        self.backlogs[client] = start + self._estimate(service) / weight
+        if len(self.backlogs) > MAX_CLIENTS:
+            for other, end in list(self.backlogs.items()):
+                if end <= now:
+                    del self.backlogs[other]
+        return start + DEFAULT_SLACK
+
+    @contextmanager
+    def slot(self, service, cancel, client=None, weight=1.0):
+        """Blocks until the request `cancel` may run `service` on the models."""
+        deadline = cancel.deadline
+        now = time.monotonic()
+
+        with self.cond:
+            due = deadline
+            if due is None:
+                due = self._fair_due(service, client, weight, now)
+            entry = (due, next(self.sequence), (service, cancel))
+            if deadline is not None:
+                backlog = self._backlog(due, now)
+                if now + backlog + self._estimate(service) > deadline:
+                    raise self._drop(service)
+            heapq.heappush(self.queue, entry)
+            try:
+                while True:
+                    cancel.check()
+                    free = not self.paused and len(self.running) < self.slots
+                    if free and self.queue[0] is entry:
+                        break
+                    # Woken on every release, and periodically to see cancels
+                    self.cond.wait(0.25)
+            except BaseException as e:
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+                if self._missed_deadline(e):
+                    self.counters["missed"] += 1
+                self.cond.notify_all()
+                raise
+            heapq.heappop(self.queue)
+            started = time.monotonic()
+            if deadline is not None and started + self._estimate(service) > deadline:
+                self.cond.notify_all()
+                raise self._drop(service)
+            self.running[cancel] = (service, started)
+
+        try:
+            yield
+        except BaseException as e:
+            with self.cond:
+                del self.running[cancel]
+                if self._missed_deadline(e):
+                    self.counters["missed"] += 1
+                self.cond.notify_all()
+            raise
+
+        finished = time.monotonic()
+        with self.cond:
+            del self.running[cancel]
+            elapsed = finished - started
+            previous = self.estimates.get(service)
+            self.estimates[service] = (
+                elapsed
+                if previous is None
+                else ESTIMATE_ALPHA * elapsed + (1 - ESTIMATE_ALPHA) * previous
+            )
+            self.counters["completed"] += 1
+            if deadline is not None:
+                self.counters["met" if finished <= deadline else "missed"] += 1
+            self.cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        """Waits for the running requests to finish and holds off new ones."""
+        with self.cond:
+            self.paused += 1
+            while self.running:
+                self.cond.wait()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.paused -= 1
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                **self.counters,
+                "queued": len(self.queue),
+                "running": len(self.running),
+                "clients_backlogged": sum(
+                    end > time.monotonic() for end in self.backlogs.values()
+                ),
+                "estimates_ms": {
+                    service: round(seconds * 1000, 1)
+                    for service, seconds in sorted(self.estimates.items())
+                },
+            }
+
+
+def scheduler_from_env():
+    """Scheduler running MODEL_SLOTS requests at a time (default 1)."""
+    return Scheduler(slots=int(os.getenv("MODEL_SLOTS", "1")))
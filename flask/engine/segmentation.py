@@ -0,0 +1,161 @@
+import os
+import sys
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+# Resolution policies for BiRefNet, selected via the "mode" field of /asset:
+#   fast     - 512px single pass, for thumbnails and previews
+#   standard - 1024px single pass (the model's native resolution)
+#   tiled    - native-resolution 1024px tiles with blended overlaps, for large images
+BIREFNET_MODES = ("fast", "standard", "tiled")
+BIREFNET_MODE_SIZES = {"fast": 512, "standard": 1024, "tiled": 1024}
+TILE_OVERLAP = 192
+TILE_BATCH = 4
+
+# The BiRefNet repository is cloned next to the servers (see README)
+BIREFNET_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "BiRefNet"
+)
+
+_transforms = {}
+
+
+def import_birefnet(birefnet_dir=BIREFNET_DIR):
+    """Imports the BiRefNet class from a clone of the BiRefNet repository."""
+    if birefnet_dir not in sys.path:
+        sys.path.append(birefnet_dir)
+    try:
+        from models.birefnet import BiRefNet
+    except ImportError:
+        import BiRefNet.models.birefnet as brn
+
+        BiRefNet = brn.BiRefNet
+    return BiRefNet
+
+
+def birefnet_transform(size):
+    if size not in _transforms:
+        _transforms[size] = transforms.Compose(
+            [
+                transforms.Resize((size, size)),
+                transforms.ToTensor(),
+                transforms.Normalize(
+                    mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]
+                ),
+            ]
+        )
+    return _transforms[size]
+
+
+class TorchBiRefNet:
+    """Eager PyTorch backend; runs in the dtype the weights were loaded in."""
+
+    name = "torch"
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+        self.dtype = next(model.parameters()).dtype
+
+    def predict(self, batch, size):
+        # batch: normalized float32 NCHW tensor, returns NxHxW float32 probabilities
+        with torch.no_grad():
+            preds = self.model(batch.to(self.device, self.dtype))
+        if isinstance(preds, (list, tuple)):
+            preds = preds[-1]
+        return preds.float().sigmoid().cpu().numpy()[:, 0]
+
+
+def _predict_batch(backend, images, size):
+    # Returns one float32 probability map per image, at model resolution
+    batch = torch.stack([birefnet_transform(size)(img) for img in images])
+    return list(backend.predict(batch, size))
+
+
+def predict_probability(backend, image, size=1024):
+    """Single-pass BiRefNet probability map resized to the original image size."""
+    prob = _predict_batch(backend, [image], size)[0]
+    return cv2.resize(prob, image.size, interpolation=cv2.INTER_LINEAR)
+
+
+def _tile_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def _ramp(length, overlap, fade_start, fade_end):
+    # 1D blending weight: linear fade over the overlap on interior edges only
+    weight = np.ones(length, dtype=np.float32)
+    fade = min(overlap, length)
+    ramp = np.linspace(1.0 / (fade + 1), 1.0, fade, dtype=np.float32)
+    if fade_start:
+        weight[:fade] = ramp
+    if fade_end:
+        weight[-fade:] = np.minimum(weight[-fade:], ramp[::-1])
+    return weight
+
+
+def predict_tiled(backend, image, tile=1024, overlap=TILE_OVERLAP):
+    """
+    Runs BiRefNet on overlapping native-resolution tiles and blends the seams,
+    keeping thin structures that a single 1024px pass would lose.
+    """
+    w, h = image.size
+    if max(w, h) <= tile:
+        return predict_probability(backend, image, tile)
+
+    xs = _tile_starts(w, tile, overlap)
+    ys = _tile_starts(h, tile, overlap)
+    boxes = [(x, y, min(x + tile, w), min(y + tile, h)) for y in ys for x in xs]
+
+    accum = np.zeros((h, w), dtype=np.float32)
+    weights = np.zeros((h, w), dtype=np.float32)
+
+    for i in range(0, len(boxes), TILE_BATCH):
+        chunk = boxes[i : i + TILE_BATCH]
+        crops = [image.crop(box) for box in chunk]
+        probs = _predict_batch(backend, crops, tile)
+
+        for (x1, y1, x2, y2), prob in zip(chunk, probs):
+            tw, th = x2 - x1, y2 - y1
+            prob = cv2.resize(prob, (tw, th), interpolation=cv2.INTER_LINEAR)
+            wy = _ramp(th, overlap, y1 > 0, y2 < h)
+            wx = _ramp(tw, overlap, x1 > 0, x2 < w)
+            weight = np.outer(wy, wx)
+            accum[y1:y2, x1:x2] += prob * weight
+            weights[y1:y2, x1:x2] += weight
+
+    return accum / np.maximum(weights, 1e-6)
+
+
+def resolve_mode(backend, mode):
+    """
+    `mode`, or "standard" when the backend has no graph for the mode's input
+    size (an ONNX export without 512px). None when neither is available.
+    """
+    sizes = getattr(backend, "sizes", None)
+    if sizes is None or BIREFNET_MODE_SIZES[mode] in sizes:
+        return mode
+    if BIREFNET_MODE_SIZES["standard"] in sizes:
+        return "standard"
+    return None
+
+
+def run_birefnet(backend, image, mode="standard"):
+    """Probability map (HxW float32 in [0, 1]) for the chosen resolution policy."""
+    if mode not in BIREFNET_MODES:
+        raise ValueError(f"Unsupported BiRefNet mode: {mode}")
+    if mode == "tiled":
+        return predict_tiled(backend, image)
+    return predict_probability(backend, image, BIREFNET_MODE_SIZES[mode])
+
+
+def probability_to_mask(prob, thresh=0.5):
+    return Image.fromarray((prob > thresh).astype(np.uint8) * 255)
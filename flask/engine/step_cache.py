@@ -0,0 +1,192 @@
+"""
+DeepCache-style feature reuse across denoising steps.
+
+Adjacent steps produce nearly identical deep UNet features, so on a "full"
+step the whole UNet runs and the input to the last `depth` up blocks is kept.
+The following `interval - 1` steps only run conv_in, the shallow down blocks
+and those shallow up blocks, reusing the cached deep feature.
+"""
+
+from diffusers.models.unets.unet_2d_condition import UNet2DConditionOutput
+
+DEFAULT_INTERVAL = 3
+DEFAULT_DEPTH = 1
+
+
+class StepCache:
+    """
+    Context manager that patches a UNet2DConditionModel for one pipeline run:
+
+        with StepCache(pipe.unet, interval=3):
+            image = pipe(...).images[0]
+
+    Only the plain text-conditioned UNet is supported (no class/addition
+    embeddings, ControlNet or adapter residuals), which covers SD 1.x inpainting.
+    """
+
+    def __init__(self, unet, interval=DEFAULT_INTERVAL, depth=DEFAULT_DEPTH):
+        if interval < 1:
+            raise ValueError("interval must be >= 1")
+        if not 1 <= depth < len(unet.up_blocks):
+            raise ValueError(f"depth must be in [1, {len(unet.up_blocks) - 1}]")
+        config = unet.config
+        if config.class_embed_type or config.addition_embed_type:
+            raise ValueError("StepCache does not support class/addition embeddings")
+
+        self.unet = unet
+        self.interval = interval
+        self.depth = depth
+        self.full_steps = 0
+        self.cached_steps = 0
+        # Residuals consumed by the shallow up blocks (the first ones produced)
+        self.shallow_res = sum(len(b.resnets) for b in unet.up_blocks[-depth:])
+
+    def __enter__(self):
+        # accelerate's offload hooks call `_old_forward`; patch that when present
+        self.step = 0
+        self.cached = None
+        self._attr = "_old_forward" if hasattr(self.unet, "_old_forward") else "forward"
+        self._original = self.unet.__dict__.get(self._attr)
+        setattr(self.unet, self._attr, self.forward)
+        return self
+
+    def __exit__(self, *exc):
+        if self._original is None:
+            delattr(self.unet, self._attr)
+        else:
+            setattr(self.unet, self._attr, self._original)
+        self.cached = None
+        return False
+
+    def _run_block(self, block, sample, emb, encoder_hidden_states, kwargs, **extra):
+        if getattr(block, "has_cross_attention", False):
+            return block(
+                hidden_states=sample,
+                temb=emb,
+                encoder_hidden_states=encoder_hidden_states,
+                cross_attention_kwargs=kwargs.get("cross_attention_kwargs"),
+                **extra,
+            )
+        return block(hidden_states=sample, temb=emb, **extra)
+
+    def forward(
+        self, sample, timestep, encoder_hidden_states, return_dict=True, **kwargs
+    ):
+        unet = self.unet
+        full = self.cached is None or self.step % self.interval == 0
+        self.step += 1
+
+        forward_upsample_size = any(
+            dim % 2**unet.num_upsamplers != 0 for dim in sample.shape[-2:]
+        )
+
+        if unet.config.center_input_sample:
+            sample = 2 * sample - 1.0
+
+        t_emb = unet.get_time_embed(sample=sample, timestep=timestep)
+        emb = unet.time_embedding(t_emb, kwargs.get("timestep_cond"))
+        if unet.time_embed_act is not None:
+            emb = unet.time_embed_act(emb)
+
+        sample = unet.conv_in(sample)
+        res_samples = (sample,)
+
+        down_blocks = unet.down_blocks
+        if not full:
+            # Only the blocks producing the residuals of the shallow up blocks
+            needed, count = 0, 1
+            while count < self.shallow_res:
+                count += len(down_blocks[needed].resnets) + (
+                    1 if down_blocks[needed].downsamplers else 0
+                )
+                needed += 1
+            down_blocks = down_blocks[:needed]
+
+        for block in down_blocks:
+            sample, res = self._run_block(
+                block, sample, emb, encoder_hidden_states, kwargs
+            )
+            res_samples += res
+
+        up_blocks = unet.up_blocks
+        split = len(up_blocks) - self.depth
+
+        if full:
+            if unet.mid_block is not None:
+                sample = self._run_mid(sample, emb, encoder_hidden_states, kwargs)
+            for block in up_blocks[:split]:
+                res = res_samples[-len(block.resnets) :]
+                res_samples = res_samples[: -len(block.resnets)]
+                upsample_size = (
+                    res_samples[-1].shape[2:] if forward_upsample_size else None
+                )
+                sample = self._run_block(
+                    block,
+                    sample,
+                    emb,
+                    encoder_hidden_states,
+                    kwargs,
+                    res_hidden_states_tuple=res,
+                    upsample_size=upsample_size,
+                )
+            self.cached = sample
+            self.full_steps += 1
+        else:
+            sample = self.cached
+            res_samples = res_samples[: self.shallow_res]
+            self.cached_steps += 1
+
+        for i, block in enumerate(up_blocks[split:], start=split):
+            res = res_samples[-len(block.resnets) :]
+            res_samples = res_samples[: -len(block.resnets)]
+            is_final_block = i == len(up_blocks) - 1
+            upsample_size = (
+                res_samples[-1].shape[2:]
+                if forward_upsample_size and not is_final_block
+                else None
+            )
+            sample = self._run_block(
+                block,
+                sample,
+                emb,
+                encoder_hidden_states,
+                kwargs,
+                res_hidden_states_tuple=res,
+                upsample_size=upsample_size,
+            )
+
+        if unet.conv_norm_out:
+            sample = unet.conv_norm_out(sample)
+            sample = unet.conv_act(sample)
+        sample = unet.conv_out(sample)
+
+        if not return_dict:
+            return (sample,)
+        return UNet2DConditionOutput(sample=sample)
+
+    def _run_mid(self, sample, emb, encoder_hidden_states, kwargs):
+        mid = self.unet.mid_block
+        if getattr(mid, "has_cross_attention", False):
+            return mid(
+                sample,
+                emb,
+                encoder_hidden_states=encoder_hidden_states,
+                cross_attention_kwargs=kwargs.get("cross_attention_kwargs"),
+            )
+        return mid(sample, emb)
+
+
+def parse_step_cache(value):
+    """
+    Maps the request's "step_cache" field (bool or interval) to an interval.
+    Raises ValueError for other values.
+    """
+    if value is None or value is False:
+        return None
+    if value is True:
+        return DEFAULT_INTERVAL
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("'step_cache' must be true, false or an interval") from None
+    return interval if interval > 1 else None
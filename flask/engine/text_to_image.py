@@ -0,0 +1,88 @@
+"""
+Text-to-image with the inpainting weights, for /generate.
+
+An inpainting UNet takes 9 input channels: the noisy latents, the mask and
+the latents of the masked image. Generating from nothing is inpainting with
+a full mask, whose 5 extra channels do not depend on the prompt or seed.
+They are computed once per size and appended to every UNet call of a plain
+StableDiffusionPipeline built from the loaded components (no weight copy),
+so a call skips the blank canvas preprocessing and its VAE encode.
+"""
+
+import torch
+from diffusers import StableDiffusionPipeline
+from diffusers.utils.torch_utils import randn_tensor
+
+
+def text_pipeline(pipe):
+    """StableDiffusionPipeline sharing every module of an inpainting `pipe`."""
+    return StableDiffusionPipeline(
+        vae=pipe.vae,
+        text_encoder=pipe.text_encoder,
+        tokenizer=pipe.tokenizer,
+        unet=pipe.unet,
+        # Its own instance: the constructor may rewrite the config in place
+        scheduler=pipe.scheduler.from_config(pipe.scheduler.config),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+
+
+def full_mask_conditioning(pipe, height, width):
+    """
+    (mask, masked image latents) of an inpainting run with a full mask at
+    `height` x `width`, on the CPU. The masked image is all zeros in the
+    VAE's [-1, 1] input range; its latents use the distribution's mode.
+    """
+    scale = pipe.vae_scale_factor
+    pixels = torch.zeros(1, 3, height, width)
+    with torch.no_grad():
+        latents = pipe.vae.encode(
+            pixels.to(pipe._execution_device, pipe.vae.dtype)
+        ).latent_dist.mode()
+    mask = torch.ones(1, 1, height // scale, width // scale)
+    return mask, (latents * pipe.vae.config.scaling_factor).cpu()
+
+
+def initial_noise(pipe, height, width, generator):
+    # 4-channel latents; the pipeline would size them from the UNet's 9 inputs
+    scale = pipe.vae_scale_factor
+    shape = (1, 4, height // scale, width // scale)
+    return randn_tensor(shape, generator=generator, dtype=pipe.unet.dtype)
+
+
+class InpaintConditioning:
+    """
+    Context manager that patches the inpainting UNet for one text-to-image
+    run, appending the full-mask channels to its input:
+
+        with InpaintConditioning(pipe.unet, mask, masked_image_latents):
+            image = text_pipe(..., latents=initial_noise(...)).images[0]
+
+    Nests inside StepCache (step_cache.py), whose forward it wraps.
+    """
+
+    def __init__(self, unet, mask, masked_image_latents):
+        self.unet = unet
+        self.extra = torch.cat([mask, masked_image_latents], dim=1)
+
+    def __enter__(self):
+        # accelerate's offload hooks call `_old_forward`; patch that when present
+        self._attr = "_old_forward" if hasattr(self.unet, "_old_forward") else "forward"
+        self._original = self.unet.__dict__.get(self._attr)
+        self._inner = getattr(self.unet, self._attr)
+        setattr(self.unet, self._attr, self.forward)
+        return self
+
+    def __exit__(self, *exc):
+        if self._original is None:
+            delattr(self.unet, self._attr)
+        else:
+            setattr(self.unet, self._attr, self._original)
+        return False
+
+    def forward(self, sample, *args, **kwargs):
+        extra = self.extra.to(sample.device, sample.dtype)
+        extra = extra.expand(sample.shape[0], -1, -1, -1)
+        return self._inner(torch.cat([sample, extra], dim=1), *args, **kwargs)
@@ -39,11 +39,15 @@ pkgs.mkShell {
           diffusers
           einops
           fal-client
+          fastapi
           flask
           flask-cors
           hf-xet
+          httpx
           kornia
           numpy
+          onnx
+          onnxruntime
           opencv4
           pillow
           pip
@@ -57,6 +61,7 @@ pkgs.mkShell {
           torch
           torchvision
           transformers
+          uvicorn
         ]
       ))
     ];
@@ -0,0 +1,71 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from engine.aio import AsyncInferenceEngine
+from engine.cancel import CancelToken
+from engine.scheduler import Scheduler
+
+
+def scheduled_engine(scheduler, order):
+    """Engine stand-in whose /generate waits for the scheduler like core.py."""
+
+    def generate(data):
+        token = CancelToken(deadline=data.get("deadline"))
+        with scheduler.slot("generate", token):
+            if data["name"] == "hold":
+                data["release"].wait(5)
+            order.append(data["name"])
+        return {"status": "success"}, 200
+
+    return SimpleNamespace(generate=generate)
+
+
+def test_every_request_reaches_the_scheduler():
+    scheduler, order = Scheduler(), []
+    release = threading.Event()
+    engine = AsyncInferenceEngine(scheduled_engine(scheduler, order), max_model=32)
+    # More requests than the pool used to have threads, latest deadline first
+    now = time.monotonic()
+    requests = [{"name": f"r{i}", "deadline": now + 60 - i} for i in range(16)]
+
+    async def run():
+        held = asyncio.ensure_future(
+            engine.generate({"name": "hold", "release": release})
+        )
+        tasks = [asyncio.ensure_future(engine.generate(data)) for data in requests]
+        while scheduler.stats()["queued"] < len(requests):
+            await asyncio.sleep(0.005)
+        release.set()
+        return await asyncio.gather(held, *tasks)
+
+    results = asyncio.run(run())
+    engine.model_executor.shutdown()
+    assert all(status == 200 for _, status in results)
+    assert order == ["hold"] + [f"r{i}" for i in reversed(range(16))]
+
+
+def test_requests_beyond_max_model_are_refused():
+    scheduler, order = Scheduler(), []
+    release = threading.Event()
+    engine = AsyncInferenceEngine(scheduled_engine(scheduler, order), max_model=2)
+
+    async def run():
+        tasks = [
+            asyncio.ensure_future(engine.generate({"name": "hold", "release": release}))
+        ]
+        while not scheduler.stats()["running"]:
+            await asyncio.sleep(0.005)
+        tasks.append(asyncio.ensure_future(engine.generate({"name": "queued"})))
+        while not scheduler.stats()["queued"]:
+            await asyncio.sleep(0.005)
+        refused = await engine.generate({"name": "refused"})
+        release.set()
+        return refused, await asyncio.gather(*tasks)
+
+    refused, results = asyncio.run(run())
+    engine.model_executor.shutdown()
+    assert refused[1] == 503
+    assert [status for _, status in results] == [200, 200]
+    assert order == ["hold", "queued"]
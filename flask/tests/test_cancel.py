@@ -0,0 +1,39 @@
+import pytest
+
+from engine.cancel import CancelRegistry, Cancelled
+
+
+def test_cancels_are_scoped_per_client():
+    registry = CancelRegistry()
+    alice = registry.open({"request_id": "r1", "client_id": "alice"})
+    bob = registry.open({"request_id": "r1", "client_id": "bob"})
+
+    assert registry.cancel("alice", "r1") is True
+    with pytest.raises(Cancelled):
+        alice.check()
+    bob.check()
+
+
+def test_cancel_of_another_clients_request_is_rejected():
+    registry = CancelRegistry()
+    token = registry.open({"request_id": "r1", "client_id": "alice"})
+    with pytest.raises(PermissionError):
+        registry.cancel("mallory", "r1")
+    token.check()
+    # Nor does it pre-cancel a later request of the same id
+    registry.close(token)
+    assert registry.open({"request_id": "r1", "client_id": "alice"}).reason is None
+
+
+def test_early_cancel_applies_to_the_same_client_only():
+    registry = CancelRegistry()
+    assert registry.cancel("alice", "r1") is False
+    assert registry.open({"request_id": "r1", "client_id": "bob"}).reason is None
+    token = registry.open({"request_id": "r1", "client_id": "alice"})
+    assert token.reason == "cancelled"
+
+
+@pytest.mark.parametrize("deadline", [float("nan"), float("inf"), "soon"])
+def test_invalid_deadline_is_rejected(deadline):
+    with pytest.raises(ValueError):
+        CancelRegistry().open({"request_id": "r1", "deadline": deadline})
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from engine.canvas import CanvasError, apply_tiles, draw_strokes, parse_color
+from engine.images import encode_image_to_base64
+
+
+def test_apply_tiles_pastes_and_marks_changes():
+    base = Image.new("RGB", (64, 64), "white")
+    tile = encode_image_to_base64(Image.new("RGB", (8, 8), "red"))
+    drawn, changed = apply_tiles(base, [{"x": 16, "y": 24, "image": tile}], (32, 32))
+
+    assert drawn.size == (32, 32)
+    assert drawn.getpixel((10, 14)) == (255, 0, 0)
+    expected = np.zeros((32, 32), bool)
+    expected[12:16, 8:12] = True
+    assert np.array_equal(changed, expected)
+
+
+def test_unchanged_tile_marks_nothing():
+    base = Image.new("RGB", (64, 64), "white")
+    tile = encode_image_to_base64(Image.new("RGB", (8, 8), "white"))
+    _, changed = apply_tiles(base, [{"x": 0, "y": 0, "image": tile}], (64, 64))
+    assert not changed.any()
+
+
+def test_tile_outside_the_canvas_is_rejected():
+    base = Image.new("RGB", (64, 64), "white")
+    tile = encode_image_to_base64(Image.new("RGB", (8, 8), "red"))
+    with pytest.raises(CanvasError):
+        apply_tiles(base, [{"x": 60, "y": 0, "image": tile}], (64, 64))
+
+
+def test_strokes_are_scaled_to_the_working_canvas():
+    clean = Image.new("RGB", (50, 50), "white")
+    stroke = {"points": [[20, 50], [80, 50]], "width": 10, "color": "#0000ff"}
+    drawn, changed = draw_strokes(clean, [stroke], (0.5, 0.5))
+
+    assert drawn.getpixel((25, 25)) == (0, 0, 255)
+    assert changed[25, 10:41].all()
+    assert not changed[:15].any() and not changed[36:].any()
+
+
+def test_invalid_color():
+    assert parse_color([1, 2, 3, 4]) == (1, 2, 3)
+    with pytest.raises(CanvasError):
+        parse_color("not-a-color")
@@ -0,0 +1,65 @@
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import pytest
+import torch
+from diffusers import PNDMScheduler
+from PIL import Image
+
+from engine import diffusion
+from engine.cancel import CancelToken, Cancelled
+from engine.diffusion import TieredPipeline
+
+
+class StubPipe:
+    """Pipeline stand-in counting freed offload hooks; runs one step."""
+
+    def __init__(self, cancel_during_run=None):
+        self.scheduler = PNDMScheduler()
+        self.unet = None
+        self.cancel_during_run = cancel_during_run
+        self.freed = 0
+
+    def maybe_free_model_hooks(self):
+        self.freed += 1
+
+    def __call__(self, callback_on_step_end=None, **kwargs):
+        if self.cancel_during_run:
+            self.cancel_during_run.cancel("disconnect")
+        if callback_on_step_end:
+            callback_on_step_end(self, 0, 0, {"latents": kwargs["latents"]})
+        return SimpleNamespace(images=[Image.new("RGB", (8, 8))])
+
+
+@pytest.fixture
+def tiered(monkeypatch):
+    def make(cancel_during_run=None):
+        text_pipe = StubPipe(cancel_during_run)
+        monkeypatch.setattr(diffusion, "text_pipeline", lambda pipe: text_pipe)
+        monkeypatch.setattr(
+            diffusion, "full_mask_conditioning", lambda pipe, h, w: (None, None)
+        )
+        monkeypatch.setattr(
+            diffusion, "InpaintConditioning", lambda unet, mask, masked: nullcontext()
+        )
+        monkeypatch.setattr(
+            diffusion, "initial_noise", lambda pipe, h, w, g: torch.zeros(1, 4, 1, 1)
+        )
+        return TieredPipeline(StubPipe())
+
+    return make
+
+
+def test_text_run_frees_the_offload_hooks(tiered):
+    pipeline = tiered()
+    images, info = pipeline("generate", prompt="a cat", seed=1)
+    assert len(images) == 1 and info["seed"] == 1
+    assert pipeline.pipe.freed == 1
+
+
+def test_cancelled_text_run_frees_the_offload_hooks(tiered):
+    cancel = CancelToken("r1")
+    pipeline = tiered(cancel_during_run=cancel)
+    with pytest.raises(Cancelled):
+        pipeline("generate", prompt="a cat", cancel=cancel)
+    assert pipeline.pipe.freed == 1
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+from PIL import Image, ImageDraw
+
+from engine import core
+from engine.core import InferenceEngine
+from engine.images import encode_image_to_base64
+
+
+def tiered(endpoint, quality, **kwargs):
+    # Stand-in TieredPipeline: returns the drawn canvas
+    return [kwargs["image"]], {"quality": quality}
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    encoded = []
+
+    def encode_image(model, processor, image, device):
+        encoded.append(image.size)
+        return torch.zeros(1, 4, 8)
+
+    monkeypatch.setattr(core, "encode_image", encode_image)
+
+    def decode_tasks(model, processor, features, tasks, device, **kwargs):
+        return ["a cat"] * len(tasks)
+
+    monkeypatch.setattr(core, "decode_tasks", decode_tasks)
+    monkeypatch.setattr(
+        core, "caption", lambda model, processor, features, device, **kw: "a cat"
+    )
+    monkeypatch.setattr(
+        core, "postprocess_answer", lambda processor, text, task, image: text
+    )
+    processor = SimpleNamespace(
+        image_processor=SimpleNamespace(size={"height": 768, "width": 768})
+    )
+    runtime = SimpleNamespace(
+        florence_ready=True,
+        florence_model=None,
+        florence_processor=processor,
+        device="cpu",
+        sd_tiered=tiered,
+        versions={"sd": 1, "birefnet": 1, "florence": 1},
+    )
+    engine = InferenceEngine(runtime)
+    engine.encoded = encoded
+    return engine
+
+
+def test_inpainting_reuses_the_features_of_a_described_canvas(engine):
+    clean = Image.new("RGB", (1024, 768), "white")
+    drawn = clean.copy()
+    ImageDraw.Draw(drawn).rectangle((300, 200, 500, 400), fill="red")
+    drawn_b64 = encode_image_to_base64(drawn)
+
+    response, status = engine.describe({"image": drawn_b64, "prompt": "<CAPTION>"})
+    assert status == 200, response
+    response, status = engine.inpaint(
+        {"image": encode_image_to_base64(clean), "mask_image": drawn_b64}
+    )
+    assert status == 200, response
+
+    assert engine.encoded == [(1024, 768)]
+    stats = engine.florence_features.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
@@ -0,0 +1,76 @@
+import os
+import json
+from types import SimpleNamespace
+
+from engine.core import InferenceEngine
+from engine.generation_cache import GenerationCache, generation_key, weights_id
+
+
+def response(n, size=100):
+    return {"status": "success", "image": str(n) * size}
+
+
+def nbytes(n, size=100):
+    return len(json.dumps(response(n, size)))
+
+
+def test_generation_key_depends_on_every_parameter():
+    key = generation_key(prompt="a river", seed=1, steps=8)
+    assert key == generation_key(steps=8, seed=1, prompt="a river")
+    assert key != generation_key(prompt="a river", seed=2, steps=8)
+    assert key != generation_key(prompt="a river", seed=1, steps=30)
+
+
+def test_weights_id_changes_with_the_files(tmp_path):
+    (tmp_path / "unet").mkdir()
+    weights = tmp_path / "unet" / "model.safetensors"
+    weights.write_bytes(b"v1")
+    first = weights_id(str(tmp_path))
+    assert first == weights_id(str(tmp_path))
+    weights.write_bytes(b"v2!")
+    assert weights_id(str(tmp_path)) != first
+    # Hub ids are used as they are
+    assert weights_id("org/model") == "org/model"
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = GenerationCache(max_memory_bytes=2 * nbytes(1))
+    cache.put("a", response(1))
+    cache.put("b", response(2))
+    assert cache.get("a") == response(1)
+    cache.put("c", response(3))
+    assert cache.get("b") is None
+    assert cache.get("a") == response(1) and cache.get("c") == response(3)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["memory_entries"]) == (3, 1, 2)
+
+
+def test_disk_tier_survives_restarts_and_is_bounded(tmp_path):
+    cache = GenerationCache(
+        max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=2 * nbytes(1)
+    )
+    cache.put("a", response(1))
+    cache.put("b", response(2))
+    assert cache.get("a") == response(1)
+    # The hit refreshed "a", so "b" is evicted
+    cache.put("c", response(3))
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
+
+    restarted = GenerationCache(disk_dir=str(tmp_path))
+    assert restarted.get("c") == response(3)
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_malformed_seed_is_rejected_before_scheduling():
+    def tiered(*args, **kwargs):
+        raise AssertionError("invalid requests must not run")
+
+    runtime = SimpleNamespace(
+        sd_tiered=tiered, sd_weights="sd", device="cpu", versions={"sd": 1}
+    )
+    engine = InferenceEngine(runtime)
+    for handler in (engine.generate, engine.inpaint):
+        response, status = handler({"prompt": "a cat", "seed": "lucky"})
+        assert status == 400
+        assert "seed" in response["error"]
+    assert engine.scheduler.stats()["completed"] == 0
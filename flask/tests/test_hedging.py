@@ -0,0 +1,110 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from engine import remote
+from engine.hedging import Hedger
+
+PRIMARY = ("fal-ai/nano-banana", {"prompt": "a boat"})
+ALTERNATE = ("fal-ai/flux/dev", {"prompt": "a boat"})
+
+
+class Provider:
+    """Stand-in fal.ai queue: each model answers after its latency."""
+
+    def __init__(self, latencies):
+        self.latencies = latencies
+        self.started, self.cancelled = [], []
+
+    def install(self, monkeypatch):
+        provider = self
+
+        class Handle:
+            def __init__(self, model_id):
+                self.model_id = model_id
+                self.stopped = threading.Event()
+
+            def get(self):
+                if self.stopped.wait(provider.latencies[self.model_id]):
+                    raise RuntimeError("cancelled")
+                return {"model": self.model_id}
+
+            async def get_async(self):
+                await asyncio.sleep(provider.latencies[self.model_id])
+                return {"model": self.model_id}
+
+        def start(model_id, arguments):
+            provider.started.append(model_id)
+            return Handle(model_id)
+
+        def cancel(handle):
+            provider.cancelled.append(handle.model_id)
+            handle.stopped.set()
+
+        async def start_async(model_id, arguments):
+            handle = start(model_id, arguments)
+            handle.get = handle.get_async
+            return handle
+
+        async def cancel_async(handle):
+            provider.cancelled.append(handle.model_id)
+
+        def submit(model_id, arguments):
+            return start(model_id, arguments).get()
+
+        monkeypatch.setattr(remote, "start", start)
+        monkeypatch.setattr(remote, "cancel", cancel)
+        monkeypatch.setattr(remote, "start_async", start_async)
+        monkeypatch.setattr(remote, "cancel_async", cancel_async)
+        monkeypatch.setattr(remote, "submit", submit)
+        return self
+
+
+def warm_hedger(p90=0.05, **kwargs):
+    # Primary model latencies with a p90 of `p90` seconds
+    hedger = Hedger(enabled=True, min_samples=10, **kwargs)
+    for _ in range(10):
+        hedger.record(PRIMARY[0], p90)
+    return hedger
+
+
+def test_slow_primary_is_hedged_and_cancelled(monkeypatch):
+    provider = Provider({PRIMARY[0]: 2.0, ALTERNATE[0]: 0.01}).install(monkeypatch)
+    hedger = warm_hedger()
+
+    start = time.monotonic()
+    result = hedger.submit(PRIMARY, ALTERNATE)
+    assert result == {"model": ALTERNATE[0]}
+    assert time.monotonic() - start < 1.0
+    assert provider.started == [PRIMARY[0], ALTERNATE[0]]
+    assert provider.cancelled == [PRIMARY[0]]
+    stats = hedger.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+    assert stats["extra_cost_usd"] == remote.MODEL_COSTS[ALTERNATE[0]]
+
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    provider = Provider({PRIMARY[0]: 0.01, ALTERNATE[0]: 0.01}).install(monkeypatch)
+    hedger = warm_hedger(p90=0.5)
+    assert hedger.submit(PRIMARY, ALTERNATE) == {"model": PRIMARY[0]}
+    assert provider.started == [PRIMARY[0]]
+    assert hedger.stats()["hedged"] == 0
+
+
+@pytest.mark.parametrize("hedger", [Hedger(enabled=False), Hedger(enabled=True)])
+def test_no_hedging_when_disabled_or_cold(monkeypatch, hedger):
+    provider = Provider({PRIMARY[0]: 0.01, ALTERNATE[0]: 0.01}).install(monkeypatch)
+    assert hedger.submit(PRIMARY, ALTERNATE) == {"model": PRIMARY[0]}
+    assert provider.started == [PRIMARY[0]]
+    assert hedger.delay(PRIMARY[0]) is None
+
+
+def test_async_hedge(monkeypatch):
+    provider = Provider({PRIMARY[0]: 2.0, ALTERNATE[0]: 0.01}).install(monkeypatch)
+    hedger = warm_hedger()
+    result = asyncio.run(hedger.submit_async(PRIMARY, ALTERNATE))
+    assert result == {"model": ALTERNATE[0]}
+    assert provider.cancelled == [PRIMARY[0]]
+    assert hedger.stats()["hedge_wins"] == 1
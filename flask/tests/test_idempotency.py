@@ -0,0 +1,57 @@
+import time
+import threading
+
+from engine.idempotency import IdempotencyStore
+
+
+def test_retry_reruns_after_the_first_run_is_cancelled():
+    store = IdempotencyStore()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def handler(data):
+        calls.append(data["request_id"])
+        if data["request_id"] == "first":
+            started.set()
+            release.wait(5)
+            # What cancellable() returns once the client disconnected
+            return {"status": "cancelled", "reason": "disconnect"}, 499
+        return {"status": "success", "image": "..."}, 200
+
+    results = {}
+
+    def send(request_id):
+        data = {"idempotency_key": "k", "prompt": "p", "request_id": request_id}
+        results[request_id] = store.run("generate", data, handler)
+
+    first = threading.Thread(target=send, args=("first",))
+    first.start()
+    started.wait(5)
+    retry = threading.Thread(target=send, args=("retry",))
+    retry.start()
+    while store.stats()["attached"] == 0:
+        time.sleep(0.01)
+    release.set()
+    first.join(5)
+    retry.join(5)
+
+    assert results["first"][1] == 499
+    assert results["retry"] == ({"status": "success", "image": "..."}, 200)
+    assert calls == ["first", "retry"]
+    assert store.stats()["reruns"] == 1
+
+
+def test_keys_are_scoped_per_client():
+    store = IdempotencyStore()
+
+    def handler(data):
+        return {"status": "success", "image": data["client_id"]}, 200
+
+    alice = {"idempotency_key": "k", "prompt": "p", "client_id": "alice"}
+    mallory = {"idempotency_key": "k", "prompt": "p", "client_id": "mallory"}
+    assert store.run("generate", alice, handler)[0]["image"] == "alice"
+    response, status = store.run("generate", mallory, handler)
+    assert status == 200
+    assert response == {"status": "success", "image": "mallory"}
+    # The same client still gets its stored response back
+    assert store.run("generate", alice, handler)[0]["replayed"] is True
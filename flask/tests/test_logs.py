@@ -0,0 +1,84 @@
+import json
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from engine.logs import JsonFormatter, log, request_context, stage
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(JsonFormatter().format(record)))
+
+    def events(self, name):
+        return [r for r in self.records if r["event"] == name]
+
+
+@pytest.fixture
+def records():
+    handler = Records()
+    logger = log.logger
+    saved = logger.handlers, logger.level, logger.propagate, log.sample_rate
+    logger.handlers, logger.propagate = [handler], False
+    logger.setLevel(logging.DEBUG)
+    yield handler
+    logger.handlers, logger.level, logger.propagate, log.sample_rate = saved
+
+
+def test_records_carry_the_request_id(records):
+    with request_context("inpaint", {"request_id": "r1", "client_id": "c"}) as request:
+        log.info("inpaint.start", prompt="a river")
+        # Threads see the request when run in a copy of its context
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(context.run, log.warning, "inpaint.slow").result()
+        request.status = 200
+    log.info("outside")
+
+    assert records.events("inpaint.start")[0]["request_id"] == "r1"
+    assert records.events("inpaint.start")[0]["prompt"] == "a river"
+    assert records.events("inpaint.slow")[0]["request_id"] == "r1"
+    assert "request_id" not in records.events("outside")[0]
+    summary = records.events("request")[0]
+    assert summary["endpoint"] == "inpaint"
+    assert (summary["status"], summary["client"]) == (200, "c")
+
+
+def test_stages_are_summed_into_the_summary(records):
+    with request_context("generate") as request:
+        for _ in range(2):
+            with stage("diffusion"):
+                pass
+        with stage("encode"):
+            pass
+    summary = records.events("request")[0]
+    assert set(summary["stages"]) == {"diffusion", "encode"}
+    assert summary["request_id"] == request.request_id
+    # Stages outside a request are ignored
+    with stage("diffusion"):
+        pass
+
+
+def test_debug_events_are_sampled(records):
+    log.sample_rate = 0.0
+    log.debug("dropped")
+    log.sample_rate = 1.0
+    log.debug("kept", n=1)
+    assert not records.events("dropped")
+    assert records.events("kept")[0]["n"] == 1
+
+
+def test_exceptions_are_formatted(records):
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        log.exception("generate.failed")
+    record = records.events("generate.failed")[0]
+    assert record["level"] == "error"
+    assert "RuntimeError: boom" in record["exception"]
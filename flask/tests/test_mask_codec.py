@@ -0,0 +1,78 @@
+import base64
+
+import numpy as np
+from PIL import Image
+
+from engine.mask_codec import encode_mask_response, rle_counts
+
+
+def rle_string_to_counts(s):
+    # Port of pycocotools' rleFrString, the inverse of rle_counts_to_string
+    counts, p = [], 0
+    while p < len(s):
+        x, k, more = 0, 0, True
+        while more:
+            c = ord(s[p]) - 48
+            x |= (c & 0x1F) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+def rle_decode(counts, h, w):
+    flat = np.zeros(h * w, dtype=bool)
+    pos = 0
+    for i, run in enumerate(counts):
+        flat[pos : pos + run] = i % 2 == 1
+        pos += run
+    return flat.reshape((h, w), order="F")
+
+
+def sample_mask(h=37, w=53, seed=0):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((h, w), dtype=bool)
+    mask[5:30, 10:40] = rng.random((25, 30)) > 0.3
+    return mask
+
+
+def test_rle_round_trip():
+    for mask in (sample_mask(), np.ones((4, 6), bool), np.zeros((3, 3), bool)):
+        h, w = mask.shape
+        response = encode_mask_response(mask, "rle")
+        assert response["rle"]["size"] == [h, w]
+        counts = rle_string_to_counts(response["rle"]["counts"])
+        assert counts == rle_counts(mask)
+        assert np.array_equal(rle_decode(counts, h, w), mask)
+
+
+def test_rle_starts_with_a_zero_run():
+    mask = np.array([[1, 0], [1, 1]], dtype=bool)
+    # Column-major: 1, 1, 0, 1
+    assert rle_counts(mask) == [0, 2, 1, 1]
+
+
+def test_bitmap_round_trip():
+    mask = sample_mask()
+    response = encode_mask_response(
+        Image.fromarray(mask.astype(np.uint8) * 255), "bitmap"
+    )
+    x1, y1, x2, y2 = response["bbox"]
+    assert response["size"] == [mask.shape[1], mask.shape[0]]
+    packed = np.frombuffer(base64.b64decode(response["bitmap"]), np.uint8)
+    packed = packed.reshape(response["height"], response["stride"])
+    bits = np.unpackbits(packed, axis=1, bitorder="big")[:, : response["width"]]
+    assert np.array_equal(bits.astype(bool), mask[y1:y2, x1:x2])
+    assert not mask[:y1].any() and not mask[y2:].any()
+    assert not mask[:, :x1].any() and not mask[:, x2:].any()
+
+
+def test_empty_mask_has_no_bbox():
+    response = encode_mask_response(np.zeros((8, 8), bool), "alpha")
+    assert response["bbox"] is None
+    assert response["alpha"] == ""
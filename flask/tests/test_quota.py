@@ -0,0 +1,20 @@
+import pytest
+
+from engine.quota import Quota, parse_clients
+
+DEFAULT = Quota(None, 500.0, 1.0)
+
+
+def test_parse_clients():
+    quotas = parse_clients("a=10:1000:2,b=1:100,c=::4", DEFAULT)
+    assert quotas == {
+        "a": Quota(10.0, 1000.0, 2.0),
+        "b": Quota(1.0, 100.0, 1.0),
+        "c": Quota(None, 500.0, 4.0),
+    }
+
+
+@pytest.mark.parametrize("weight", ["0", "-1"])
+def test_non_positive_weight_is_rejected(weight):
+    with pytest.raises(ValueError, match="must be > 0"):
+        parse_clients(f"a=1:10:{weight}", DEFAULT)
@@ -0,0 +1,32 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from engine.region import composite_region, region_delta
+
+
+def test_region_composites_back_onto_the_canvas():
+    canvas = Image.new("RGB", (128, 128), (200, 200, 200))
+    # Working-size result: the canvas with a red square in the masked area
+    result = Image.new("RGB", (64, 64), (200, 200, 200))
+    ImageDraw.Draw(result).rectangle((20, 20, 35, 35), fill=(255, 0, 0))
+    mask = Image.new("L", (64, 64), 0)
+    ImageDraw.Draw(mask).rectangle((20, 20, 35, 35), fill=255)
+
+    response = region_delta(result, mask, canvas.size)
+    x0, y0, x1, y1 = response["bbox"]
+    # The feathered edge is padded, in canvas pixels
+    assert x0 < 40 and y0 < 40 and x1 > 72 and y1 > 72
+
+    composited = np.array(composite_region(canvas, response)).astype(int)
+    assert tuple(composited[56, 56]) == (255, 0, 0)
+    # Outside the region the canvas is untouched
+    assert (composited[:y0] == 200).all()
+    assert (composited[y1:] == 200).all()
+    assert (composited[:, x1:] == 200).all()
+
+
+def test_empty_mask_returns_no_region():
+    canvas = Image.new("RGB", (32, 32), "white")
+    response = region_delta(canvas, Image.new("L", (32, 32), 0), canvas.size)
+    assert response["bbox"] is None
+    assert composite_region(canvas, response) is canvas
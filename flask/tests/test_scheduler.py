@@ -0,0 +1,83 @@
+import time
+import threading
+
+import pytest
+
+from engine.cancel import CancelToken, Cancelled
+from engine.scheduler import Scheduler
+
+
+def run_in_order(scheduler, requests):
+    """
+    Queues `requests` ([(name, token, slot kwargs)]) one after another behind
+    a running request, then releases it. Returns the order they ran in.
+    """
+    order, release = [], threading.Event()
+    holding = threading.Event()
+
+    def hold():
+        with scheduler.slot("svc", CancelToken()):
+            holding.set()
+            release.wait(5)
+
+    def run(name, token, kwargs):
+        with scheduler.slot("svc", token, **kwargs):
+            order.append(name)
+
+    threads = [threading.Thread(target=hold)]
+    threads[0].start()
+    holding.wait(5)
+    for i, (name, token, kwargs) in enumerate(requests, 1):
+        thread = threading.Thread(target=run, args=(name, token, kwargs))
+        thread.start()
+        threads.append(thread)
+        while scheduler.stats()["queued"] < i:
+            time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def due_in(seconds):
+    return CancelToken(deadline=time.monotonic() + seconds)
+
+
+def test_earliest_deadline_runs_first():
+    scheduler = Scheduler()
+    order = run_in_order(
+        scheduler,
+        [
+            ("late", due_in(60), {}),
+            ("none", CancelToken(), {}),
+            ("soon", due_in(10), {}),
+            ("sooner", due_in(5), {}),
+        ],
+    )
+    # Requests without a deadline are due DEFAULT_SLACK (30s) after arrival
+    assert order == ["sooner", "soon", "none", "late"]
+    assert scheduler.stats()["completed"] == 5
+
+
+def test_hopeless_deadline_is_dropped_on_arrival():
+    scheduler = Scheduler()
+    scheduler.estimates["svc"] = 5.0
+    with pytest.raises(Cancelled) as raised:
+        with scheduler.slot("svc", due_in(1)):
+            pass
+    assert raised.value.reason == "deadline"
+    assert scheduler.stats()["dropped"] == 1
+
+
+def test_clients_share_the_queue_fairly():
+    scheduler = Scheduler()
+    scheduler.estimates["svc"] = 1.0
+    requests = [(f"a{i}", CancelToken(), {"client": "a"}) for i in range(3)]
+    requests.append(("b0", CancelToken(), {"client": "b"}))
+    # A weight of 4 spaces a client's requests a quarter as far apart
+    requests += [
+        (f"c{i}", CancelToken(), {"client": "c", "weight": 4.0}) for i in range(3)
+    ]
+    order = run_in_order(scheduler, requests)
+    # "a" queued its batch first, but only delays its own later requests
+    assert order == ["a0", "b0", "c0", "c1", "c2", "a1", "a2"]
@@ -0,0 +1,54 @@
+import numpy as np
+from types import SimpleNamespace
+from PIL import Image
+
+from engine.core import InferenceEngine
+from engine.images import encode_image_to_base64
+from engine.segmentation import resolve_mode
+
+
+class StubBackend:
+    """Backend with graphs for `sizes` only, like an OnnxBiRefNet export."""
+
+    name = "onnx"
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.calls = []
+
+    def predict(self, batch, size):
+        if size not in self.sizes:
+            raise ValueError(f"No ONNX graph exported for {size}px input")
+        self.calls.append(size)
+        return np.ones((batch.shape[0], size, size), np.float32)
+
+
+def engine_with(backend):
+    runtime = SimpleNamespace(birefnet=backend, versions={"birefnet": 0})
+    return InferenceEngine(runtime)
+
+
+def asset(engine, mode):
+    image = encode_image_to_base64(Image.new("RGB", (64, 48), "white"))
+    return engine.asset({"image": image, "mode": mode, "format": "rle"})
+
+
+def test_resolve_mode():
+    assert resolve_mode(StubBackend([512, 1024]), "fast") == "fast"
+    assert resolve_mode(StubBackend([1024]), "fast") == "standard"
+    assert resolve_mode(StubBackend([512]), "standard") is None
+    # The torch backend runs any size
+    assert resolve_mode(object(), "fast") == "fast"
+
+
+def test_fast_mode_falls_back_to_standard():
+    backend = StubBackend([1024])
+    response, status = asset(engine_with(backend), "fast")
+    assert status == 200, response
+    assert backend.calls == [1024]
+
+
+def test_missing_graph_is_a_client_error():
+    response, status = asset(engine_with(StubBackend([512])), "standard")
+    assert status == 400
+    assert "1024px" in response["error"]
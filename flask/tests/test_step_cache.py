@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import pytest
+
+from engine.core import InferenceEngine
+from engine.step_cache import DEFAULT_INTERVAL, parse_step_cache
+
+
+def test_parse_step_cache():
+    assert parse_step_cache(None) is None
+    assert parse_step_cache(False) is None
+    assert parse_step_cache(True) == DEFAULT_INTERVAL
+    assert parse_step_cache(4) == 4
+    assert parse_step_cache("2") == 2
+    assert parse_step_cache(1) is None
+    for value in ("often", [3], {"interval": 3}):
+        with pytest.raises(ValueError):
+            parse_step_cache(value)
+
+
+def test_invalid_step_cache_is_a_client_error():
+    def tiered(*args, **kwargs):
+        raise AssertionError("invalid requests must not run")
+
+    runtime = SimpleNamespace(
+        sd_tiered=tiered, sd_weights="sd", device="cpu", versions={"sd": 1}
+    )
+    engine = InferenceEngine(runtime)
+    for handler in (engine.generate, engine.inpaint):
+        response, status = handler(
+            {"prompt": "a cat", "image": "x", "mask_image": "y", "step_cache": "often"}
+        )
+        assert status == 400
+        assert "step_cache" in response["error"]
@@ -0,0 +1,43 @@
+import numpy as np
+import torch
+from PIL import Image
+
+from engine.segmentation import TorchBiRefNet, _tile_starts, predict_tiled
+
+
+class FirstChannel(torch.nn.Module):
+    """Stand-in BiRefNet whose logits are the normalized red channel."""
+
+    def __init__(self):
+        super().__init__()
+        self.unused = torch.nn.Parameter(torch.zeros(1))
+
+    def forward(self, x):
+        return [x[:, :1]]
+
+
+def tiled(image, **kwargs):
+    return predict_tiled(TorchBiRefNet(FirstChannel(), "cpu"), image, **kwargs)
+
+
+def test_tile_starts_cover_the_image():
+    for length in (100, 256, 257, 600, 1000):
+        starts = _tile_starts(length, 256, 64)
+        assert starts[0] == 0
+        assert starts[-1] == max(length - 256, 0)
+        # Consecutive tiles overlap by at least the overlap
+        assert all(b - a <= 256 - 64 for a, b in zip(starts, starts[1:]))
+
+
+def test_tiled_prediction_has_no_seams():
+    # A horizontal and vertical gradient, so every seam would show
+    x = np.linspace(0, 255, 600)
+    y = np.linspace(0, 255, 400)[:, None]
+    red = ((x + y) / 2).astype(np.uint8)
+    pixels = np.stack([red, np.zeros_like(red), np.zeros_like(red)], axis=-1)
+    image = Image.fromarray(pixels)
+
+    prob = tiled(image, tile=256, overlap=64)
+    expected = 1 / (1 + np.exp(-(red / 255.0 - 0.485) / 0.229))
+    assert prob.shape == (400, 600)
+    assert np.abs(prob - expected).max() < 1e-4
@@ -88,30 +88,107 @@ if "birefnet" not in globals():
 birefnet = birefnet.to(device).eval()
 
 
-def run_birefnet_on_image(pil_img: Image.Image, thresh: float = 0.5):
+# Resolution policies:
+#   fast     - 512px single pass (previews, thumbnails)
+#   standard - 1024px single pass
+#   tiled    - overlapping native-resolution 1024px tiles, blended at the seams
+MODE_SIZES = {"fast": 512, "standard": 1024, "tiled": 1024}
+TILE_OVERLAP = 192
+
+
+def birefnet_probability(pil_img: Image.Image, size: int = 1024):
+    """Single BiRefNet pass at `size` x `size`, returned at model resolution."""
+    tf = transforms.Compose(
+        [
+            transforms.Resize((size, size)),
+            transforms.ToTensor(),
+            transforms.Normalize(
+                mean=[0.485, 0.456, 0.406],
+                std=[0.229, 0.224, 0.225],
+            ),
+        ]
+    )
+    inp = tf(pil_img).unsqueeze(0).to(device)
+    try:
+        inp = inp.half()
+    except Exception:
+        pass
+
+    with torch.no_grad():
+        preds = birefnet(inp)[-1]
+        preds = preds.float().sigmoid().cpu()
+
+    return preds[0, 0].numpy().astype(np.float32)
+
+
+def tile_starts(length: int, tile: int, overlap: int):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, tile - overlap))
+    starts.append(length - tile)
+    return starts
+
+
+def blend_ramp(length: int, overlap: int, fade_start: bool, fade_end: bool):
+    weight = np.ones(length, dtype=np.float32)
+    fade = min(overlap, length)
+    ramp = np.linspace(1.0 / (fade + 1), 1.0, fade, dtype=np.float32)
+    if fade_start:
+        weight[:fade] = ramp
+    if fade_end:
+        weight[-fade:] = np.minimum(weight[-fade:], ramp[::-1])
+    return weight
+
+
+def birefnet_tiled(pil_img: Image.Image, tile: int = 1024, overlap: int = TILE_OVERLAP):
+    """
+    Runs BiRefNet on overlapping native-resolution tiles and blends the seams
+    with linear ramps. Returns the probability map at the original size.
+    """
+    w, h = pil_img.size
+    accum = np.zeros((h, w), dtype=np.float32)
+    weights = np.zeros((h, w), dtype=np.float32)
+
+    for y1 in tile_starts(h, tile, overlap):
+        for x1 in tile_starts(w, tile, overlap):
+            x2, y2 = min(x1 + tile, w), min(y1 + tile, h)
+            prob = birefnet_probability(pil_img.crop((x1, y1, x2, y2)), tile)
+            prob = cv2.resize(prob, (x2 - x1, y2 - y1), interpolation=cv2.INTER_LINEAR)
+            weight = np.outer(
+                blend_ramp(y2 - y1, overlap, y1 > 0, y2 < h),
+                blend_ramp(x2 - x1, overlap, x1 > 0, x2 < w),
+            )
+            accum[y1:y2, x1:x2] += prob * weight
+            weights[y1:y2, x1:x2] += weight
+
+    return accum / np.maximum(weights, 1e-6)
+
+
+def run_birefnet_on_image(
+    pil_img: Image.Image, thresh: float = 0.5, mode: str = "standard"
+):
     """
     Runs BiRefNet on a single PIL image.
+    mode: "fast" (512px), "standard" (1024px) or "tiled" (large images)
     Returns:
       mask_bin      : (H, W) uint8 (0 or 1) -- final model output mask
       prob_resized  : (H, W) float32 [0,1]  -- probability map (not saved by default)
       infer_time    : float seconds
     """
+    if mode not in MODE_SIZES:
+        raise ValueError(f"Unknown mode: {mode}")
     orig_w, orig_h = pil_img.size
 
-    inp = transform_image(pil_img).unsqueeze(0).to(device)
-    try:
-        inp = inp.half()
-    except Exception:
-        pass
-
-    with torch.no_grad():
-        t0 = time.perf_counter()
-        preds = birefnet(inp)[-1]
-        preds = preds.float().sigmoid().cpu()
-        t1 = time.perf_counter()
+    t0 = time.perf_counter()
+    if mode == "tiled" and max(orig_w, orig_h) > MODE_SIZES["tiled"]:
+        prob_resized = birefnet_tiled(pil_img)
+    else:
+        prob = birefnet_probability(pil_img, MODE_SIZES[mode])
+        prob_resized = cv2.resize(
+            prob, (orig_w, orig_h), interpolation=cv2.INTER_LINEAR
+        )
+    t1 = time.perf_counter()
 
-    prob = preds[0, 0].numpy().astype(np.float32)
-    prob_resized = cv2.resize(prob, (orig_w, orig_h), interpolation=cv2.INTER_LINEAR)
     mask_bin = (prob_resized >= thresh).astype(np.uint8)
 
     return mask_bin, prob_resized, (t1 - t0)
@@ -137,6 +214,7 @@ uploaded = files.upload()
 
 THRESH = 0.5
 KEEP_LARGEST = True
+MODE = "standard"
 
 for fname, file_data in uploaded.items():
     try:
@@ -144,7 +222,9 @@ for fname, file_data in uploaded.items():
         pil_img = Image.open(io.BytesIO(file_data)).convert("RGB")
         img_np = np.array(pil_img)
 
-        mask_bin, prob_map, t_inf = run_birefnet_on_image(pil_img, thresh=THRESH)
+        mask_bin, prob_map, t_inf = run_birefnet_on_image(
+            pil_img, thresh=THRESH, mode=MODE
+        )
         print(f"BiRefNet inference time: {t_inf:.3f} s")
 
         if KEEP_LARGEST: